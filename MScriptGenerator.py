@@ -1,5 +1,16 @@
 import argparse
-from converter import TFLToMConverter
+import os
+import sys
+
+# dataclass(slots=True) in the flow model needs Python 3.10 or newer
+if sys.version_info < (3, 10):
+    sys.exit("MScriptGenerator requires Python 3.10 or newer")
+
+from batch import ConversionOptions, collect_inputs, convert_file, run_batch  # noqa: E402
+from cache import DEFAULT_CACHE_DIR  # noqa: E402
+from executor import DEFAULT_CHUNK_ROWS, execute_file  # noqa: E402
+from validation import check_files  # noqa: E402
+from watch import POLL_INTERVAL_SECONDS, batch_jobs, single_job, watch  # noqa: E402
 
 def main():
     parser = argparse.ArgumentParser(
@@ -7,12 +18,13 @@ def main():
     )
     parser.add_argument(
         'input_file',
-        help='Path to Tableau Prep JSON/TFL file (required)'
+        nargs='+',
+        help='Path to Tableau Prep JSON/TFL file (required); with --batch, directories or glob patterns'
     )
     parser.add_argument(
         '-o', '--output',
-        help='Output file path (default: output.pq)',
-        default='output.pq'
+        help='Output file path, or - for stdout (default: output.pq); with --batch, output directory (default: converted)',
+        default=None
     )
     parser.add_argument(
         '--excel',
@@ -24,21 +36,199 @@ def main():
         help='Enable debug output',
         action='store_true'
     )
-    
+    parser.add_argument(
+        '--batch',
+        help='Convert every .tfl/.json/flow file found in the given directories or globs, one .pq per flow',
+        action='store_true'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help='Worker processes for --batch (default: number of CPUs)',
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        '--summary',
+        help='Path for the --batch JSON summary (default: <output dir>/summary.json)',
+        default=None
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help=f'Directory for cached M fragments (default: {DEFAULT_CACHE_DIR})',
+        default=DEFAULT_CACHE_DIR
+    )
+    parser.add_argument(
+        '--no-cache',
+        help='Always convert from scratch, ignoring and not updating the cache',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--pushdown',
+        help='With --output-queries, push row filters and column projections toward the Excel sources',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--output-queries',
+        help='Drop steps that feed no output and emit one named query per output',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--no-merge-steps',
+        help='Keep steps that repeat an earlier step (same operation on the same inputs) as separate bindings',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--stats',
+        help='JSON file of source table statistics ({"tables": {name: {"rows": N, "sorted_by": [...]}}}) '
+             'used to choose join algorithms, buffering and local grouping',
+        default=None
+    )
+    parser.add_argument(
+        '--incremental',
+        help='SOURCE=COLUMN: filter that source on Power BI RangeStart <= COLUMN < RangeEnd for incremental '
+             'refresh (repeatable; SOURCE is the step name or node ID)',
+        action='append',
+        default=None,
+        metavar='SOURCE=COLUMN'
+    )
+    parser.add_argument(
+        '--profile',
+        help='Write conversion stats (phase and per-node timings, counters) as JSON to this path, '
+             'and a cProfile dump alongside it as .pstats',
+        default=None
+    )
+    parser.add_argument(
+        '--watch',
+        help='Keep running and reconvert whenever an input flow changes (with --batch, every matched flow)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--interval',
+        help=f'Seconds between checks for changes in --watch mode (default: {POLL_INTERVAL_SECONDS})',
+        type=float,
+        default=POLL_INTERVAL_SECONDS
+    )
+    parser.add_argument(
+        '--check',
+        help='Only validate the flows (files, directories or globs) without generating M; writes one JSON '
+             'diagnostic per line to -o or stdout and exits 1 if any flow has errors',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--execute',
+        help='Run the flow locally on its Excel/CSV data with pandas instead of converting it; '
+             'writes each output as CSV into the -o directory, or prints a preview without -o',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--data-dir',
+        help='With --execute, look up every source file by name in this directory',
+        default=None
+    )
+    parser.add_argument(
+        '--sample',
+        help='With --execute, read at most this many rows from each source',
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        '--chunk-rows',
+        help=f'With --execute, rows read from a source at a time (default: {DEFAULT_CHUNK_ROWS})',
+        type=int,
+        default=DEFAULT_CHUNK_ROWS
+    )
+
     args = parser.parse_args()
-    
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.pushdown and not args.output_queries:
+        print("Warning: --pushdown only applies with --output-queries; every step is exposed otherwise",
+              file=sys.stderr)
+    incremental = {}
+    for mapping in args.incremental or []:
+        source, sep, column = mapping.partition('=')
+        if not sep or not source.strip() or not column.strip():
+            parser.error(f'--incremental expects SOURCE=COLUMN, got {mapping!r}')
+        incremental[source.strip()] = column.strip()
+    options = ConversionOptions(args.excel, args.debug, args.pushdown, args.output_queries,
+                                merge_steps=not args.no_merge_steps, stats_path=args.stats,
+                                incremental=incremental)
+
+    if args.check:
+        if args.execute or args.watch or args.profile:
+            parser.error('--check cannot be combined with --execute, --watch or --profile')
+        inputs = collect_inputs(args.input_file, exclude=[args.output] if args.output not in (None, '-') else [])
+        if not inputs:
+            parser.error('no flow files matched the inputs')
+        out = sys.stdout if args.output in (None, '-') else open(args.output, 'w', encoding='utf-8')
+        try:
+            totals = check_files(inputs, out, args.jobs)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"Checked {totals['flows']} flows in {totals['seconds']}s: {totals['errors']} errors, "
+              f"{totals['warnings']} warnings ({totals['failed_flows']} flows with errors)", file=sys.stderr)
+        if totals['errors']:
+            exit(1)
+        return
+
+    if args.execute:
+        if args.batch or args.watch or args.profile:
+            parser.error('--execute runs a single flow; it cannot be combined with --batch, --watch or --profile')
+        if len(args.input_file) > 1:
+            parser.error('multiple inputs require --batch')
+        try:
+            execute_file(args.input_file[0], args.output, args.excel, args.data_dir, args.sample, args.chunk_rows,
+                         args.pushdown, args.output_queries, args.debug)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            exit(1)
+        return
+
+    if args.watch:
+        if args.profile:
+            parser.error('--profile cannot be combined with --watch')
+        if args.batch:
+            output_dir = args.output or 'converted'
+            os.makedirs(output_dir, exist_ok=True)
+            jobs = batch_jobs(args.input_file, output_dir)
+        elif len(args.input_file) > 1:
+            parser.error('multiple inputs require --batch')
+        elif args.output == '-':
+            parser.error('--watch writes files; it cannot stream to stdout')
+        else:
+            jobs = single_job(args.input_file[0], args.output or 'output.pq')
+        print(f"Watching for changes every {args.interval}s (Ctrl+C to stop)", file=sys.stderr)
+        try:
+            watch(jobs, options, cache_dir, use_cache=not args.no_cache, interval=args.interval)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.batch:
+        if args.profile:
+            parser.error('--profile converts a single flow; it cannot be combined with --batch')
+        output_dir = args.output or 'converted'
+        summary = run_batch(args.input_file, output_dir, options, args.jobs, args.summary, cache_dir)
+        print(f"Converted {summary['succeeded']}/{summary['total']} flows into {output_dir} "
+              f"({summary['failed']} failed, {summary['seconds']}s)")
+        if summary['failed']:
+            exit(1)
+        return
+
+    if len(args.input_file) > 1:
+        parser.error('multiple inputs require --batch')
+    output = args.output or 'output.pq'
     try:
-        converter = TFLToMConverter(args.input_file)
-        if args.excel:
-            converter.set_excel_path(args.excel)
-        converter.enable_debug(args.debug)
-        m_script = converter.convert()
-        with open(args.output, 'w', encoding='utf-8') as f:
-            f.write(m_script)
-        print(f"Successfully converted to {args.output}")
-        print(f"Using Excel file: {converter._excel_path}")
+        converter = convert_file(args.input_file[0], output, options, cache_dir, profile_path=args.profile)
+        # Keep stdout clean for the script itself when streaming to it
+        log = sys.stderr if output == '-' else sys.stdout
+        print(f"Successfully converted to {output}", file=log)
+        if converter._excel_path:
+            print(f"Using Excel file: {converter._excel_path}", file=log)
+        if args.profile:
+            print(f"Profile written to {args.profile}", file=log)
     except Exception as e:
-        print(f"Error: {str(e)}")
+        print(f"Error: {str(e)}", file=sys.stderr if output == '-' else sys.stdout)
         exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+import cProfile
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from cache import ConversionCache
+from converter import TFLToMConverter
+from schema import load_statistics
+
+FLOW_EXTENSIONS = ('.tfl', '.json')
+
+
+@dataclass(frozen=True, slots=True)
+class ConversionOptions:
+    """How a flow is converted; one instance is shared by every flow of a single, batch or watch run.
+
+    stats_path names a table statistics file (see schema.load_statistics); incremental maps
+    source names to the date column filtered on RangeStart/RangeEnd. merge_steps=False keeps steps
+    that repeat an earlier one as separate bindings.
+    """
+    excel_path: Optional[str] = None
+    debug: bool = False
+    pushdown: bool = False
+    output_queries: bool = False
+    merge_steps: bool = True
+    stats_path: Optional[str] = None
+    incremental: Optional[Dict[str, str]] = None
+
+
+def convert_file(input_path: str, output_path: str, options: Optional[ConversionOptions] = None,
+                 cache_dir: Optional[str] = None, cache: Optional[ConversionCache] = None,
+                 profile_path: Optional[str] = None) -> TFLToMConverter:
+    """Convert one flow file and stream its M script to output_path ('-' for stdout).
+
+    With profile_path, conversion stats are written there as JSON and a
+    cProfile dump of the whole run next to it, with a .pstats extension.
+    An already-open cache, if given, is used instead of cache_dir.
+    """
+    options = options or ConversionOptions()
+    if cache is None and cache_dir:
+        cache = ConversionCache(cache_dir)
+    if profile_path is None:
+        return _convert_file(input_path, output_path, options, cache)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        converter = _convert_file(input_path, output_path, options, cache, profile=True)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.splitext(profile_path)[0] + '.pstats')
+    converter.stats.write_json(profile_path)
+    return converter
+
+
+def _convert_file(input_path: str, output_path: str, options: ConversionOptions,
+                  cache: Optional[ConversionCache], profile: bool = False) -> TFLToMConverter:
+    converter = TFLToMConverter(input_path)
+    if options.excel_path:
+        converter.set_excel_path(options.excel_path)
+    converter.enable_debug(options.debug)
+    converter.enable_profiling(options.debug or profile)
+    converter.enable_pushdown(options.pushdown)
+    converter.enable_output_queries(options.output_queries)
+    converter.enable_step_merging(options.merge_steps)
+    if options.stats_path:
+        converter.set_statistics(load_statistics(options.stats_path))
+    converter.enable_incremental_refresh(options.incremental)
+    converter.set_cache(cache)
+    if output_path == '-':
+        converter.convert_to(sys.stdout)
+    else:
+        # Stream into a sibling temp file so a failed run never leaves a truncated .pq behind
+        tmp_path = output_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                converter.convert_to(f)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    if options.debug:
+        print(converter.stats.summary(), file=sys.stderr)
+    return converter
+
+
+def _is_flow_file(path: str) -> bool:
+    """Packaged flows (.tfl/.json) and the `flow` member of an extracted .tfl."""
+    return path.lower().endswith(FLOW_EXTENSIONS) or os.path.basename(path) == 'flow'
+
+
+def _path_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def collect_inputs(patterns: List[str], exclude: Iterable[str] = ()) -> List[str]:
+    """Expand directories and glob patterns into a sorted, de-duplicated list of flow files.
+
+    exclude names files to leave out and directories not to descend into (such as a
+    batch's summary file and output directory when they sit inside the input tree).
+    """
+    skipped = {_path_key(p) for p in exclude}
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs[:] = [d for d in dirs if _path_key(os.path.join(root, d)) not in skipped]
+                found += [os.path.join(root, f) for f in files
+                          if _is_flow_file(f) and _path_key(os.path.join(root, f)) not in skipped]
+        else:
+            found += [p for p in glob.glob(pattern, recursive=True)
+                      if os.path.isfile(p) and _path_key(p) not in skipped]
+    return sorted(set(os.path.normpath(p) for p in found))
+
+
+def _output_name(input_path: str) -> str:
+    """Name the .pq after the flow, using the folder name for extracted `flow` files."""
+    if os.path.basename(input_path) == 'flow':
+        stem = os.path.basename(os.path.dirname(os.path.abspath(input_path)))
+        if stem.endswith('_extracted'):
+            stem = stem[:-len('_extracted')]
+    else:
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+    return stem or 'flow'
+
+
+def plan_outputs(inputs: List[str], output_dir: str) -> Dict[str, str]:
+    """Map each input to a unique .pq path inside output_dir."""
+    outputs = {}
+    used = set()
+    for path in inputs:
+        name = _output_name(path)
+        candidate, n = name, 1
+        while candidate.lower() in used:
+            n += 1
+            candidate = f"{name}_{n}"
+        used.add(candidate.lower())
+        outputs[path] = os.path.join(output_dir, candidate + '.pq')
+    return outputs
+
+
+def _convert_task(task: dict) -> dict:
+    """Process-pool worker: convert one flow and report the outcome instead of raising."""
+    started = time.perf_counter()
+    result = {'input': task['input'], 'output': task['output']}
+    try:
+        convert_file(task['input'], task['output'], task['options'], task.get('cache_dir'))
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+    result['seconds'] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def run_batch(patterns: List[str], output_dir: str, options: Optional[ConversionOptions] = None,
+              jobs: Optional[int] = None, summary_path: Optional[str] = None,
+              cache_dir: Optional[str] = None) -> dict:
+    """Convert every flow matched by patterns in parallel and write a JSON summary."""
+    summary_path = summary_path or os.path.join(output_dir, 'summary.json')
+    inputs = collect_inputs(patterns, exclude=(output_dir, summary_path))
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = plan_outputs(inputs, output_dir)
+    options = options or ConversionOptions()
+    tasks = [{'input': p, 'output': outputs[p], 'options': options, 'cache_dir': cache_dir} for p in inputs]
+
+    started = time.perf_counter()
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) <= 1:
+        results = [_convert_task(t) for t in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_convert_task, tasks, chunksize=chunksize))
+
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    summary = {
+        'total': len(results),
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'jobs': jobs,
+        'seconds': round(time.perf_counter() - started, 4),
+        'results': results,
+    }
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
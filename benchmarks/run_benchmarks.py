@@ -0,0 +1,198 @@
+"""Time the converter on synthetic flows of increasing size.
+
+    python benchmarks/run_benchmarks.py --sizes 10 100 1000 --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --threshold 1.25
+
+Each phase is timed separately (best of --repeat runs); peak memory comes
+from a separate tracemalloc run so tracing overhead does not skew timings.
+With --baseline, exits 1 if any phase got slower than threshold x baseline.
+"""
+import argparse
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import TFLToMConverter  # noqa: E402
+from handler_registry import REGISTRY  # noqa: E402
+from synthetic_flow import write_flow  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 50000]
+PHASES = ['load', 'schedule', 'sources', 'transformations', 'handlers', 'output', 'end_to_end']
+# Phases shorter than this are too noisy to flag as regressions
+MIN_COMPARABLE_SECONDS = 0.005
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def _consume(iterator):
+    for _ in iterator:
+        pass
+
+
+class _HandlerTimer:
+    """Wrap the node handlers so time spent generating code can be split out of the transformation pass."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._depth = 0
+        self._originals = {}
+
+    def __enter__(self):
+        self._originals = {t: REGISTRY.get(t) for t in REGISTRY.node_types()}
+        for node_type, handler in self._originals.items():
+            REGISTRY.register(node_type, self._wrap(handler))
+        return self
+
+    def __exit__(self, *exc):
+        for node_type, handler in self._originals.items():
+            REGISTRY.register(node_type, handler)
+
+    def _wrap(self, handler):
+        # wraps copies the handler's pure/fusable flags, so timing does not change the generated M
+        @functools.wraps(handler)
+        def timed(*args, **kwargs):
+            # Containers call other handlers; only count the outermost call
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self._depth -= 1
+                if not self._depth:
+                    self.seconds += time.perf_counter() - start
+        return timed
+
+
+def measure_phases(flow_path: str, pushdown: bool, output_queries: bool) -> Dict[str, float]:
+    """One timed pass through every conversion phase."""
+    times = {}
+    times['load'], converter = _timed(lambda: TFLToMConverter(flow_path))
+    converter.enable_pushdown(pushdown)
+    converter.enable_output_queries(output_queries)
+    times['schedule'], _ = _timed(converter._schedule)
+    times['sources'], _ = _timed(lambda: _consume(converter._process_data_sources()))
+    with _HandlerTimer() as handlers:
+        times['transformations'], _ = _timed(lambda: _consume(converter._process_transformations()))
+    # Handler time is part of the transformation pass; both are reported
+    times['handlers'] = handlers.seconds
+    times['output'], _ = _timed(lambda: _consume(converter._build_output_section()))
+
+    def end_to_end():
+        fresh = TFLToMConverter(flow_path)
+        fresh.enable_pushdown(pushdown)
+        fresh.enable_output_queries(output_queries)
+        fresh.convert_to(io.StringIO())
+    times['end_to_end'], _ = _timed(end_to_end)
+    return times
+
+
+def measure_peak_memory(flow_path: str, pushdown: bool, output_queries: bool) -> int:
+    """Peak traced allocation, in bytes, for one end-to-end conversion."""
+    tracemalloc.start()
+    try:
+        converter = TFLToMConverter(flow_path)
+        converter.enable_pushdown(pushdown)
+        converter.enable_output_queries(output_queries)
+        converter.convert_to(io.StringIO())
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes: List[int], repeat: int, seed: int, pushdown: bool, output_queries: bool) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            flow_path = os.path.join(tmp, f"flow_{size}.json")
+            write_flow(flow_path, size, seed)
+            with open(flow_path, encoding='utf-8') as f:
+                node_count = len(json.load(f)['nodes'])
+            best: Dict[str, float] = {}
+            for _ in range(repeat):
+                for phase, seconds in measure_phases(flow_path, pushdown, output_queries).items():
+                    best[phase] = min(seconds, best.get(phase, seconds))
+            peak = measure_peak_memory(flow_path, pushdown, output_queries)
+            entry = {
+                'size': size,
+                'nodes': node_count,
+                'seconds': {p: round(best[p], 6) for p in PHASES},
+                'us_per_node': round(best['end_to_end'] / node_count * 1e6, 2),
+                'peak_memory_bytes': peak,
+            }
+            results.append(entry)
+            print(f"{size:>7} nodes: end-to-end {best['end_to_end']:.3f}s "
+                  f"({entry['us_per_node']} us/node), peak {peak / 1024 / 1024:.1f} MiB", file=sys.stderr)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'pushdown': pushdown,
+        'output_queries': output_queries,
+        'results': results,
+    }
+
+
+def find_regressions(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Phases whose time (or peak memory) exceeds threshold x the baseline for the same size."""
+    previous = {r['size']: r for r in baseline.get('results', [])}
+    problems = []
+    for entry in current['results']:
+        base = previous.get(entry['size'])
+        if base is None:
+            continue
+        for phase, seconds in entry['seconds'].items():
+            old = base.get('seconds', {}).get(phase)
+            if old is None or max(old, seconds) < MIN_COMPARABLE_SECONDS:
+                continue
+            if seconds > old * threshold:
+                problems.append(f"size {entry['size']} {phase}: {old:.4f}s -> {seconds:.4f}s")
+        old_peak = base.get('peak_memory_bytes')
+        if old_peak and entry['peak_memory_bytes'] > old_peak * threshold:
+            problems.append(f"size {entry['size']} peak memory: {old_peak} -> {entry['peak_memory_bytes']} bytes")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the TFL to M converter on synthetic flows')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Approximate node counts to generate')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per size; the best is kept')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the flow generator')
+    parser.add_argument('--pushdown', action='store_true', help='Benchmark with --pushdown enabled')
+    parser.add_argument('--output-queries', action='store_true', help='Benchmark with --output-queries enabled')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='Where to write the JSON results')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Fail when a phase is slower than threshold x baseline (default: 1.25)')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.seed, args.pushdown, args.output_queries)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = find_regressions(results, baseline, args.threshold)
+        for problem in problems:
+            print(f"Regression: {problem}", file=sys.stderr)
+        if problems:
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
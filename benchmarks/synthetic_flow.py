@@ -0,0 +1,200 @@
+import json
+import random
+from typing import Dict, List, Sequence
+
+FIELD_TYPES = ['integer', 'real', 'string', 'date']
+# Relative frequency of each step kind in generated flows
+STEP_WEIGHTS = {
+    'container': 30,
+    'filter': 15,
+    'join': 15,
+    'super_join': 10,
+    'aggregate': 10,
+    'union': 8,
+    'pivot': 4,
+    'source': 8,
+}
+
+
+class _FlowBuilder:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.nodes: Dict[str, dict] = {}
+        self.initial: List[str] = []
+        self.open: List[str] = []
+        self.columns: Dict[str, List[str]] = {}
+        self.counter = 0
+
+    def _id(self) -> str:
+        self.counter += 1
+        return f"00000000-0000-0000-0000-{self.counter:012d}"
+
+    def _node(self, node_type: str, name: str, **extra) -> str:
+        nid = self._id()
+        node = {'nodeType': node_type, 'name': f"{name} {self.counter}", 'id': nid, 'nextNodes': []}
+        node.update(extra)
+        self.nodes[nid] = node
+        return nid
+
+    def _link(self, source: str, target: str, namespace: str = 'Default'):
+        self.nodes[source]['nextNodes'].append(
+            {'namespace': 'Default', 'nextNodeId': target, 'nextNamespace': namespace})
+
+    def _take(self, exclude: Sequence[str] = ()) -> str:
+        """Consume an open table other than those in exclude; occasionally keep it open so branches fan out."""
+        candidates = [nid for nid in self.open if nid not in exclude] if exclude else self.open
+        nid = candidates[self.rng.randrange(len(candidates))]
+        if self.rng.random() > 0.1:
+            self.open.remove(nid)
+        return nid
+
+    def _numeric(self, nid: str) -> str:
+        return self.rng.choice(self.columns[nid])
+
+    def add_source(self):
+        nid = self._id()
+        width = self.rng.randint(4, 20)
+        fields = [{'name': 'Key', 'type': 'integer', 'ordinal': 0}]
+        fields += [{'name': f"S{self.counter}_C{i}", 'type': self.rng.choice(FIELD_TYPES), 'ordinal': i}
+                   for i in range(1, width)]
+        self.nodes[nid] = {
+            'nodeType': '.v1.LoadExcel', 'name': f"Sheet_{self.counter}", 'id': nid, 'nextNodes': [],
+            'connectionId': 'conn-1', 'fields': fields,
+            'relation': {'type': 'table', 'table': f"[Sheet_{self.counter}$]"},
+        }
+        self.initial.append(nid)
+        self.open.append(nid)
+        self.columns[nid] = [f['name'] for f in fields if f['type'] in ('integer', 'real')]
+
+    def add_container(self):
+        upstream = self._take()
+        nid = self._id()
+        sub_nodes = {}
+        columns = list(self.columns[upstream])
+        previous = None
+        for _ in range(self.rng.randint(1, 6)):
+            sub_id = self._id()
+            column = f"Calc_{self.counter}"
+            sub_nodes[sub_id] = {
+                'nodeType': '.v1.AddColumn', 'name': f"Add {column}", 'id': sub_id, 'nextNodes': [],
+                'columnName': column,
+                'expression': f"[{self.rng.choice(columns)}] * {self.rng.randint(2, 9)}",
+            }
+            if previous:
+                sub_nodes[previous]['nextNodes'].append(
+                    {'namespace': 'Default', 'nextNodeId': sub_id, 'nextNamespace': 'Default'})
+            previous = sub_id
+            columns.append(column)
+        first = next(iter(sub_nodes))
+        self.nodes[nid] = {
+            'nodeType': '.v1.Container', 'name': f"Clean {self.counter}", 'id': nid, 'nextNodes': [],
+            'loomContainer': {'initialNodes': [first], 'nodes': sub_nodes},
+            'namespacesToInput': {'Default': {'nodeId': first, 'namespace': 'Default'}},
+            'namespacesToOutput': {'Default': {'nodeId': previous, 'namespace': 'Default'}},
+        }
+        self._link(upstream, nid)
+        self.open.append(nid)
+        self.columns[nid] = columns
+
+    def add_filter(self):
+        upstream = self._take()
+        nid = self._node('.v1.Filter', 'Filter',
+                         filterExpression=f"[{self._numeric(upstream)}] > {self.rng.randint(0, 100)}")
+        self._link(upstream, nid)
+        self.open.append(nid)
+        self.columns[nid] = list(self.columns[upstream])
+
+    def add_aggregate(self):
+        upstream = self._take()
+        measure = self._numeric(upstream)
+        new_name = f"Agg_{self.counter + 1}"
+        nid = self._node('.v1.Aggregate', 'Aggregate', groupByFields=['[Key]'], aggregations=[
+            {'aggregationType': self.rng.choice(['sum', 'average', 'count', 'max']),
+             'column': f"[{measure}]", 'newName': new_name}])
+        self._link(upstream, nid)
+        self.open.append(nid)
+        self.columns[nid] = ['Key', new_name]
+
+    def add_pivot(self):
+        upstream = self._take()
+        nid = self._node('.v1.Pivot', 'Pivot', pivotType='columns', pivotColumn='[Key]',
+                         valueColumn=f"[{self._numeric(upstream)}]")
+        self._link(upstream, nid)
+        self.open.append(nid)
+        self.columns[nid] = ['Key']
+
+    def add_join(self, super_join: bool):
+        if len(self.open) < 2:
+            return self.add_source()
+        left = self._take()
+        right = self._take(exclude=(left,))
+        join = {'nodeType': '.v1.SimpleJoin', 'name': 'Join', 'id': self._id(), 'nextNodes': [],
+                'conditions': [{'leftExpression': '[Key]', 'rightExpression': '[Key]', 'comparator': '=='}],
+                'joinType': self.rng.choice(['inner', 'left', 'right', 'full'])}
+        if super_join:
+            nid = self._node('.v2018_2_3.SuperJoin', 'Join', actionNode=join)
+            # Prep names the action node after its SuperJoin
+            join['name'] = self.nodes[nid]['name']
+        else:
+            nid = self._node('.v1.SimpleJoin', 'Join', conditions=join['conditions'], joinType=join['joinType'])
+        self._link(left, nid, 'Left')
+        self._link(right, nid, 'Right')
+        self.open.append(nid)
+        self.columns[nid] = self.columns[left] + [c for c in self.columns[right] if c not in self.columns[left]]
+
+    def add_union(self):
+        if len(self.open) < 2:
+            return self.add_source()
+        inputs = []
+        for _ in range(min(len(self.open), self.rng.randint(2, 3))):
+            inputs.append(self._take(exclude=inputs))
+        nid = self._node('.v1.Union', 'Union')
+        for upstream in inputs:
+            self._link(upstream, nid)
+        self.open.append(nid)
+        self.columns[nid] = ['Key']
+
+    def finish(self) -> dict:
+        for upstream in list(self.open):
+            nid = self._node('.v1.WriteToHyper', 'Output')
+            self._link(upstream, nid)
+        return {
+            'initialNodes': self.initial,
+            'nodes': self.nodes,
+            'connections': {'conn-1': {
+                'connectionType': '.v1.SqlConnection', 'id': 'conn-1', 'name': 'Synthetic.xlsx',
+                'connectionAttributes': {'filename': 'C:\\data\\Synthetic.xlsx', 'class': 'excel-direct'},
+            }},
+        }
+
+
+def generate_flow(node_count: int, seed: int = 0) -> dict:
+    """Build a synthetic Prep flow with roughly node_count top-level nodes and a realistic step mix."""
+    builder = _FlowBuilder(seed)
+    kinds = list(STEP_WEIGHTS)
+    weights = [STEP_WEIGHTS[k] for k in kinds]
+    for _ in range(max(1, node_count // 20)):
+        builder.add_source()
+    while len(builder.nodes) + len(builder.open) < node_count:
+        kind = builder.rng.choices(kinds, weights)[0]
+        if not builder.open or kind == 'source':
+            builder.add_source()
+        elif kind == 'container':
+            builder.add_container()
+        elif kind == 'filter':
+            builder.add_filter()
+        elif kind in ('join', 'super_join'):
+            builder.add_join(kind == 'super_join')
+        elif kind == 'aggregate':
+            builder.add_aggregate()
+        elif kind == 'union':
+            builder.add_union()
+        elif kind == 'pivot':
+            builder.add_pivot()
+    return builder.finish()
+
+
+def write_flow(path: str, node_count: int, seed: int = 0):
+    """Generate a synthetic flow and save it as JSON."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(generate_flow(node_count, seed), f)
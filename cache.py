@@ -0,0 +1,191 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+from contextlib import contextmanager
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional, TextIO
+
+# Bump whenever handler output changes so stale fragments are never reused.
+CACHE_VERSION = 13
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'mscript')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Batch workers share one cache directory; scan it for eviction at most this often.
+PRUNE_INTERVAL_SECONDS = 60
+
+
+def canonical_hash(*parts) -> str:
+    """SHA-256 over JSON-serialisable parts in canonical (sorted-key, compact) form."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Size-bounded on-disk store of generated M, keyed by content hash.
+
+    Entries are plain files; reads refresh the modification time so that
+    prune() can evict least-recently-used entries first.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.m')
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached text for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def copy_to(self, key: str, fileobj: TextIO) -> bool:
+        """Stream the cached text for key into fileobj; returns False on a miss."""
+        path = self._path(key)
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except OSError:
+            self.misses += 1
+            return False
+        with f:
+            shutil.copyfileobj(f, fileobj)
+        os.utime(path)
+        self.hits += 1
+        return True
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[TextIO]:
+        """Open an entry for incremental writing; it is committed only if the block succeeds."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                yield f
+                self._written += f.tell()
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put(self, key: str, value: str):
+        """Store text under key; written atomically so concurrent workers never see partial entries."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+            self._written += len(value)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def prune(self):
+        """Evict least-recently-used entries until the cache fits in max_bytes."""
+        if not self._written:
+            return
+        stamp = os.path.join(self.directory, '.last_prune')
+        try:
+            if time.time() - os.stat(stamp).st_mtime < PRUNE_INTERVAL_SECONDS:
+                return
+        except OSError:
+            pass
+        with open(stamp, 'w'):
+            pass
+
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class MemoryCache(ConversionCache):
+    """In-process LRU cache with the ConversionCache interface.
+
+    Used by long-lived runs (--watch) without a cache directory, so that
+    unchanged steps are still reused between conversions.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = None
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._written = 0
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def copy_to(self, key: str, fileobj: TextIO) -> bool:
+        value = self.get(key)
+        if value is None:
+            return False
+        fileobj.write(value)
+        return True
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[TextIO]:
+        buffer = io.StringIO()
+        yield buffer
+        self.put(key, buffer.getvalue())
+
+    def put(self, key: str, value: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = value
+        self._size += len(value)
+        self._written += len(value)
+
+    def prune(self):
+        while self._size > self.max_bytes and self._entries:
+            _, value = self._entries.popitem(last=False)
+            self._size -= len(value)
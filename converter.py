@@ -1,323 +1,661 @@
 import json
 import os
-from typing import Dict, List, Optional, Set
-from helpers import sanitize_name
-import node_handlers as nh
-
-def is_json_file(filepath):
-    """Check if a file contains valid JSON content."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            json.load(f)
-        return True
-    except (json.JSONDecodeError, UnicodeDecodeError, FileNotFoundError):
-        return False
+import zipfile
+import io
+import time
+from dataclasses import astuple
+from typing import Dict, Iterator, List, Optional, Set, TextIO, Tuple
+from helpers import m_identifier, sanitize_name, translate_expression
+from m_ast import (NULL, TRUE, Binding, Call, Comment, Each, Identifier, Raw, Record, Shared, Statement, Text,
+                   Verbatim, emit, text_list)
+from flow_graph import FlowGraph
+from flow_model import LOAD_CSV, SOURCE_TYPES, WRITE_TO_HYPER, Flow, Node, parse_flow
+from parse_tfl import load_flow
+from cache import CACHE_VERSION, ConversionCache, canonical_hash
+from schema import SMALL_TABLE_ROWS, UNKNOWN, Schema, output_schema, source_schema, with_statistics
+from optimizer import PushdownPlan, StepIndex, normalize_expression, plan_pushdown
+from profiling import ConversionStats
+from handler_registry import REGISTRY, get_handler
+
+# A textscan connection with a filename ending in one of these points at the CSV itself
+CSV_EXTENSIONS = (".csv", ".txt", ".tsv")
+
+# Power BI incremental refresh parameters; the defaults only matter until the service sets them
+RANGE_PARAMETERS = ('RangeStart', 'RangeEnd')
+RANGE_DEFAULTS = ('#datetime(2000, 1, 1, 0, 0, 0)', '#datetime(2100, 1, 1, 0, 0, 0)')
+
+
+# Fixed helper functions bound at the top of every script
+GET_SHEET = Raw(
+    "GetSheet = (Workbook as table, Item as text, Kind as text) as table =>\n"
+    "    try Workbook{[Item = Item, Kind = Kind]}[Data] otherwise error Error.Record(\n"
+    "        \"Sheet not found\",\n"
+    "        \"Available sheets: \" & Text.Combine(Workbook[Item], \", \"),\n"
+    "        [RequestedSheet = Item]\n"
+    "    ),"
+)
+PREPARE_TABLE = Raw(
+    "PrepareTable = (Data as table, ColumnTypes as list, optional RowFilter as nullable function) as table => let\n"
+    "    PromotedHeaders = Table.PromoteHeaders(Data, [PromoteAllScalars=true]),\n"
+    "    ChangedTypes = Table.TransformColumnTypes(PromotedHeaders, ColumnTypes),\n"
+    "    CleanedData = Table.SelectRows(ChangedTypes, each not List.Contains(Record.FieldValues(_), null)),\n"
+    "    FilteredRows = if RowFilter = null then CleanedData else Table.SelectRows(CleanedData, RowFilter),\n"
+    "    FinalTable = Table.Distinct(FilteredRows)\n"
+    "in\n"
+    "    FinalTable,"
+)
+SELECTED_TABLE = Raw(
+    "GetSelectedTable = if SelectedSheetName = \"\" then\n"
+    "    error \"No sheet selected\" \n"
+    "else \n"
+    "    try Record.Field(CombinedTables, SelectedSheetName) \n"
+    "    otherwise error Error.Record(\n"
+    "        \"Sheet not found\", \n"
+    "        \"Available tables: \" & Text.Combine(SelectedSheets, \", \"), \n"
+    "        [RequestedTable = SelectedSheetName]\n"
+    "    )"
+)
+
 
 class TFLToMConverter:
     def __init__(self, json_file_path: str):
-        self.prep_flow = self._validate_and_load_json(json_file_path)
+        start = time.perf_counter()
+        # Only the compact model is kept; the raw JSON is dropped once parsed
+        self.flow: Flow = parse_flow(self._validate_and_load_json(json_file_path))
+        self.graph = FlowGraph(self.flow.nodes)
+        self._load_seconds = time.perf_counter() - start
         self.generated_tables: Dict[str, str] = {}
+        self.schemas: Dict[str, Schema] = {}
         self.custom_functions: List[str] = []
+        self._excel_connection: Optional[str] = None
         self._excel_path = self._extract_excel_path()
-        if not self._excel_path:
+        if not self._excel_path and not any(c.directory for c in self.flow.connections.values()):
             raise ValueError("No Excel file path found in flow file connections. Please specify via set_excel_path().")
         self._debug_mode = False
+        self._cache: Optional[ConversionCache] = None
+        self._node_keys: Dict[str, str] = {}
+        self._pushdown = False
+        self._output_queries = False
+        # Table name -> {'rows', 'sorted_by'} from a statistics file
+        self._statistics: Dict[str, dict] = {}
+        # Source name -> date column filtered on RangeStart/RangeEnd
+        self._incremental: Dict[str, str] = {}
+        self._plan = PushdownPlan()
+        # Steps (and source loads) generated so far; node ID -> the step it was merged into
+        self._steps = StepIndex()
+        self._loads: Dict[tuple, str] = {}
+        self._canonical: Dict[str, str] = {}
+        self._merge_steps = True
+        # Node ID -> the step's own name, for steps bound to another step's table
+        self._step_names: Dict[str, str] = {}
+        # Populated only while profiling is enabled
+        self.stats: Optional[ConversionStats] = None
 
     def _extract_excel_path(self) -> Optional[str]:
-        """Extract Excel path from connection information if available."""
-        for conn_id, conn in self.prep_flow.get('connections', {}).items():
-            if conn.get('connectionType') == '.v1.SqlConnection':
-                if 'filename' in conn.get('connectionAttributes', {}):
-                    path = conn['connectionAttributes']['filename']
-                    return path.replace("\\", "\\\\")
-        return None
+        """Extract the main workbook path from connection information if available.
+
+        An Excel connection is preferred; set_excel_path() overrides this one
+        path, while other workbooks and CSV files keep their own.
+        """
+        candidates = [c for c in self.flow.connections.values()
+                      if c.connection_type == '.v1.SqlConnection' and c.filename is not None]
+        candidates.sort(key=lambda c: c.connection_class != 'excel-direct')
+        if not candidates:
+            return None
+        self._excel_connection = candidates[0].id
+        return candidates[0].filename.replace("\\", "\\\\")
 
     def _validate_and_load_json(self, path: str) -> dict:
         """Validate and load the JSON file with proper error handling."""
         if not os.path.exists(path):
             raise FileNotFoundError(f"Input file not found: {path}")
-        if not (path.lower().endswith(('.json', '.tfl')) or is_json_file(path)):
+        if not (path.lower().endswith(('.json', '.tfl')) or os.path.basename(path) == 'flow'):
             print(f"Warning: Expected .json or .tfl file, got {os.path.splitext(path)[1]}")
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
+            return load_flow(path)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
             raise ValueError(f"Invalid JSON format in {os.path.basename(path)}: {str(e)}")
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid .tfl archive {os.path.basename(path)}: {str(e)}")
 
     def set_excel_path(self, path: str):
-        """Update the source Excel file path."""
+        """Update the source Excel file path (the flow's main workbook)."""
         self._excel_path = path.replace("\\", "\\\\")
 
     def enable_debug(self, enabled: bool = True):
         """Enable debug output."""
         self._debug_mode = enabled
 
+    def enable_profiling(self, enabled: bool = True):
+        """Collect phase timings, counters and per-node timings into self.stats."""
+        self.stats = ConversionStats() if enabled else None
+        if self.stats is not None:
+            self.stats.phases['load'] = self._load_seconds
+
+    def enable_pushdown(self, enabled: bool = True):
+        """Move row filters and column projections toward the Excel sources (only with output queries)."""
+        self._pushdown = enabled
+
+    def enable_step_merging(self, enabled: bool = True):
+        """Bind a step that repeats an earlier one (same operation on the same inputs) to the earlier step."""
+        self._merge_steps = enabled
+
+    def enable_output_queries(self, enabled: bool = True):
+        """Emit only the steps that feed WriteToHyper outputs, as one shared query per output."""
+        self._output_queries = enabled
+
+    def set_statistics(self, statistics: Optional[Dict[str, dict]]):
+        """Row counts and sort orders of source tables (see schema.load_statistics), used for join and group hints."""
+        self._statistics = dict(statistics or {})
+
+    def enable_incremental_refresh(self, date_columns: Optional[Dict[str, str]]):
+        """Filter each named source (node name, step name or node ID) to RangeStart <= column < RangeEnd.
+
+        Sources not in the mapping are loaded in full; pass None or {} to turn this off.
+        """
+        self._incremental = dict(date_columns or {})
+
+    def _options(self) -> dict:
+        """Settings that change the generated script, for cache keys."""
+        return {'excel': self._excel_path, 'pushdown': self._pushdown, 'output_queries': self._output_queries,
+                'merge_steps': self._merge_steps, 'statistics': self._statistics, 'incremental': self._incremental,
+                'plugins': REGISTRY.fingerprint()}
+
+    def set_cache(self, cache: Optional[ConversionCache]):
+        """Reuse generated M from an on-disk cache; pass None to always convert cold."""
+        self._cache = cache
+
     def convert(self) -> str:
         """Main conversion entry point."""
+        buffer = io.StringIO()
+        self.convert_to(buffer)
+        return buffer.getvalue()
+
+    def convert_to(self, fileobj: TextIO):
+        """Write the M script to fileobj section by section, without building it in memory."""
         try:
-            m_script = ["let"]
-            m_script += self._process_data_sources()
-            m_script += self._process_transformations()
-            m_script += self._build_output_section()
-            return "\n".join(m_script)
+            flow_key = None
+            if self._cache is not None:
+                flow_key = canonical_hash(CACHE_VERSION, 'flow', [node.content() for node in self.flow.nodes.values()],
+                                          self.flow.initial_nodes,
+                                          [astuple(c) for c in self.flow.connections.values()], self._options())
+                if self._cache.copy_to(flow_key, fileobj):
+                    if self.stats is not None:
+                        self.stats.flow_cache_hit = True
+                    if self._debug_mode:
+                        print(f"Flow unchanged, reusing cached script {flow_key[:12]}")
+                    return
+                with self._cache.writer(flow_key) as cache_file:
+                    self._write_script(_Tee(fileobj, cache_file))
+                self._cache.prune()
+            else:
+                self._write_script(fileobj)
         except Exception as e:
             raise RuntimeError(f"Conversion failed: {str(e)}")
 
-    def _process_data_sources(self) -> List[str]:
-        """Process all input data sources with specified M script syntax."""
-        section = []
-        sheet_nodes = [
-            n for n in self.prep_flow.get('initialNodes', [])
-            if self.prep_flow['nodes'][n]['nodeType'] == '.v1.LoadExcel'
+    def _write_script(self, fileobj: TextIO):
+        """Stream the let header, data sources, transformations and output section."""
+        write = fileobj.write
+        if self.stats is not None:
+            write = self._timed_write(write)
+        separator = ""
+        for chunk in self._iter_script():
+            write(separator)
+            write(chunk)
+            separator = "\n"
+
+    def _timed_write(self, write):
+        """Wrap fileobj.write so time spent writing is charged to the 'write' phase."""
+        phases = self.stats.phases
+
+        def timed(text: str):
+            start = time.perf_counter()
+            write(text)
+            phases['write'] += time.perf_counter() - start
+        return timed
+
+    def _iter_script(self) -> Iterator[str]:
+        """Yield the script as newline-separated chunks, in output order."""
+        stats = self.stats
+        if stats is None:
+            self._schedule()
+        else:
+            with stats.phase('schedule'):
+                self._schedule()
+        sources = self._process_data_sources()
+        transformations = self._process_transformations()
+        output = self._build_output_section()
+        if stats is not None:
+            sources = stats.timed_iter('sources', sources)
+            transformations = stats.timed_iter('transformations', transformations)
+            output = stats.timed_iter('output', output)
+
+        if self._output_queries:
+            yield "section Flow;"
+            yield ""
+            if self._incremental:
+                yield emit([Shared(name, Verbatim(f"{default} meta [IsParameterQuery = true, Type = \"DateTime\", "
+                                                   "IsParameterQueryRequired = true]"))
+                            for name, default in zip(RANGE_PARAMETERS, RANGE_DEFAULTS)], depth=0)
+                yield ""
+            yield "Steps = let"
+        else:
+            if self._incremental:
+                yield emit(Comment("Incremental refresh: define DateTime parameters RangeStart and RangeEnd in Power BI"),
+                           depth=0)
+            yield "let"
+        yield from sources
+        yield from transformations
+        yield from output
+
+    def _schedule(self):
+        """Order the nodes, plan pushdown and check the incremental refresh mapping before any code is emitted."""
+        nodes = self.flow.nodes
+        self._live = None
+        if self._output_queries:
+            # Only what the outputs read from is worth scheduling
+            outputs = [nid for nid, node in nodes.items() if node.node_type == '.v1.WriteToHyper']
+            self._live = set(self.graph.upstream_closure(outputs))
+        pending = [
+            nid for nid, node in nodes.items()
+            if node.node_type != WRITE_TO_HYPER and node.node_type not in SOURCE_TYPES
+            and (self._live is None or nid in self._live)
         ]
-        section += [
-            "    GetSheetData = (SelectedSheetName as text) => let",
-            "        // Load the Excel file",
-            f"        Source = Excel.Workbook(File.Contents(\"{self._excel_path}\"), null, true),",
-            "",
-            "        // Filter sheets of interest",
-            f"        SelectedSheets = {self._get_sheet_list(sheet_nodes)},",
-            "        FilteredSheets = Table.SelectRows(Source, each List.Contains(SelectedSheets, [Name])),",
-            "",
-            "        // Validate selected sheet exists",
-            "        TargetSheet = Table.SelectRows(FilteredSheets, each [Name] = SelectedSheetName),",
-            "        CheckSheet = if Table.IsEmpty(TargetSheet) then",
-            "            error Error.Record(",
-            "                \"Sheet not found\",",
-            "                \"Available sheets: \" & Text.Combine(FilteredSheets[Name], \", \"),",
-            "                [RequestedSheet = SelectedSheetName]",
-            "            )",
-            "        else TargetSheet,",
-            "",
-            "        // Extract sheet data",
-            "        SheetData = try CheckSheet{0}[Data] otherwise error Error.Record(",
-            "            \"Data extraction failed\",",
-            "            \"Verify sheet structure\",",
-            "            [SheetName = SelectedSheetName, AvailableColumns = Table.ColumnNames(CheckSheet)]",
-            "        ),",
-            "",
-            "        // Promote headers and clean data",
-            "        PromotedHeaders = Table.PromoteHeaders(SheetData, [PromoteAllScalars=true]),",
-            "        ColumnsToTransform = Table.ColumnNames(PromotedHeaders),",
-            "        ChangedTypes = Table.TransformColumnTypes(",
-            "            PromotedHeaders,",
-            "            List.Transform(",
-            "                ColumnsToTransform,",
-            "                each {_, ",
-            "                    let",
-            "                        SampleValue = List.First(Table.Column(PromotedHeaders, _), null),",
-            "                        TypeDetect = if SampleValue = null then type text",
-            "                            else if Value.Is(SampleValue, Number.Type) then",
-            "                                if Number.Round(SampleValue) = SampleValue then Int64.Type else type number",
-            "                            else if Value.Is(SampleValue, Date.Type) then type date",
-            "                            else if Value.Is(SampleValue, DateTime.Type) then type datetime",
-            "                            else type text",
-            "                    in",
-            "                        TypeDetect}",
-            "            )",
-            "        ),",
-            "        CleanedData = Table.SelectRows(ChangedTypes, each not List.Contains(Record.FieldValues(_), null)),",
-            "        FinalTable = Table.Distinct(CleanedData)",
-            "    in",
-            "        FinalTable,"
+        self._node_order, self._blocked = self.graph.schedule(pending)
+        self._sheet_nodes = [
+            n for n in self.flow.initial_nodes
+            if self.flow.nodes[n].node_type in SOURCE_TYPES
+            and (self._live is None or n in self._live)
         ]
-        section.append("")
-        section.append("    // Load base tables")
+        self._range_by_source = self._range_columns(self._sheet_nodes)
+        # CombinedTables exposes every step, so each one's full rows and columns are a result of the script
+        if self._pushdown and self._output_queries:
+            self._plan = plan_pushdown(self.graph, self._node_order)
+            if self._debug_mode:
+                for nid, note in self._plan.removed.items():
+                    print(f"Pushdown: {nid} {note}")
+
+    def _process_data_sources(self) -> Iterator[str]:
+        """Process all input data sources with specified M script syntax."""
+        sheet_nodes = self._sheet_nodes
+        locations = {nid: self._source_location(self.flow.nodes[nid]) for nid in sheet_nodes}
+        # Each distinct file is opened once and shared by every source reading from it
+        bindings: Dict[Tuple[str, str], str] = {}
+        used: Set[str] = set()
+        for kind, path, _, _ in locations.values():
+            if (kind, path) in bindings:
+                continue
+            stem = os.path.splitext(path.replace('\\', '/').rsplit('/', 1)[-1])[0]
+            name = base = f"{'Csv' if kind == 'csv' else 'Workbook'}_{sanitize_name(stem)}"
+            n = 1
+            while name in used:
+                n += 1
+                name = f"{base}_{n}"
+            used.add(name)
+            bindings[(kind, path)] = name
+
+        files: List[Statement] = [Comment("Source files, each opened once")]
+        for (kind, path), name in bindings.items():
+            contents = Call('File.Contents', [Text(path)])
+            if kind == 'csv':
+                files.append(Binding(name, Call('Csv.Document', [contents, Record([
+                    ('Delimiter', Text(',')), ('Encoding', Verbatim('65001')), ('QuoteStyle', Identifier('QuoteStyle.Csv')),
+                ])])))
+            else:
+                files.append(Binding(name, Call('Excel.Workbook', [contents, NULL, TRUE])))
+        yield emit(files)
+        yield ""
+        if any(kind == 'excel' for kind, _ in bindings):
+            yield emit([Comment("Pick one sheet (or named range) straight out of an opened workbook"), GET_SHEET])
+            yield ""
+        yield emit([Comment("Promote headers and apply the schema declared in the flow"), PREPARE_TABLE])
+        yield ""
+        yield emit(Comment("Load base tables"))
         for node_id in sheet_nodes:
-            node = self.prep_flow['nodes'][node_id]
-            safe_name = sanitize_name(node['name'])
-            section.append(f"    {safe_name} = GetSheetData(\"{node['name']}\"),")
+            node = self.flow.nodes[node_id]
+            safe_name = sanitize_name(node.name)
+            stats = self._statistics.get(node.name) or self._statistics.get(safe_name) or self._statistics.get(node_id)
+            schema = with_statistics(source_schema(node), stats)
+            kind, path, item, item_kind = locations[node_id]
+            filters = self._plan.source_filters.get(node_id, [])
+            columns = self._plan.source_columns.get(node_id)
+            range_column = self._range_by_source.get(node_id)
+            signature = ('source', kind, path, item, item_kind, tuple(schema.columns.items()),
+                         tuple(normalize_expression(f) for f in filters), tuple(columns) if columns else None,
+                         range_column)
+            if self._merge_steps:
+                if signature in self._loads:
+                    yield self._alias_duplicate(node, node_id, self._loads[signature])
+                    continue
+                self._loads[signature] = node_id
+            data = Identifier(bindings[(kind, path)])
+            if kind == 'excel':
+                data = Call('GetSheet', [data, Text(item), Text(item_kind)])
+            args = [data, schema.m_type_list()]
+            conditions = []
+            if filters:
+                conditions.append(translate_expression(' AND '.join(f'({f})' for f in filters)))
+            if range_column is not None:
+                conditions.append(self._range_condition(range_column, schema.type_of(range_column)))
+            if conditions:
+                args.append(Each(Verbatim(' and '.join(conditions))))
+            load = Call('PrepareTable', args)
+            if columns:
+                load = Call('Table.SelectColumns', [load, text_list(columns)])
+                schema = schema.select(columns)
+            if schema.rows is not None and schema.rows <= SMALL_TABLE_ROWS \
+                    and len(set(self.graph.successors.get(node_id, []))) > 1:
+                # A small table read by several steps is loaded once instead of once per reader
+                load = Call('Table.Buffer', [load])
+            yield emit(Binding(safe_name, load))
             self.generated_tables[node_id] = safe_name
-        return section
-
-    def _get_node_dependencies(self, node: dict) -> List[str]:
-        """Get all upstream dependencies for a node, ensuring container sub-nodes are linked."""
-        dependencies = []
-        node_id = node.get('id', 'Unknown')
-        node_type = node.get('nodeType', 'Unknown')
-
-        if node_type in ['.v1.LoadExcel', '.v1.WriteToHyper']:
-            return []
-
-        # Find nodes that feed into this one (reverse dependency)
-        for nid, n in self.prep_flow['nodes'].items():
-            if 'nextNodes' in n and any(nn.get('nextNodeId') == node_id for nn in n.get('nextNodes', [])):
-                dependencies.append(nid)
-
-        # Special handling for containers
-        if node_type == '.v1.Container':
-            # Check loomContainer for initialNodes and sub-node dependencies
-            container_data = node.get('loomContainer', {})
-            if 'initialNodes' in container_data and container_data['initialNodes']:
-                dependencies.extend(container_data['initialNodes'])
-            # For containers, also consider the node feeding into it as the primary dependency
-            for nid, n in self.prep_flow['nodes'].items():
-                if 'nextNodes' in n and any(nn.get('nextNodeId') == node_id for nn in n.get('nextNodes', [])):
-                    dependencies.append(nid)
-            # Remove sub-node IDs from dependencies if present, as they are processed within the container
-            sub_nodes = container_data.get('nodes', {})
-            sub_node_ids = set(sub_nodes.keys())
-            dependencies = [dep for dep in dependencies if dep not in sub_node_ids]
-
-        # Special handling for sub-nodes like AddColumn
-        if node_type == '.v1.AddColumn':
-            # If this is a sub-node, its dependency is the container’s input or previous node
-            for nid, n in self.prep_flow['nodes'].items():
-                if 'nextNodes' in n and any(nn.get('nextNodeId') == node_id for nn in n.get('nextNodes', [])):
-                    dependencies.append(nid)
-                # Check if this AddColumn is inside a container
-                container_data = n.get('loomContainer', {})
-                if container_data and node_id in container_data.get('nodes', {}):
-                    # Dependency is the container’s input
-                    for parent_nid, parent_n in self.prep_flow['nodes'].items():
-                        if 'nextNodes' in parent_n and any(nn.get('nextNodeId') == nid for nn in parent_n.get('nextNodes', [])):
-                            dependencies.append(parent_nid)
-
-        # Special handling for SuperJoin
-        if node_type == '.v2018_2_3.SuperJoin':
-            action_node = node.get('actionNode', {})
-            if action_node and 'nodeType' in action_node and action_node['nodeType'] == '.v1.SimpleJoin':
-                for nid, n in self.prep_flow['nodes'].items():
-                    if 'nextNodes' in n and any(nn.get('nextNodeId') == node_id for nn in n.get('nextNodes', [])):
-                        dependencies.append(nid)
-
-        unique_deps = list(set(dependencies))
-        if not unique_deps and self._debug_mode and node_type != '.v1.AddColumn':  # AddColumn may have no direct deps if in container
+            self.schemas[node_id] = schema
+            if self._cache is not None:
+                self._node_keys[node_id] = canonical_hash(CACHE_VERSION, 'source', node.content(), path, filters, columns,
+                                                         stats, range_column)
+
+    def _range_columns(self, sheet_nodes: List[str]) -> Dict[str, str]:
+        """Source node ID -> date column for incremental refresh, checking every mapped name and column."""
+        if not self._incremental:
+            return {}
+        columns = {}
+        matched = set()
+        for node_id in sheet_nodes:
+            node = self.flow.nodes[node_id]
+            for key in (node.name, sanitize_name(node.name), node_id):
+                if key in self._incremental:
+                    column = self._incremental[key]
+                    schema = source_schema(node)
+                    if column not in schema.columns:
+                        raise ValueError(f"Incremental refresh column {column} not found in source {node.name}")
+                    # Rejects columns of a type the filter cannot compare
+                    self._range_condition(column, schema.type_of(column))
+                    columns[node_id] = column
+                    matched.add(key)
+                    break
+        live = {key for nid in self.flow.initial_nodes
+                for key in (self.flow.nodes[nid].name, sanitize_name(self.flow.nodes[nid].name), nid)}
+        unknown = [name for name in self._incremental if name not in matched and name not in live]
+        if unknown:
+            raise ValueError(f"Incremental refresh sources not found in flow: {', '.join(unknown)}")
+        return columns
+
+    @staticmethod
+    def _range_condition(column: str, m_type: str) -> str:
+        """M condition keeping rows with RangeStart <= column < RangeEnd, adapted to the column's type."""
+        field = f"[{m_identifier(column)}]"
+        start, end = RANGE_PARAMETERS
+        if m_type == 'type datetime':
+            value = field
+        elif m_type == 'type date':
+            value = f"DateTime.From({field})"
+        elif m_type == 'Int64.Type':
+            # yyyymmdd keys, as in date dimension tables
+            return (f"{field} >= Date.Year({start}) * 10000 + Date.Month({start}) * 100 + Date.Day({start}) and "
+                    f"{field} < Date.Year({end}) * 10000 + Date.Month({end}) * 100 + Date.Day({end})")
+        else:
+            raise ValueError(f"Incremental refresh column {column} must be a date, datetime or yyyymmdd integer, "
+                             f"not {m_type}")
+        return f"{value} >= {start} and {value} < {end}"
+
+    def _source_location(self, node: Node) -> Tuple[str, str, str, str]:
+        """Where a source reads from: (kind 'excel' or 'csv', M-escaped path, item name, item kind)."""
+        conn = self.flow.connections.get(node.connection_id)
+        relation = (node.relation_table or '').strip('[]').strip("'")
+        if node.node_type == LOAD_CSV or (conn is not None and conn.connection_class == 'textscan'):
+            file_name = relation.replace('#', '.') or node.name
+            if conn is not None and conn.filename and conn.filename.lower().endswith(CSV_EXTENSIONS):
+                path = conn.filename
+            elif conn is not None and conn.directory:
+                path = f"{conn.directory.rstrip(chr(92) + '/')}\\{file_name}"
+            else:
+                path = file_name
+            return 'csv', path.replace("\\", "\\\\"), file_name, ''
+        if conn is None or conn.id == self._excel_connection or not conn.filename:
+            path = self._excel_path
+        else:
+            path = conn.filename.replace("\\", "\\\\")
+        # Sheets are named "Sheet$" in the relation; anything else is a named range
+        if relation.endswith('$') or not relation:
+            return 'excel', path, relation[:-1] if relation else node.name, 'Sheet'
+        return 'excel', path, relation, 'DefinedName'
+
+    def _get_node_dependencies(self, node: Node) -> List[str]:
+        """Get all upstream dependencies for a node from the precomputed flow graph."""
+        node_id = node.id
+        node_type = node.node_type
+        deps = self.graph.dependencies(node_id)
+        if self.stats is not None:
+            self.stats.dependency_lookups += 1
+        if not deps and self._debug_mode and node_type not in SOURCE_TYPES + (WRITE_TO_HYPER, '.v1.AddColumn'):
             print(f"Warning: No dependencies found for node {node_id} ({node_type})")
-        return unique_deps
+        return deps
 
-    def _process_transformations(self) -> List[str]:
+    def _process_transformations(self) -> Iterator[str]:
         """Process all transformation nodes in dependency order."""
-        section = ["", "    // Transformations"]
-        processed_nodes: Set[str] = set(self.generated_tables.keys())
-        all_nodes = {nid: node for nid, node in self.prep_flow['nodes'].items()}
-        remaining_nodes = {
-            nid: node for nid, node in all_nodes.items()
-            if nid not in processed_nodes and node['nodeType'] not in ['.v1.WriteToHyper', '.v1.LoadExcel']
-        }
-
-        visited = set()
-        node_order = []
-
-        while remaining_nodes:
-            current_batch = []
-            for nid, node in remaining_nodes.items():
-                if nid in visited:
-                    continue
+        yield ""
+        yield emit(Comment("Transformations"))
+        node_order, blocked = self._node_order, self._blocked
 
-                deps = self._get_node_dependencies(node)
-                if all(dep in processed_nodes for dep in deps):
-                    current_batch.append((nid, node))
-                else:
-                    if self._debug_mode:
-                        missing_deps = [d for d in deps if d not in processed_nodes]
-                        print(f"Node {nid} ({node['nodeType']}): Waiting for dependencies {missing_deps}")
-
-            if not current_batch:
-                unprocessed = ", ".join(remaining_nodes.keys())
-                warning = f"    // Warning: Circular or unresolvable dependencies detected in nodes: {unprocessed}"
+        for node_id in node_order:
+            node = self.flow.nodes[node_id]
+            if node_id in self._plan.removed:
+                yield self._alias_removed_node(node, node_id)
+                continue
+            node = self._plan.rewritten.get(node_id, node)
+            m_code = self._generate_node_code(node, node_id)
+            if m_code:
+                yield m_code
                 if self._debug_mode:
-                    print(warning)
-                    for nid, node in remaining_nodes.items():
-                        print(f"Node {nid} ({node['nodeType']}): {node.get('name', 'Unnamed')}, Dependencies: {self._get_node_dependencies(node)}")
-                section.append(warning)
-                break
-
-            for node_id, node in current_batch:
-                visited.add(node_id)
-                node_order.append(node_id)
-                m_code = self._generate_node_code(node, node_id)
-                if m_code:
-                    section.append(m_code)
-                    processed_nodes.add(node_id)
-                    if self._debug_mode:
-                        print(f"Processed node {node_id} ({node['nodeType']}): {node.get('name', 'Unnamed')}")
-                del remaining_nodes[node_id]
+                    print(f"Processed node {node_id} ({node.node_type}): {node.name or 'Unnamed'}")
+
+        if blocked:
+            yield from self._report_blocked_nodes(blocked)
 
         if self._debug_mode:
             print(f"Processing order: {node_order}")
-        return section
 
-    def _generate_node_code(self, node: dict, node_id: str) -> Optional[str]:
+    def _alias_removed_node(self, node: Node, node_id: str) -> str:
+        """Point a step folded away by pushdown at its input, leaving a comment in its place."""
+        deps = self.graph.dependencies(node_id)
+        dep = deps[0] if deps else node_id
+        if dep not in self.generated_tables:
+            # Its input failed to generate; leave it unbound so downstream steps report the gap
+            error_msg = emit(Comment(f"Error: Missing upstream table for node {node_id} ({node.node_type}): {dep}"))
+            if self._debug_mode:
+                print(error_msg)
+            return error_msg
+        self.generated_tables[node_id] = self.generated_tables[dep]
+        self._step_names[node_id] = sanitize_name(node.name or f"Transform_{node_id}")
+        self.schemas[node_id] = self.schemas.get(dep, UNKNOWN)
+        self._canonical[node_id] = self._canonical.get(dep, dep)
+        if self._cache is not None:
+            self._node_keys[node_id] = canonical_hash(CACHE_VERSION, 'alias', self._node_keys.get(dep, dep))
+        return emit(Comment(f"{node.name or node_id}: {self._plan.removed[node_id]}"))
+
+    def _alias_duplicate(self, node: Node, node_id: str, original: str) -> str:
+        """Point a step that repeats an earlier one at the earlier binding instead of evaluating it twice."""
+        table = self.generated_tables[original]
+        self.generated_tables[node_id] = table
+        self._step_names[node_id] = sanitize_name(node.name or f"Transform_{node_id}")
+        self.schemas[node_id] = self.schemas.get(original, UNKNOWN)
+        self._canonical[node_id] = original
+        if self._cache is not None and original in self._node_keys:
+            self._node_keys[node_id] = self._node_keys[original]
+        if self._debug_mode:
+            print(f"Merged duplicate step {node_id} into {original}")
+        return emit(Comment(f"{node.name or node_id}: same as {table}"))
+
+    def _report_blocked_nodes(self, blocked: List[str]) -> Iterator[str]:
+        """Describe dependency cycles, and the nodes stuck behind them, as M comments."""
+        def label(nid: str) -> str:
+            return f"{self.flow.nodes[nid].name or 'Unnamed'} ({nid})"
+
+        lines = []
+        in_cycle: Set[str] = set()
+        for members, edges in self.graph.find_cycles(blocked):
+            in_cycle.update(members)
+            lines.append(Comment(f"Error: Circular dependency between nodes: {', '.join(label(m) for m in members)}"))
+            lines.append(Comment(f"  Edges: {', '.join(f'{label(a)} -> {label(b)}' for a, b in edges)}"))
+        downstream = [nid for nid in blocked if nid not in in_cycle]
+        if downstream:
+            lines.append(Comment(f"Warning: Nodes blocked by circular dependencies: {', '.join(label(n) for n in downstream)}"))
+        for line in lines:
+            text = emit(line)
+            if self._debug_mode:
+                print(text.strip())
+            yield text
+
+    def _generate_node_code(self, node: Node, node_id: str) -> Optional[str]:
         """Generate M code for a specific node type."""
-        handlers = {
-            '.v1.SimpleJoin': nh.handle_join,
-            '.v1.AddColumn': nh.handle_add_column,
-            '.v1.Aggregate': nh.handle_aggregate,
-            '.v1.Union': nh.handle_union,
-            '.v1.Pivot': nh.handle_pivot,
-            '.v1.Filter': nh.handle_filter,
-            '.v1.Container': nh.handle_container,
-            '.v2018_2_3.SuperJoin': nh.handle_super_join
-        }
-
-        node_type = node.get('nodeType', 'Unknown')
-        handler = handlers.get(node_type)
+        node_type = node.node_type
+        handler = get_handler(node_type)
 
         if not handler:
-            warning = f"    // Warning: No handler for node type {node_type}"
+            warning = emit(Comment(f"Warning: No handler for node type {node_type}"))
             if self._debug_mode:
                 print(warning)
             return warning
 
         dependencies = self._get_node_dependencies(node)
         if not dependencies and node_type != '.v1.Container':
-            error_msg = f"    // Error: No dependencies found for node {node_id} ({node_type})"
+            error_msg = emit(Comment(f"Error: No dependencies found for node {node_id} ({node_type})"))
             if self._debug_mode:
                 print(error_msg)
             return error_msg
 
         upstream_tables = [self.generated_tables.get(dep, f"MissingTable_{dep}") for dep in dependencies]
         if any(table.startswith("MissingTable_") for table in upstream_tables):
-            error_msg = f"    // Error: Missing upstream tables for node {node_id} ({node_type}): {upstream_tables}"
+            error_msg = emit(Comment(f"Error: Missing upstream tables for node {node_id} ({node_type}): {upstream_tables}"))
             if self._debug_mode:
                 print(error_msg)
                 for dep in dependencies:
                     if dep not in self.generated_tables:
-                        print(f"Potential missing node: {dep}, Type: {self.prep_flow['nodes'].get(dep, {}).get('nodeType', 'Unknown')}")
+                        print(f"Potential missing node: {dep}, Type: {getattr(self.graph.node(dep), 'node_type', 'Unknown')}")
             return error_msg
 
+        upstream = [self._canonical.get(dep, dep) for dep in dependencies]
+        mergeable = self._merge_steps and self._mergeable(node)
+        if mergeable:
+            original = self._steps.find(node, upstream)
+            if original is not None:
+                return self._alias_duplicate(node, node_id, original)
+
+        upstream_schemas = [self.schemas.get(dep, UNKNOWN) for dep in dependencies]
+        node_key = None
+        if self._cache is not None:
+            node_key = self._node_key(node_id, node, dependencies)
+            cached = self._cache.get(node_key)
+            if self.stats is not None:
+                if cached is None:
+                    self.stats.cache_misses += 1
+                else:
+                    self.stats.cache_hits += 1
+            if cached is not None:
+                self.generated_tables[node_id] = sanitize_name(node.name or f"Transform_{node_id}")
+                self.schemas[node_id] = output_schema(node, upstream_schemas)
+                if mergeable:
+                    self._steps.add(node_id, node, upstream)
+                if self._debug_mode:
+                    print(f"Reused cached code for {node_id} ({node_type})")
+                return cached
+
         try:
-            m_code = handler(node, upstream_tables)
-            self.generated_tables[node_id] = sanitize_name(node.get('name', f"Transform_{node_id}"))
+            if self.stats is None:
+                m_code = emit(handler(node, upstream_tables, upstream_schemas))
+            else:
+                start = time.perf_counter()
+                m_code = emit(handler(node, upstream_tables, upstream_schemas))
+                self.stats.record_node(node_id, node_type, time.perf_counter() - start)
+            self.generated_tables[node_id] = sanitize_name(node.name or f"Transform_{node_id}")
+            self.schemas[node_id] = output_schema(node, upstream_schemas)
             if self._debug_mode:
                 print(f"Generated code for {node_id} ({node_type}): {m_code.splitlines()[0]}...")
+            if node_key is not None:
+                self._cache.put(node_key, m_code)
+            if mergeable:
+                self._steps.add(node_id, node, upstream)
             return m_code
         except Exception as e:
-            error_msg = f"    // Error processing node {node_id} ({node_type}): {str(e)}"
+            error_msg = emit(Comment(f"Error processing node {node_id} ({node_type}): {str(e)}"))
             if self._debug_mode:
                 print(error_msg)
             return error_msg
 
-    def _build_output_section(self) -> List[str]:
+    @staticmethod
+    def _mergeable(node: Node) -> bool:
+        """Whether node's handler, and those of its container sub-steps, are marked pure."""
+        if not getattr(get_handler(node.node_type), 'pure', False):
+            return False
+        return all(TFLToMConverter._mergeable(sub) for sub in node.sub_nodes.values())
+
+    def _node_key(self, node_id: str, node: Node, dependencies: List[str]) -> str:
+        """Content hash of a node's JSON chained with the hashes of its upstream nodes."""
+        upstream = [self._node_keys.get(dep, dep) for dep in dependencies]
+        key = canonical_hash(CACHE_VERSION, 'node', node.content(), upstream)
+        self._node_keys[node_id] = key
+        return key
+
+    def _build_output_section(self) -> Iterator[str]:
         """Build the final output structure with specified syntax."""
-        all_tables = list(self.generated_tables.values())
-        default_output = all_tables[-1] if all_tables else ""
-        return [
-            "",
-            "    // Create combined table set",
-            "    CombinedTables = [",
-            "        " + ",\n        ".join(f"{name} = {name}" for name in all_tables),
-            "    ],",
-            "",
-            "    // Parameter handling",
-            f"    SelectedSheetName = \"\",",
-            "    SelectedSheets = Record.FieldNames(CombinedTables),",
-            "",
-            "    GetSelectedTable = if SelectedSheetName = \"\" then",
-            "        error \"No sheet selected\" ",
-            "    else ",
-            "        try Record.Field(CombinedTables, SelectedSheetName) ",
-            "        otherwise error Error.Record(",
-            "            \"Sheet not found\", ",
-            "            \"Available tables: \" & Text.Combine(SelectedSheets, \", \"), ",
-            "            [RequestedTable = SelectedSheetName]",
-            "        )",
-            "in",
-            "    GetSelectedTable"
-        ]
+        if self._output_queries:
+            yield from self._build_output_queries()
+            return
+        # One field per step under its own name; merged or folded steps point at the binding they share
+        tables: Dict[str, str] = {}
+        for nid, table in self.generated_tables.items():
+            tables.setdefault(self._step_names.get(nid, table), table)
+        yield ""
+        yield emit([
+            Comment("Create combined table set"),
+            Binding('CombinedTables', Record([(name, Identifier(table)) for name, table in tables.items()],
+                                             broken=True)),
+        ])
+        yield ""
+        yield emit([
+            Comment("Parameter handling"),
+            Binding('SelectedSheetName', Text("")),
+            Binding('SelectedSheets', Call('Record.FieldNames', [Identifier('CombinedTables')])),
+        ])
+        yield ""
+        yield emit(SELECTED_TABLE)
+        yield "in"
+        yield "    GetSelectedTable"
+
+    def _build_output_queries(self) -> Iterator[str]:
+        """Close the Steps let with a record of outputs and expose each one as a shared query."""
+        outputs = []
+        used = set()
+        for nid, node in self.flow.nodes.items():
+            if node.node_type != '.v1.WriteToHyper':
+                continue
+            name = node.name or f"Output_{nid}"
+            query, n = name, 1
+            while query in used:
+                n += 1
+                query = f"{name} {n}"
+            used.add(query)
+            deps = self.graph.predecessors.get(nid, [])
+            table = self.generated_tables.get(deps[0]) if deps else None
+            value = Identifier(table) if table else Verbatim(f'error "No input table for output {query}"')
+            outputs.append((query, value))
+
+        yield ""
+        yield emit([Comment("Output tables"), Binding('Outputs', Record(outputs, broken=True), final=True)])
+        yield "in"
+        yield "    Outputs;"
+        for query, _ in outputs:
+            yield ""
+            yield emit(Shared(query, Verbatim(f"Steps[{m_identifier(query)}]")), depth=0)
+
+
+class _Tee:
+    """Minimal writable that mirrors writes to two text streams."""
+
+    def __init__(self, first: TextIO, second: TextIO):
+        self._first = first
+        self._second = second
 
-    def _get_sheet_list(self, sheet_nodes: List[str]) -> str:
-        """Generate the list of sheets for the Excel loader function."""
-        names = [self.prep_flow['nodes'][n]['name'] for n in sheet_nodes]
-        return "{\"" + "\", \"".join(names) + "\"}"
\ No newline at end of file
+    def write(self, text: str):
+        self._first.write(text)
+        self._second.write(text)
@@ -0,0 +1,824 @@
+import ntpath
+import os
+import sys
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from converter import TFLToMConverter
+from flow_graph import container_steps
+from flow_model import SOURCE_TYPES, SUPER_JOIN, WRITE_TO_HYPER, Node
+from helpers import sanitize_name, tokenize_expression
+from schema import UNKNOWN, Schema, output_schema, source_schema
+
+if TYPE_CHECKING:
+    # Annotations only; at run time pandas is imported on first use by _pandas()
+    import pandas
+
+# Raw rows read from a sheet before the PrepareTable steps run on them
+DEFAULT_CHUNK_ROWS = 50000
+
+# Table.Join kinds the generated script uses -> pandas merge `how`
+JOIN_KINDS = {'inner': 'inner', 'left': 'left', 'leftouter': 'left', 'right': 'right', 'rightouter': 'right',
+              'full': 'outer', 'fullouter': 'outer', 'outer': 'outer'}
+# Aggregation types -> pandas reductions; Count counts every row, like List.Count
+AGGREGATIONS = {'sum': 'sum', 'count': 'size', 'countd': 'nunique', 'min': 'min', 'max': 'max',
+                'average': 'mean', 'avg': 'mean', 'median': 'median', 'stdev': 'std', 'var': 'var'}
+
+
+def _pandas():
+    """pandas is only needed to run flows locally; import it on first use."""
+    try:
+        import numpy
+        import pandas
+    except ImportError:
+        raise RuntimeError("Local execution requires pandas (and openpyxl for Excel sources): "
+                           "pip install pandas openpyxl")
+    return pandas, numpy
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise RuntimeError("Reading Excel sources locally requires openpyxl: pip install openpyxl")
+    return openpyxl
+
+
+class FlowExecutor:
+    """Evaluate a converted flow on its local Excel/CSV data with pandas.
+
+    Runs the nodes the converter schedules, with the same pushdown plan, and
+    mirrors what the generated M computes, so outputs can be compared with
+    Tableau Prep extracts without Power BI. Sources are read in chunks of
+    chunk_rows raw rows (type conversion, null removal, pushed-down filters
+    and projection run per chunk); sample_rows caps the rows read from each
+    source for a quick preview, in which case joins and aggregates only see
+    the sample.
+    """
+
+    def __init__(self, converter: TFLToMConverter, data_dir: Optional[str] = None,
+                 sample_rows: Optional[int] = None, chunk_rows: int = DEFAULT_CHUNK_ROWS, keep_steps: bool = False):
+        if chunk_rows < 1:
+            raise ValueError(f"chunk_rows must be positive, got {chunk_rows}")
+        self.converter = converter
+        self.data_dir = data_dir
+        self.sample_rows = sample_rows
+        self.chunk_rows = chunk_rows
+        # Keep every intermediate table instead of freeing it once its consumers have run
+        self.keep_steps = keep_steps
+        self.tables = {}
+        self.schemas: Dict[str, Schema] = {}
+        self._workbooks = {}
+
+    def run(self) -> Dict[str, 'pandas.DataFrame']:
+        """Evaluate the flow; returns output name -> table for every WriteToHyper node that could be computed."""
+        converter = self.converter
+        converter._schedule()
+        nodes = converter.flow.nodes
+        plan = converter._plan
+        outputs = {nid: node for nid, node in nodes.items() if node.node_type == WRITE_TO_HYPER}
+        remaining = self._consumer_counts(converter._node_order, outputs)
+        try:
+            for node_id in converter.flow.initial_nodes:
+                if nodes[node_id].node_type in SOURCE_TYPES and (converter._live is None or node_id in converter._live):
+                    self.tables[node_id] = self._load_source(nodes[node_id])
+            for node_id in converter._node_order:
+                deps = converter._get_node_dependencies(nodes[node_id])
+                if node_id in plan.removed:
+                    # Folded into a source by pushdown; the table is its input's
+                    self.tables[node_id] = self.tables[deps[0]]
+                    self.schemas[node_id] = self.schemas.get(deps[0], UNKNOWN)
+                else:
+                    node = plan.rewritten.get(node_id, nodes[node_id])
+                    missing = [d for d in deps if d not in self.tables]
+                    if not deps or missing:
+                        raise ValueError(f"Missing upstream tables {missing or deps} for node {node_id}")
+                    inputs = [self.tables[d] for d in deps]
+                    schemas = [self.schemas.get(d, UNKNOWN) for d in deps]
+                    try:
+                        self.tables[node_id] = self._step(node, inputs, schemas)
+                    except Exception as e:
+                        raise RuntimeError(f"Step {node.name or node_id} ({node.node_type}) failed: {str(e)}")
+                    self.schemas[node_id] = output_schema(node, schemas)
+                self._release(deps, remaining)
+        finally:
+            for workbook in self._workbooks.values():
+                workbook.close()
+            self._workbooks.clear()
+
+        results = {}
+        for out_id, out in outputs.items():
+            deps = converter.graph.predecessors.get(out_id, [])
+            if deps and deps[0] in self.tables:
+                results[out.name or out_id] = self.tables[deps[0]]
+        return results
+
+    def _consumer_counts(self, order: List[str], outputs: Dict[str, Node]) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        graph = self.converter.graph
+        for node_id in order:
+            for dep in graph.dependencies(node_id):
+                counts[dep] = counts.get(dep, 0) + 1
+        for out_id in outputs:
+            for dep in graph.predecessors.get(out_id, []):
+                # Outputs are read after the run; never free what they point at
+                counts[dep] = counts.get(dep, 0) + len(order) + 1
+        return counts
+
+    def _release(self, deps: List[str], remaining: Dict[str, int]):
+        if self.keep_steps:
+            return
+        for dep in deps:
+            remaining[dep] = remaining.get(dep, 1) - 1
+            if remaining[dep] <= 0:
+                self.tables.pop(dep, None)
+
+    # Sources
+
+    def _resolve_path(self, m_path: str) -> str:
+        """Local path for a source file; with data_dir, files are found there by name."""
+        path = m_path.replace('\\\\', '\\')
+        if self.data_dir:
+            return os.path.join(self.data_dir, ntpath.basename(path))
+        return path
+
+    def _load_source(self, node: Node):
+        """Read a source in chunks and run the generated PrepareTable steps on each chunk."""
+        pd, _ = _pandas()
+        kind, m_path, item, item_kind = self.converter._source_location(node)
+        path = self._resolve_path(m_path)
+        schema = source_schema(node)
+        plan = self.converter._plan
+        row_filter = None
+        filters = plan.source_filters.get(node.id)
+        if filters:
+            row_filter = compile_expression(' AND '.join(f'({f})' for f in filters))
+        columns = plan.source_columns.get(node.id)
+
+        if kind == 'csv':
+            chunks = self._csv_chunks(path)
+        else:
+            chunks = self._excel_chunks(path, item, item_kind)
+        prepared = []
+        for chunk in chunks:
+            chunk = _convert_types(chunk, schema)
+            # CleanedData: drop rows with a null anywhere
+            chunk = chunk.dropna(how='any')
+            if row_filter is not None and len(chunk):
+                chunk = chunk[_mask(chunk, row_filter(chunk))]
+            prepared.append(chunk.drop_duplicates())
+        table = pd.concat(prepared, ignore_index=True) if prepared else pd.DataFrame(columns=list(schema.columns))
+        # FinalTable: Table.Distinct over the whole source, not just each chunk
+        table = table.drop_duplicates(ignore_index=True)
+        if columns:
+            table = table[columns]
+            schema = Schema({c: schema.type_of(c) for c in columns})
+        self.schemas[node.id] = schema
+        if self.converter._debug_mode:
+            print(f"Loaded {len(table)} rows from {path} ({item or node.name})")
+        return table
+
+    def _csv_chunks(self, path: str) -> Iterator['pandas.DataFrame']:
+        pd, _ = _pandas()
+        # Csv.Document yields text; empty fields become null when typed
+        reader = pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8',
+                             nrows=self.sample_rows, chunksize=self.chunk_rows)
+        with reader:
+            for chunk in reader:
+                yield chunk.mask(chunk == '')
+
+    def _excel_chunks(self, path: str, item: str, item_kind: str) -> Iterator['pandas.DataFrame']:
+        pd, _ = _pandas()
+        workbook = self._workbooks.get(path)
+        if workbook is None:
+            # Each workbook is opened once per run, like the shared Workbook_ bindings
+            workbook = _openpyxl().load_workbook(path, read_only=True, data_only=True)
+            self._workbooks[path] = workbook
+        if item_kind == 'Sheet':
+            if item not in workbook.sheetnames:
+                raise ValueError(f"Sheet not found: {item}. Available sheets: {', '.join(workbook.sheetnames)}")
+            rows = workbook[item].iter_rows(values_only=True)
+        else:
+            if item not in workbook.defined_names:
+                raise ValueError(f"Named range not found: {item}")
+            sheet, cells = next(iter(workbook.defined_names[item].destinations))
+            min_col, min_row, max_col, max_row = _openpyxl().utils.range_boundaries(cells.replace('$', ''))
+            rows = workbook[sheet].iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col,
+                                             values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        # PromoteHeaders: the first row names the columns
+        names = [str(h) if h is not None else f"Column{i + 1}" for i, h in enumerate(header)]
+        limit = self.sample_rows
+        batch = []
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            batch.append(row)
+            if limit is not None:
+                limit -= 1
+            if len(batch) >= self.chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=names)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=names)
+
+    # Steps
+
+    def _step(self, node: Node, inputs: list, schemas: List[Schema]):
+        step = _STEPS.get(node.node_type)
+        if step is None:
+            raise ValueError(f"No local implementation for node type {node.node_type}")
+        return step(self, node, inputs, schemas)
+
+    def _join(self, node: Node, inputs: list, schemas: List[Schema]):
+        pd, _ = _pandas()
+        if len(inputs) != 2:
+            raise ValueError(f"Join operation requires exactly 2 inputs, got {len(inputs)}")
+        left, right = inputs
+        left_on = [c.left.strip('[]') for c in node.conditions]
+        right_on = [c.right.strip('[]') for c in node.conditions]
+        if not left_on:
+            raise ValueError("Join operation requires at least one condition")
+        how = JOIN_KINDS.get(node.join_type.lower())
+        if how is None:
+            raise ValueError(f"Unsupported join type {node.join_type}")
+        clash = sorted(set(left.columns) & set(right.columns))
+        if clash:
+            # Table.Join refuses to produce duplicate column names
+            raise ValueError(f"Join would produce duplicate columns: {', '.join(clash)}")
+        return pd.merge(left, right, how=how, left_on=left_on, right_on=right_on, sort=False)
+
+    def _super_join(self, node: Node, inputs: list, schemas: List[Schema]):
+        if node.action is None:
+            raise ValueError("SuperJoin node missing actionNode")
+        return self._join(node.action, inputs, schemas)
+
+    def _add_column(self, node: Node, inputs: list, schemas: List[Schema]):
+        if len(inputs) != 1:
+            raise ValueError(f"AddColumn requires exactly 1 input, got {len(inputs)}")
+        if node.column_name is None or node.expression is None:
+            raise ValueError("AddColumn node missing required properties")
+        table = inputs[0]
+        if node.column_name in table.columns:
+            raise ValueError(f"Column {node.column_name} already exists")
+        values = compile_expression(node.expression)(table)
+        return table.assign(**{node.column_name: _series(table, values)})
+
+    def _filter(self, node: Node, inputs: list, schemas: List[Schema]):
+        if len(inputs) != 1:
+            raise ValueError(f"Filter requires exactly 1 input, got {len(inputs)}")
+        if not node.filter_expression:
+            raise ValueError("Filter operation requires filterExpression")
+        table = inputs[0]
+        return table[_mask(table, compile_expression(node.filter_expression)(table))]
+
+    def _aggregate(self, node: Node, inputs: list, schemas: List[Schema]):
+        pd, _ = _pandas()
+        if len(inputs) != 1:
+            raise ValueError(f"Aggregate requires exactly 1 input, got {len(inputs)}")
+        table = inputs[0]
+        groups = [f.strip('[]') for f in node.group_by]
+        named = {}
+        for agg in node.aggregations:
+            reduction = AGGREGATIONS.get(agg.aggregation_type.lower())
+            if reduction is None:
+                raise ValueError(f"Unsupported aggregation {agg.aggregation_type}")
+            column = agg.column.strip('[]')
+            named[agg.new_name or f"{column}_{agg.aggregation_type.lower()}"] = (column, reduction)
+        if not groups and not named:
+            raise ValueError("Aggregate operation requires groupByFields or aggregations")
+        if not groups:
+            return pd.DataFrame({name: [table[column].agg(reduction)] for name, (column, reduction) in named.items()})
+        grouped = table.groupby(groups, sort=False, dropna=False)
+        if not named:
+            return grouped.size().reset_index()[groups]
+        return grouped.agg(**named).reset_index()
+
+    def _union(self, node: Node, inputs: list, schemas: List[Schema]):
+        pd, _ = _pandas()
+        if len(inputs) < 2:
+            raise ValueError(f"Union requires at least 2 inputs, got {len(inputs)}")
+        # Table.Combine matches columns by name and fills the gaps with null
+        return pd.concat(inputs, ignore_index=True, sort=False)
+
+    def _pivot(self, node: Node, inputs: list, schemas: List[Schema]):
+        if len(inputs) != 1:
+            raise ValueError(f"Pivot requires exactly 1 input, got {len(inputs)}")
+        table = inputs[0]
+        pivot_col = node.pivot_column.strip('[]')
+        value_col = node.value_column.strip('[]')
+        if not pivot_col or not value_col:
+            raise ValueError("Pivot operation requires pivotColumn and valueColumn")
+        if node.pivot_type == 'columns':
+            keys = [c for c in table.columns if c not in (pivot_col, value_col)]
+            sums = table.groupby(keys + [pivot_col], sort=False, dropna=False)[value_col].sum(min_count=1)
+            wide = sums.unstack(pivot_col) if keys else sums.to_frame().T
+            # One column per distinct value, in order of first appearance like Table.Pivot
+            wide = wide.reindex(columns=table[pivot_col].drop_duplicates().dropna().tolist())
+            wide.columns = [str(c) for c in wide.columns]
+            return wide.reset_index(drop=not keys)
+        value_columns = [c.strip('[]') for c in node.value_columns]
+        keys = [c for c in table.columns if c not in value_columns]
+        long = table.melt(id_vars=keys, value_vars=value_columns, var_name=pivot_col, value_name=value_col,
+                          ignore_index=False)
+        # Table.Unpivot expands each row in place and skips null values
+        return long.dropna(subset=[value_col]).sort_index(kind='stable').reset_index(drop=True)
+
+    def _container(self, node: Node, inputs: list, schemas: List[Schema]):
+        if len(inputs) != 1:
+            raise ValueError(f"Container requires exactly 1 input, got {len(inputs)}")
+        if not node.sub_nodes:
+            return inputs[0]
+        graph, order, blocked, output_id = container_steps(node)
+        if blocked:
+            names = ', '.join(node.sub_nodes[nid].name or nid for nid in blocked)
+            raise ValueError(f"Circular dependency inside {node.name}: {names}")
+        tables = {}
+        step_schemas: Dict[str, Schema] = {}
+        for sub_id in order:
+            sub = node.sub_nodes[sub_id]
+            deps = graph.predecessors.get(sub_id)
+            sub_inputs = [tables[d] for d in deps] if deps else inputs
+            sub_schemas = [step_schemas[d] for d in deps] if deps else schemas
+            if sub.node_type in _STEPS:
+                tables[sub_id] = self._step(sub, sub_inputs, sub_schemas)
+                step_schemas[sub_id] = output_schema(sub, sub_schemas)
+            else:
+                # Unsupported sub-steps pass their input through, as in the generated script
+                tables[sub_id] = sub_inputs[0]
+                step_schemas[sub_id] = sub_schemas[0]
+        return tables.get(output_id, inputs[0])
+
+
+_STEPS: Dict[str, Callable] = {
+    '.v1.SimpleJoin': FlowExecutor._join,
+    SUPER_JOIN: FlowExecutor._super_join,
+    '.v1.AddColumn': FlowExecutor._add_column,
+    '.v1.Filter': FlowExecutor._filter,
+    '.v1.Aggregate': FlowExecutor._aggregate,
+    '.v1.Union': FlowExecutor._union,
+    '.v1.Pivot': FlowExecutor._pivot,
+    '.v1.Container': FlowExecutor._container,
+}
+
+
+def _convert_types(table, schema: Schema):
+    """Table.TransformColumnTypes: values that do not convert become null."""
+    pd, _ = _pandas()
+    converted = {}
+    for column, m_type in schema.columns.items():
+        if column not in table.columns:
+            raise ValueError(f"Column {column} not found in source (has {', '.join(map(str, table.columns))})")
+        values = table[column]
+        if m_type == 'Int64.Type':
+            converted[column] = pd.to_numeric(values, errors='coerce').round().astype('Int64')
+        elif m_type == 'type number':
+            converted[column] = pd.to_numeric(values, errors='coerce').astype('float64')
+        elif m_type == 'type text':
+            converted[column] = values.astype('string')
+        elif m_type == 'type date':
+            converted[column] = pd.to_datetime(values, errors='coerce').dt.normalize()
+        elif m_type == 'type datetime':
+            converted[column] = pd.to_datetime(values, errors='coerce')
+        elif m_type == 'type logical':
+            converted[column] = values.map(_to_logical, na_action='ignore').astype('boolean')
+    return table.assign(**converted) if converted else table
+
+
+def _to_logical(value) -> Optional[bool]:
+    if isinstance(value, str):
+        return {'true': True, 'false': False}.get(value.strip().lower())
+    return bool(value)
+
+
+def _series(table, value):
+    """Broadcast a scalar expression result to one value per row."""
+    pd, _ = _pandas()
+    if isinstance(value, pd.Series):
+        return value
+    return pd.Series([value] * len(table), index=table.index, dtype=object if value is None else None)
+
+
+def _mask(table, value):
+    """Rows where a condition is true; null counts as false."""
+    return _series(table, value).fillna(False).astype(bool)
+
+
+# Expressions: Tableau calculations compiled to functions of a DataFrame
+
+Compiled = Callable[['pandas.DataFrame'], object]
+
+
+@lru_cache(maxsize=4096)
+def compile_expression(expr: str) -> Compiled:
+    """Compile a Tableau calculation into a vectorized function of a table (memoized per expression text)."""
+    parser = _Parser(tokenize_expression(expr), expr)
+    compiled = parser.expression()
+    if parser.pos != len(parser.tokens):
+        raise ValueError(f"Unexpected {parser.tokens[parser.pos][1]!r} in expression: {expr}")
+    return compiled
+
+
+def _not(value):
+    pd, _ = _pandas()
+    if isinstance(value, pd.Series):
+        return ~value.astype('boolean')
+    return None if value is None else not value
+
+
+def _logical(value):
+    pd, _ = _pandas()
+    return value.astype('boolean') if isinstance(value, pd.Series) else value
+
+
+_BINARY = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': lambda a, b: a / b,
+    '=': lambda a, b: a == b,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
+    'AND': lambda a, b: _logical(a) & _logical(b),
+    'OR': lambda a, b: _logical(a) | _logical(b),
+}
+_BINARY['&&'] = _BINARY['AND']
+_BINARY['||'] = _BINARY['OR']
+
+# Loosest to tightest binding
+_PRECEDENCE = [('OR', '||'), ('AND', '&&'), None, ('=', '==', '!=', '<>', '<', '>', '<=', '>='), ('+', '-'), ('*', '/')]
+
+
+class _Parser:
+    """Precedence-climbing parser producing closures over the table being evaluated."""
+
+    def __init__(self, tokens: List[Tuple[str, str, bool]], expr: str):
+        self.tokens = tokens
+        self.expr = expr
+        self.pos = 0
+
+    def _peek(self) -> Tuple[str, str, bool]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ('eof', '', False)
+
+    def _keyword(self) -> str:
+        kind, text, _ = self._peek()
+        return text.upper() if kind == 'name' else text
+
+    def _expect(self, keyword: str):
+        if self._keyword() != keyword:
+            raise ValueError(f"Expected {keyword} in expression: {self.expr}")
+        self.pos += 1
+
+    def expression(self, level: int = 0) -> Compiled:
+        if level == len(_PRECEDENCE):
+            return self._unary()
+        operators = _PRECEDENCE[level]
+        if operators is None:
+            # NOT binds looser than comparisons but tighter than AND
+            if self._keyword() in ('NOT', '!'):
+                self.pos += 1
+                operand = self.expression(level)
+                return lambda t: _not(operand(t))
+            return self.expression(level + 1)
+        left = self.expression(level + 1)
+        while self._keyword() in operators:
+            operator = _BINARY[self._keyword()]
+            self.pos += 1
+            right = self.expression(level + 1)
+            left = (lambda op, a, b: lambda t: op(a(t), b(t)))(operator, left, right)
+        return left
+
+    def _unary(self) -> Compiled:
+        if self._keyword() == '-':
+            self.pos += 1
+            operand = self._unary()
+            return lambda t: -operand(t)
+        if self._keyword() == '+':
+            self.pos += 1
+            return self._unary()
+        return self._primary()
+
+    def _primary(self) -> Compiled:
+        kind, text, _ = self._peek()
+        self.pos += 1
+        if kind == 'number':
+            value = float(text) if any(c in text for c in '.eE') else int(text)
+            return lambda t: value
+        if kind == 'string':
+            value = text[1:-1].replace(text[0] * 2, text[0])
+            return lambda t: value
+        if kind == 'field':
+            name = text[1:-1].replace(']]', ']')
+            return lambda t: t[name]
+        if kind == 'date':
+            value = _date_literal(text)
+            return lambda t: value
+        if kind == 'op' and text == '(':
+            inner = self.expression()
+            self._expect(')')
+            return inner
+        upper = text.upper()
+        if kind == 'name':
+            if upper in ('TRUE', 'FALSE'):
+                value = upper == 'TRUE'
+                return lambda t: value
+            if upper == 'NULL':
+                return lambda t: None
+            if upper == 'IF':
+                return self._if()
+            if upper == 'CASE':
+                return self._case()
+            if self._keyword() == '(':
+                return self._call(upper)
+        raise ValueError(f"Unsupported {text or 'end of expression'!r} in expression: {self.expr}")
+
+    def _if(self) -> Compiled:
+        branches = []
+        while True:
+            condition = self.expression()
+            self._expect('THEN')
+            branches.append((condition, self.expression()))
+            if self._keyword() != 'ELSEIF':
+                break
+            self.pos += 1
+        otherwise = lambda t: None
+        if self._keyword() == 'ELSE':
+            self.pos += 1
+            otherwise = self.expression()
+        self._expect('END')
+        return lambda t: _choose(t, [(c(t), v(t)) for c, v in branches], otherwise(t))
+
+    def _case(self) -> Compiled:
+        subject = self.expression()
+        branches = []
+        while self._keyword() == 'WHEN':
+            self.pos += 1
+            value = self.expression()
+            self._expect('THEN')
+            branches.append((value, self.expression()))
+        if not branches:
+            raise ValueError(f"CASE without WHEN in expression: {self.expr}")
+        otherwise = lambda t: None
+        if self._keyword() == 'ELSE':
+            self.pos += 1
+            otherwise = self.expression()
+        self._expect('END')
+
+        def evaluate(t):
+            s = subject(t)
+            return _choose(t, [(s == v(t), r(t)) for v, r in branches], otherwise(t))
+        return evaluate
+
+    def _call(self, name: str) -> Compiled:
+        self._expect('(')
+        args = []
+        part = None
+        if self._keyword() != ')':
+            while True:
+                kind, text, _ = self._peek()
+                if not args and name in _DATE_FUNCTIONS and kind == 'string':
+                    part = text[1:-1].lower()
+                args.append(self.expression())
+                if self._keyword() != ',':
+                    break
+                self.pos += 1
+        self._expect(')')
+
+        if name in _DATE_FUNCTIONS:
+            function = _DATE_FUNCTIONS[name].get(part)
+            if function is None:
+                raise ValueError(f"Unsupported {name} part {part or '?'} in expression: {self.expr}")
+            args = args[1:]
+        elif name == 'IIF':
+            if len(args) != 3:
+                raise ValueError(f"IIF does not take {len(args)} argument(s) in expression: {self.expr}")
+            condition, then, otherwise = args
+            return lambda t: _choose(t, [(condition(t), then(t))], otherwise(t))
+        else:
+            functions = _FUNCTIONS.get(name)
+            if functions is None:
+                raise ValueError(f"Unsupported function {name} in expression: {self.expr}")
+            function = functions.get(len(args))
+            if function is None:
+                raise ValueError(f"{name} does not take {len(args)} argument(s) in expression: {self.expr}")
+        return lambda t: function(t, *[a(t) for a in args])
+
+
+def _choose(table, branches, otherwise):
+    """First branch whose condition holds, row by row (if/else if/.../else)."""
+    pd, _ = _pandas()
+    if not any(isinstance(x, pd.Series) for pair in branches for x in pair) and not isinstance(otherwise, pd.Series):
+        for condition, value in branches:
+            if condition:
+                return value
+        return otherwise
+    result = _series(table, otherwise)
+    for condition, value in reversed(branches):
+        result = _series(table, value).where(_mask(table, condition), result)
+    return result
+
+
+def _date_literal(text: str):
+    pd, _ = _pandas()
+    return pd.Timestamp(text.strip('#').strip())
+
+
+def _text(method: str, **options) -> Callable:
+    """Text function: vectorized through .str when only the first argument varies."""
+    def apply(table, value, *args):
+        pd, _ = _pandas()
+        if any(isinstance(a, pd.Series) for a in args):
+            return _rowwise(table, lambda v, *a: getattr(pd.Series([v], dtype='string').str, method)(*a, **options)[0],
+                            value, *args)
+        if isinstance(value, pd.Series):
+            return getattr(value.astype('string').str, method)(*args, **options)
+        return None if value is None else getattr(pd.Series([value], dtype='string').str, method)(*args, **options)[0]
+    return apply
+
+
+def _rowwise(table, function, *args):
+    """Fallback for functions whose later arguments vary by row."""
+    pd, _ = _pandas()
+    columns = [_series(table, a) for a in args]
+    return pd.Series([None if any(pd.isna(v) for v in row) else function(*row) for row in zip(*columns)],
+                     index=table.index)
+
+
+def _numeric(function: Callable) -> Callable:
+    def apply(table, *args):
+        pd, _ = _pandas()
+        return function(*[pd.to_numeric(a) if isinstance(a, pd.Series) else a for a in args])
+    return apply
+
+
+def _dates(table, value):
+    pd, _ = _pandas()
+    return pd.to_datetime(_series(table, value))
+
+
+def _week_of_year(dates):
+    """Date.WeekOfYear: weeks start on Sunday and week 1 holds January 1st."""
+    pd, _ = _pandas()
+    jan_first = dates - pd.to_timedelta(dates.dt.dayofyear - 1, unit='D')
+    return (dates.dt.dayofyear - 1 + (jan_first.dt.dayofweek + 1) % 7) // 7 + 1
+
+
+def _start_of_week(dates):
+    pd, _ = _pandas()
+    return (dates - pd.to_timedelta((dates.dt.dayofweek + 1) % 7, unit='D')).dt.normalize()
+
+
+def _add_dates(unit: str, scale: int = 1) -> Callable:
+    def apply(table, amount, value):
+        pd, _ = _pandas()
+        dates = _dates(table, value)
+        if isinstance(amount, pd.Series):
+            return _rowwise(table, lambda n, d: d + pd.DateOffset(**{unit: int(n) * scale}), amount, dates)
+        return dates + pd.DateOffset(**{unit: int(amount) * scale})
+    return apply
+
+
+def _min_max(method: str) -> Callable:
+    def apply(table, a, b):
+        pd, _ = _pandas()
+        # List.Min/List.Max skip nulls
+        return getattr(pd.concat([_series(table, a), _series(table, b)], axis=1), method)(axis=1)
+    return apply
+
+
+def _coalesce(table, value, fallback):
+    return _series(table, value).where(_series(table, value).notna(), _series(table, fallback))
+
+
+def _pd():
+    return _pandas()[0]
+
+
+def _np():
+    return _pandas()[1]
+
+
+# Tableau function name -> {arity: implementation(table, *args)}, mirroring helpers._FUNCTIONS
+_FUNCTIONS: Dict[str, Dict[int, Callable]] = {
+    'CONTAINS': {2: _text('contains', regex=False)},
+    'STARTSWITH': {2: _text('startswith')},
+    'ENDSWITH': {2: _text('endswith')},
+    'UPPER': {1: _text('upper')},
+    'LOWER': {1: _text('lower')},
+    'LEN': {1: _text('len')},
+    'TRIM': {1: _text('strip')},
+    'LTRIM': {1: _text('lstrip')},
+    'RTRIM': {1: _text('rstrip')},
+    'LEFT': {2: lambda t, a, n: _text('slice')(t, a, 0, n)},
+    'RIGHT': {2: lambda t, a, n: _text('slice')(t, a, -n) if not isinstance(n, _pd().Series)
+              else _rowwise(t, lambda v, k: v[-int(k):] if k else '', a, n)},
+    'MID': {2: lambda t, a, s: _text('slice')(t, a, s - 1) if not isinstance(s, _pd().Series)
+            else _rowwise(t, lambda v, k: v[int(k) - 1:], a, s),
+            3: lambda t, a, s, n: _text('slice')(t, a, s - 1, s - 1 + n)
+            if not isinstance(s, _pd().Series) and not isinstance(n, _pd().Series)
+            else _rowwise(t, lambda v, k, m: v[int(k) - 1:int(k) - 1 + int(m)], a, s, n)},
+    'REPLACE': {3: _text('replace', regex=False)},
+    'FIND': {2: lambda t, a, b: _text('find')(t, a, b) + 1},
+    'ABS': {1: _numeric(abs)},
+    'ROUND': {1: _numeric(lambda a: a.round() if isinstance(a, _pd().Series) else round(a)),
+              2: _numeric(lambda a, n: a.round(int(n)) if isinstance(a, _pd().Series) else round(a, int(n)))},
+    'CEILING': {1: _numeric(lambda a: _np().ceil(a))},
+    'FLOOR': {1: _numeric(lambda a: _np().floor(a))},
+    'SQRT': {1: _numeric(lambda a: _np().sqrt(a))},
+    'POWER': {2: _numeric(lambda a, b: a ** b)},
+    'EXP': {1: _numeric(lambda a: _np().exp(a))},
+    'LN': {1: _numeric(lambda a: _np().log(a))},
+    'LOG': {1: _numeric(lambda a: _np().log10(a)), 2: _numeric(lambda a, b: _np().log(a) / _np().log(b))},
+    'MIN': {2: _min_max('min')},
+    'MAX': {2: _min_max('max')},
+    'ISNULL': {1: lambda t, a: _series(t, a).isna()},
+    'IFNULL': {2: _coalesce},
+    'ZN': {1: lambda t, a: _coalesce(t, a, 0)},
+    'INT': {1: lambda t, a: _pd().to_numeric(_series(t, a), errors='coerce').round().astype('Int64')},
+    'FLOAT': {1: lambda t, a: _pd().to_numeric(_series(t, a), errors='coerce').astype('float64')},
+    'STR': {1: lambda t, a: _series(t, a).astype('string')},
+    'DATE': {1: lambda t, a: _pd().to_datetime(_series(t, a), errors='coerce').dt.normalize()},
+    'DATETIME': {1: lambda t, a: _pd().to_datetime(_series(t, a), errors='coerce')},
+    'YEAR': {1: lambda t, a: _dates(t, a).dt.year},
+    'QUARTER': {1: lambda t, a: _dates(t, a).dt.quarter},
+    'MONTH': {1: lambda t, a: _dates(t, a).dt.month},
+    'WEEK': {1: lambda t, a: _week_of_year(_dates(t, a))},
+    'DAY': {1: lambda t, a: _dates(t, a).dt.day},
+    'TODAY': {0: lambda t: _pd().Timestamp.now().normalize()},
+    'NOW': {0: lambda t: _pd().Timestamp.now()},
+}
+
+# Date-part functions: part (lower-case) -> implementation(table, *remaining args), mirroring helpers._DATE_FUNCTIONS
+_DATE_FUNCTIONS: Dict[str, Dict[str, Callable]] = {
+    'DATEPART': {
+        'year': lambda t, d: _dates(t, d).dt.year,
+        'quarter': lambda t, d: _dates(t, d).dt.quarter,
+        'month': lambda t, d: _dates(t, d).dt.month,
+        'week': lambda t, d: _week_of_year(_dates(t, d)),
+        'day': lambda t, d: _dates(t, d).dt.day,
+        'dayofyear': lambda t, d: _dates(t, d).dt.dayofyear,
+        'weekday': lambda t, d: (_dates(t, d).dt.dayofweek + 1) % 7 + 1,
+        'hour': lambda t, d: _dates(t, d).dt.hour,
+        'minute': lambda t, d: _dates(t, d).dt.minute,
+        'second': lambda t, d: _dates(t, d).dt.second,
+    },
+    'DATEADD': {
+        'year': _add_dates('years'),
+        'quarter': _add_dates('months', 3),
+        'month': _add_dates('months'),
+        'week': _add_dates('weeks'),
+        'day': _add_dates('days'),
+    },
+    'DATETRUNC': {
+        'year': lambda t, d: _dates(t, d).dt.to_period('Y').dt.start_time,
+        'quarter': lambda t, d: _dates(t, d).dt.to_period('Q').dt.start_time,
+        'month': lambda t, d: _dates(t, d).dt.to_period('M').dt.start_time,
+        'week': lambda t, d: _start_of_week(_dates(t, d)),
+        'day': lambda t, d: _dates(t, d).dt.normalize(),
+    },
+    'DATEDIFF': {
+        'day': lambda t, a, b: (_dates(t, b).dt.normalize() - _dates(t, a).dt.normalize()).dt.days,
+        'week': lambda t, a, b: (_dates(t, b).dt.normalize() - _dates(t, a).dt.normalize()).dt.days // 7,
+        'month': lambda t, a, b: ((_dates(t, b).dt.year - _dates(t, a).dt.year) * 12
+                                  + _dates(t, b).dt.month - _dates(t, a).dt.month),
+        'year': lambda t, a, b: _dates(t, b).dt.year - _dates(t, a).dt.year,
+    },
+}
+
+
+def execute_file(input_path: str, output_dir: Optional[str] = None, excel_path: Optional[str] = None,
+                 data_dir: Optional[str] = None, sample_rows: Optional[int] = None,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS, pushdown: bool = False, output_queries: bool = False,
+                 debug: bool = False, preview_rows: int = 5, log: TextIO = sys.stdout) -> Dict[str, int]:
+    """Run one flow locally; write each output as CSV to output_dir, or print a preview when it is None.
+
+    Returns output name -> row count.
+    """
+    converter = TFLToMConverter(input_path)
+    if excel_path:
+        converter.set_excel_path(excel_path)
+    converter.enable_debug(debug)
+    converter.enable_pushdown(pushdown)
+    converter.enable_output_queries(output_queries)
+    results = FlowExecutor(converter, data_dir, sample_rows, chunk_rows).run()
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    counts = {}
+    for name, table in results.items():
+        counts[name] = len(table)
+        if output_dir:
+            path = os.path.join(output_dir, f"{sanitize_name(name)}.csv")
+            table.to_csv(path, index=False)
+            print(f"{name}: {len(table)} rows -> {path}", file=log)
+        else:
+            print(f"{name}: {len(table)} rows", file=log)
+            print(table.head(preview_rows).to_string(index=False), file=log)
+            print(file=log)
+    return counts
@@ -0,0 +1,166 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+from flow_model import SOURCE_TYPES, WRITE_TO_HYPER, Node
+
+# Input ports of two-sided nodes are ordered so joins always see Left before Right.
+NAMESPACE_ORDER = {'Left': 0, 'Right': 1}
+
+OUTPUT_TYPES = (WRITE_TO_HYPER,)
+
+
+class FlowGraph:
+    """Adjacency index over the parsed nodes of a flow, built once per flow."""
+
+    def __init__(self, nodes: Dict[str, Node], recursive: bool = True):
+        self.nodes = nodes
+        self.recursive = recursive
+        self.successors: Dict[str, List[str]] = {}
+        self.predecessors: Dict[str, List[str]] = {}
+        self.container_of: Dict[str, str] = {}
+        self.members: Dict[str, List[str]] = {}
+        self._sub_nodes: Dict[str, Node] = {}
+        self._index(nodes, None)
+
+    def _index(self, nodes: Dict[str, Node], container_id: Optional[str]):
+        """Record edges and container membership for one level of the flow."""
+        incoming: Dict[str, list] = {}
+        for nid, node in nodes.items():
+            if container_id is not None:
+                self.container_of[nid] = container_id
+                self._sub_nodes[nid] = node
+            succ = self.successors.setdefault(nid, [])
+            for nn in node.next_nodes:
+                succ.append(nn.node_id)
+                incoming.setdefault(nn.node_id, []).append((NAMESPACE_ORDER.get(nn.namespace, 0), nn.namespace, nid))
+            if node.sub_nodes and self.recursive:
+                self.members[nid] = list(node.sub_nodes.keys())
+                self._index(node.sub_nodes, nid)
+        for target, sources in incoming.items():
+            # One input per port, so a self-join still reads its input twice (Left and Right)
+            ordered = sorted(dict.fromkeys(sources), key=lambda s: s[0])
+            self.predecessors[target] = [nid for _, _, nid in ordered]
+
+    def node(self, node_id: str) -> Optional[Node]:
+        """Look up a top-level or container sub-node by ID."""
+        return self.nodes.get(node_id) or self._sub_nodes.get(node_id)
+
+    def parent_container(self, node_id: str) -> Optional[str]:
+        """Return the ID of the container holding a sub-node, if any."""
+        return self.container_of.get(node_id)
+
+    def dependencies(self, node_id: str) -> List[str]:
+        """Upstream node IDs feeding a node, in input-port order."""
+        node = self.node(node_id)
+        if node is not None and node.node_type in SOURCE_TYPES + OUTPUT_TYPES:
+            return []
+        deps = list(self.predecessors.get(node_id, []))
+        parent = self.container_of.get(node_id)
+        if not deps and parent is not None:
+            # Entry nodes of a container read from whatever feeds the container
+            deps = self.dependencies(parent)
+        return deps
+
+    def upstream_closure(self, roots: Iterable[str]) -> List[str]:
+        """All top-level nodes the given roots read from, roots included, in flow order."""
+        seen = set()
+        stack = list(roots)
+        while stack:
+            nid = stack.pop()
+            if nid in seen:
+                continue
+            seen.add(nid)
+            stack.extend(self.predecessors.get(nid, []))
+        return [nid for nid in self.nodes if nid in seen]
+
+    def schedule(self, node_ids: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Order nodes with Kahn's algorithm; returns (order, blocked node IDs).
+
+        Ties are broken by the order the IDs were given in, so the same flow
+        always yields the same schedule.
+        """
+        pending = list(node_ids)
+        indegree = {nid: 0 for nid in pending}
+        dependents: Dict[str, List[str]] = {nid: [] for nid in pending}
+        for nid in pending:
+            for dep in self.dependencies(nid):
+                if dep in indegree:
+                    indegree[nid] += 1
+                    dependents[dep].append(nid)
+
+        ready = deque(nid for nid in pending if indegree[nid] == 0)
+        order = []
+        while ready:
+            nid = ready.popleft()
+            order.append(nid)
+            for child in dependents[nid]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        blocked = [nid for nid in pending if indegree[nid] > 0]
+        return order, blocked
+
+    def find_cycles(self, node_ids: Iterable[str]) -> List[Tuple[List[str], List[Tuple[str, str]]]]:
+        """Return (members, edges) for every dependency cycle among the given nodes."""
+        candidates = list(node_ids)
+        position = {nid: i for i, nid in enumerate(candidates)}
+        edges = {nid: [d for d in self.dependencies(nid) if d in position] for nid in candidates}
+
+        # Iterative Tarjan SCC, so deep flows do not hit the recursion limit
+        index: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack = set()
+        cycles = []
+        for root in candidates:
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                nid, i = work.pop()
+                if i == 0:
+                    index[nid] = low[nid] = len(index)
+                    stack.append(nid)
+                    on_stack.add(nid)
+                targets = edges[nid]
+                if i < len(targets):
+                    work.append((nid, i + 1))
+                    dep = targets[i]
+                    if dep not in index:
+                        work.append((dep, 0))
+                    elif dep in on_stack:
+                        low[nid] = min(low[nid], index[dep])
+                    continue
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[nid])
+                if low[nid] == index[nid]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        members.append(member)
+                        if member == nid:
+                            break
+                    if len(members) > 1 or nid in edges[nid]:
+                        member_set = set(members)
+                        members.sort(key=position.__getitem__)
+                        cycle_edges = [(dep, m) for m in members for dep in edges[m] if dep in member_set]
+                        cycles.append((members, cycle_edges))
+        return cycles
+
+
+def container_steps(container: Node) -> Tuple[FlowGraph, List[str], List[str], Optional[str]]:
+    """Schedule a container's own sub-nodes; returns (graph, order, blocked, output sub-node ID).
+
+    Nested containers are left to their own call, so each level is indexed once.
+    The output is the namespacesToOutput node, or else the last sub-node with
+    no successor inside the container.
+    """
+    sub_nodes = container.sub_nodes
+    graph = FlowGraph(sub_nodes, recursive=False)
+    order, blocked = graph.schedule(sub_nodes)
+    output = container.output_node if container.output_node in sub_nodes else None
+    if output is None:
+        sinks = [nid for nid in order if not any(s in sub_nodes for s in graph.successors.get(nid, []))]
+        output = sinks[-1] if sinks else None
+    return graph, order, blocked, output
@@ -0,0 +1,205 @@
+import sys
+from dataclasses import astuple, dataclass, field, is_dataclass
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# Tableau Prep node types the converter understands structurally
+LOAD_EXCEL = '.v1.LoadExcel'
+LOAD_CSV = '.v1.LoadCsv'
+WRITE_TO_HYPER = '.v1.WriteToHyper'
+CONTAINER = '.v1.Container'
+SUPER_JOIN = '.v2018_2_3.SuperJoin'
+SOURCE_TYPES = (LOAD_EXCEL, LOAD_CSV)
+
+# Shared read-only defaults; handed out through default_factory since dataclasses reject
+# mappingproxy defaults on some Python versions (3.11)
+_NO_SUB_NODES: Mapping[str, 'Node'] = MappingProxyType({})
+_NO_EXTRA: Mapping[str, object] = MappingProxyType({})
+
+# Flow JSON keys parse_node turns into Node attributes; every other key is kept in Node.extra
+MODELLED_KEYS = frozenset((
+    'id', 'nodeType', 'name', 'nextNodes', 'connectionId', 'relation', 'fields', 'columnName', 'expression',
+    'filterExpression', 'joinType', 'conditions', 'actionNode', 'groupByFields', 'aggregations', 'pivotType',
+    'pivotColumn', 'valueColumn', 'valueColumns', 'loomContainer', 'namespacesToInput', 'namespacesToOutput',
+))
+
+
+@dataclass(slots=True)
+class NextNode:
+    """Outgoing edge: the downstream node and the input port it feeds."""
+    node_id: str
+    namespace: str = 'Default'
+
+
+@dataclass(slots=True)
+class SourceField:
+    name: str
+    type: Optional[str] = None
+    ordinal: int = 0
+
+
+@dataclass(slots=True)
+class JoinCondition:
+    left: str
+    right: str
+    comparator: str = '=='
+
+
+@dataclass(slots=True)
+class Aggregation:
+    column: str
+    aggregation_type: str = 'Sum'
+    new_name: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Node:
+    """One Prep step, reduced to the attributes code generation reads.
+
+    Attributes that do not apply to a node type keep their (shared, immutable) defaults.
+    Flow JSON keys without an attribute (plugin node properties, annotations) are
+    kept read-only in extra.
+    """
+    id: str
+    node_type: str
+    name: str = ''
+    next_nodes: Tuple[NextNode, ...] = ()
+    # LoadExcel / LoadCsv
+    connection_id: Optional[str] = None
+    relation_table: Optional[str] = None
+    fields: Tuple[SourceField, ...] = ()
+    # AddColumn
+    column_name: Optional[str] = None
+    expression: Optional[str] = None
+    # Filter
+    filter_expression: Optional[str] = None
+    # SimpleJoin; a SuperJoin wraps one in `action`
+    join_type: str = 'inner'
+    conditions: Tuple[JoinCondition, ...] = ()
+    action: Optional['Node'] = None
+    # Aggregate
+    group_by: Tuple[str, ...] = ()
+    aggregations: Tuple[Aggregation, ...] = ()
+    # Pivot
+    pivot_type: str = 'columns'
+    pivot_column: str = ''
+    value_column: str = ''
+    value_columns: Tuple[str, ...] = ()
+    # Container
+    sub_nodes: Mapping[str, 'Node'] = field(default_factory=lambda: _NO_SUB_NODES)
+    initial_nodes: Tuple[str, ...] = ()
+    input_node: Optional[str] = None
+    output_node: Optional[str] = None
+    # Every other key of the node's flow JSON, frozen
+    extra: Mapping[str, object] = field(default_factory=lambda: _NO_EXTRA)
+
+    def content(self) -> tuple:
+        """Every attribute as nested tuples, for content hashing."""
+        return tuple(_content(getattr(self, name)) for name in self.__slots__)
+
+
+def _content(value):
+    if isinstance(value, Node):
+        return value.content()
+    if isinstance(value, Mapping):
+        return tuple((key, _content(item)) for key, item in value.items())
+    if isinstance(value, tuple):
+        return tuple(_content(item) for item in value)
+    if is_dataclass(value):
+        return astuple(value)
+    return value
+
+
+@dataclass(slots=True)
+class Connection:
+    id: str
+    connection_type: Optional[str] = None
+    filename: Optional[str] = None
+    connection_class: Optional[str] = None
+    directory: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Flow:
+    nodes: Dict[str, Node]
+    initial_nodes: List[str]
+    connections: Dict[str, Connection]
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _freeze(value):
+    """JSON value made read-only: objects become mapping proxies and arrays tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _port(ports: Optional[dict]) -> Optional[str]:
+    """Node ID behind the Default entry of a container's namespacesToInput/Output."""
+    target = (ports or {}).get('Default') or {}
+    return _intern(target.get('nodeId'))
+
+
+def parse_node(raw: dict, node_id: Optional[str] = None) -> Node:
+    """Build a Node from its flow JSON; keys without a Node attribute go to extra."""
+    get = raw.get
+    intern = sys.intern
+    node = Node(intern(get('id') or node_id or ''), intern(get('nodeType') or 'Unknown'), get('name') or '')
+    if get('nextNodes'):
+        node.next_nodes = tuple(NextNode(intern(nn['nextNodeId']), intern(nn.get('nextNamespace') or 'Default'))
+                                for nn in raw['nextNodes'] if nn.get('nextNodeId') is not None)
+    if get('connectionId') is not None:
+        node.connection_id = intern(raw['connectionId'])
+    if get('relation'):
+        node.relation_table = raw['relation'].get('table')
+    if get('fields'):
+        node.fields = tuple(SourceField(f['name'], f.get('type'), f.get('ordinal', 0)) for f in raw['fields'])
+    node.column_name = get('columnName')
+    node.expression = get('expression')
+    node.filter_expression = get('filterExpression')
+    if get('joinType'):
+        node.join_type = raw['joinType']
+    if get('conditions'):
+        node.conditions = tuple(JoinCondition(c['leftExpression'], c['rightExpression'], c.get('comparator', '=='))
+                                for c in raw['conditions'])
+    if get('actionNode') is not None:
+        node.action = parse_node(raw['actionNode'])
+    if get('groupByFields'):
+        node.group_by = tuple(raw['groupByFields'])
+    if get('aggregations'):
+        node.aggregations = tuple(Aggregation(a.get('column', ''), a.get('aggregationType', 'Sum'), a.get('newName'))
+                                  for a in raw['aggregations'])
+    if get('pivotColumn') is not None or get('valueColumn') is not None:
+        node.pivot_type = get('pivotType') or 'columns'
+        node.pivot_column = get('pivotColumn') or ''
+        node.value_column = get('valueColumn') or ''
+        node.value_columns = tuple(get('valueColumns') or ())
+    container = get('loomContainer')
+    if container:
+        node.sub_nodes = {intern(nid): parse_node(sub, nid) for nid, sub in (container.get('nodes') or {}).items()}
+        node.initial_nodes = tuple(intern(nid) for nid in container.get('initialNodes') or ())
+        node.input_node = _port(get('namespacesToInput'))
+        node.output_node = _port(get('namespacesToOutput'))
+    extra = {key: value for key, value in raw.items() if key not in MODELLED_KEYS}
+    if extra:
+        node.extra = _freeze(extra)
+    return node
+
+
+def parse_flow(raw: dict) -> Flow:
+    """Convert a loaded flow document into the compact model; raw can be discarded afterwards."""
+    connections = {}
+    for conn_id, conn in (raw.get('connections') or {}).items():
+        attributes = conn.get('connectionAttributes') or {}
+        connections[conn_id] = Connection(conn_id, conn.get('connectionType'), attributes.get('filename'),
+                                          attributes.get('class'), attributes.get('directory'))
+    return Flow(
+        nodes={_intern(nid): parse_node(node, nid) for nid, node in (raw.get('nodes') or {}).items()},
+        initial_nodes=[_intern(nid) for nid in raw.get('initialNodes') or []],
+        connections=connections,
+    )
@@ -0,0 +1,134 @@
+import importlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from m_ast import Steps
+
+# Installed packages add handlers with entry points in this group, named after
+# the nodeType they handle:
+#   [project.entry-points."mscript.handlers"]
+#   ".v1.CleanPhoneNumbers" = "acme_prep.handlers:handle_clean_phone_numbers"
+ENTRY_POINT_GROUP = 'mscript.handlers'
+
+# Handlers return m_ast statements (or, for older plugins, M text). A handler
+# whose output depends only on the node and its inputs can set `pure = True` on
+# itself; only such steps are merged with an identical earlier step.
+Handler = Callable[..., Steps]
+
+
+class HandlerRegistry:
+    """nodeType -> code generation handler.
+
+    Handlers can be registered directly or as 'module:function' targets that
+    are imported on first use of their node type. Plugins from the
+    ENTRY_POINT_GROUP entry points are discovered on the first lookup; they
+    replace built-in handlers for the same node type, but not handlers
+    registered directly with register().
+    """
+
+    def __init__(self, entry_point_group: Optional[str] = ENTRY_POINT_GROUP):
+        self._handlers: Dict[str, Handler] = {}
+        self._lazy: Dict[str, str] = {}
+        self._aliases: Dict[str, str] = {}
+        self._plugins: List[Tuple[str, str]] = []
+        self._entry_point_group = entry_point_group
+        self._discovered = entry_point_group is None
+
+    def register(self, node_type: str, handler: Optional[Handler] = None, aliases: Iterable[str] = ()):
+        """Register a handler for node_type; usable as a decorator when handler is omitted."""
+        def add(func: Handler) -> Handler:
+            self._lazy.pop(node_type, None)
+            self._handlers[node_type] = func
+            for alias in aliases:
+                self.alias(alias, node_type)
+            return func
+        return add(handler) if handler is not None else add
+
+    def register_lazy(self, node_type: str, target: str, aliases: Iterable[str] = ()):
+        """Register a 'module:function' handler that is only imported when first needed."""
+        if ':' not in target:
+            raise ValueError(f"Handler target must look like 'module:function', got {target!r}")
+        self._handlers.pop(node_type, None)
+        self._lazy[node_type] = target
+        for alias in aliases:
+            self.alias(alias, node_type)
+
+    def alias(self, alias: str, node_type: str):
+        """Dispatch alias (e.g. another flow-format version of a node type) to node_type's handler."""
+        if alias == node_type:
+            raise ValueError(f"Node type {node_type} cannot alias itself")
+        self._aliases[alias] = node_type
+
+    def _resolve(self, node_type: str) -> str:
+        if not self._discovered:
+            self.discover_plugins()
+        if node_type in self._handlers or node_type in self._lazy:
+            return node_type
+        return self._aliases.get(node_type, node_type)
+
+    def get(self, node_type: str) -> Optional[Handler]:
+        """Handler for node_type (following aliases), importing it if needed; None if unsupported."""
+        node_type = self._resolve(node_type)
+        handler = self._handlers.get(node_type)
+        if handler is None and node_type in self._lazy:
+            handler = self._load(node_type, self._lazy[node_type])
+        return handler
+
+    def __contains__(self, node_type: str) -> bool:
+        node_type = self._resolve(node_type)
+        return node_type in self._handlers or node_type in self._lazy
+
+    def node_types(self) -> List[str]:
+        """Every node type with a handler, aliases included."""
+        if not self._discovered:
+            self.discover_plugins()
+        return sorted(set(self._handlers) | set(self._lazy) | set(self._aliases))
+
+    def discover_plugins(self):
+        """Register (lazily) every handler advertised through the entry point group."""
+        self._discovered = True
+        if self._entry_point_group is None:
+            return
+        # Imported here so a plain CLI run does not pay for importlib.metadata up front
+        from importlib.metadata import entry_points
+        for ep in entry_points(group=self._entry_point_group):
+            if ep.name in self._handlers:
+                continue
+            self.register_lazy(ep.name, ep.value)
+            self._plugins.append((ep.name, ep.value))
+
+    def fingerprint(self) -> List[Tuple[str, str]]:
+        """Plugin handlers in use, so cached output is not reused after plugins change."""
+        if not self._discovered:
+            self.discover_plugins()
+        return sorted(self._plugins)
+
+    def _load(self, node_type: str, target: str) -> Handler:
+        module_name, _, attr = target.partition(':')
+        try:
+            handler = importlib.import_module(module_name)
+            for part in attr.split('.'):
+                handler = getattr(handler, part)
+        except (ImportError, AttributeError) as e:
+            raise RuntimeError(f"Cannot load handler {target} for {node_type}: {str(e)}")
+        del self._lazy[node_type]
+        self._handlers[node_type] = handler
+        return handler
+
+
+REGISTRY = HandlerRegistry()
+REGISTRY.register_lazy('.v1.SimpleJoin', 'node_handlers:handle_join')
+REGISTRY.register_lazy('.v1.AddColumn', 'node_handlers:handle_add_column')
+REGISTRY.register_lazy('.v1.Aggregate', 'node_handlers:handle_aggregate')
+REGISTRY.register_lazy('.v1.Union', 'node_handlers:handle_union')
+REGISTRY.register_lazy('.v1.Pivot', 'node_handlers:handle_pivot')
+REGISTRY.register_lazy('.v1.Filter', 'node_handlers:handle_filter')
+REGISTRY.register_lazy('.v1.Container', 'node_handlers:handle_container')
+REGISTRY.register_lazy('.v2018_2_3.SuperJoin', 'node_handlers:handle_super_join')
+
+
+def register(node_type: str, handler: Optional[Handler] = None, aliases: Iterable[str] = ()):
+    """Register a handler on the shared registry (see HandlerRegistry.register)."""
+    return REGISTRY.register(node_type, handler, aliases)
+
+
+def get_handler(node_type: str) -> Optional[Handler]:
+    return REGISTRY.get(node_type)
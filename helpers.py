@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache
+from typing import List, Tuple
 
 def sanitize_name(name: str) -> str:
     sanitized = re.sub(r'[^a-zA-Z0-9_]', '_', name)
@@ -6,30 +8,281 @@ def sanitize_name(name: str) -> str:
         sanitized = f"tbl_{sanitized}"
     return sanitized
 
+M_KEYWORDS = {
+    'and', 'as', 'each', 'else', 'error', 'false', 'if', 'in', 'is', 'let', 'meta', 'not', 'null',
+    'or', 'otherwise', 'section', 'shared', 'then', 'true', 'try', 'type',
+}
+
+def m_identifier(name: str) -> str:
+    """Quote a name as an M identifier, using #"..." when it is not a plain identifier."""
+    if re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*', name) and name not in M_KEYWORDS:
+        return name
+    return '#"' + name.replace('"', '""') + '"'
+
+# Tableau calculation tokens, tried in order; one compiled pass per expression.
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>//[^\n]*)
+  | (?P<string>"(?:[^"]|"")*"|'(?:[^']|'')*')
+  | (?P<field>\[(?:[^\]]|\]\])*\])
+  | (?P<date>\#[^#]*\#)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<op>==|!=|<>|<=|>=|&&|\|\||[-+*/<>=!(),])
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+""", re.VERBOSE)
+
+_OPERATORS = {'==': '=', '!=': '<>', '&&': 'and', '||': 'or', '!': 'not'}
+_KEYWORDS = {'AND': 'and', 'OR': 'or', 'NOT': 'not', 'TRUE': 'true', 'FALSE': 'false', 'NULL': 'null'}
+_SPACED = {'and', 'or', 'not', 'if', 'then', 'else'}
+
+# Tableau function name -> {arity: M template}
+_FUNCTIONS = {
+    'CONTAINS': {2: 'Text.Contains({0}, {1})'},
+    'STARTSWITH': {2: 'Text.StartsWith({0}, {1})'},
+    'ENDSWITH': {2: 'Text.EndsWith({0}, {1})'},
+    'UPPER': {1: 'Text.Upper({0})'},
+    'LOWER': {1: 'Text.Lower({0})'},
+    'LEN': {1: 'Text.Length({0})'},
+    'TRIM': {1: 'Text.Trim({0})'},
+    'LTRIM': {1: 'Text.TrimStart({0})'},
+    'RTRIM': {1: 'Text.TrimEnd({0})'},
+    'LEFT': {2: 'Text.Start({0}, {1})'},
+    'RIGHT': {2: 'Text.End({0}, {1})'},
+    'MID': {2: 'Text.Middle({0}, {1} - 1)', 3: 'Text.Middle({0}, {1} - 1, {2})'},
+    'REPLACE': {3: 'Text.Replace({0}, {1}, {2})'},
+    'FIND': {2: '(Text.PositionOf({0}, {1}) + 1)'},
+    'ABS': {1: 'Number.Abs({0})'},
+    'ROUND': {1: 'Number.Round({0})', 2: 'Number.Round({0}, {1})'},
+    'CEILING': {1: 'Number.RoundUp({0})'},
+    'FLOOR': {1: 'Number.RoundDown({0})'},
+    'SQRT': {1: 'Number.Sqrt({0})'},
+    'POWER': {2: 'Number.Power({0}, {1})'},
+    'EXP': {1: 'Number.Exp({0})'},
+    'LN': {1: 'Number.Ln({0})'},
+    'LOG': {1: 'Number.Log10({0})', 2: 'Number.Log({0}, {1})'},
+    'MIN': {2: 'List.Min({{{0}, {1}}})'},
+    'MAX': {2: 'List.Max({{{0}, {1}}})'},
+    'ISNULL': {1: '({0} = null)'},
+    'IFNULL': {2: '(if {0} = null then {1} else {0})'},
+    'ZN': {1: '(if {0} = null then 0 else {0})'},
+    'IIF': {3: '(if {0} then {1} else {2})'},
+    'INT': {1: 'Int64.From({0})'},
+    'FLOAT': {1: 'Number.From({0})'},
+    'STR': {1: 'Text.From({0})'},
+    'DATE': {1: 'Date.From({0})'},
+    'DATETIME': {1: 'DateTime.From({0})'},
+    'YEAR': {1: 'Date.Year({0})'},
+    'QUARTER': {1: 'Date.QuarterOfYear({0})'},
+    'MONTH': {1: 'Date.Month({0})'},
+    'WEEK': {1: 'Date.WeekOfYear({0})'},
+    'DAY': {1: 'Date.Day({0})'},
+    'TODAY': {0: 'Date.From(DateTime.LocalNow())'},
+    'NOW': {0: 'DateTime.LocalNow()'},
+}
+
+# Date-part functions take the part as a string literal first argument.
+_DATEPART = {
+    'year': 'Date.Year({0})', 'quarter': 'Date.QuarterOfYear({0})', 'month': 'Date.Month({0})',
+    'week': 'Date.WeekOfYear({0})', 'day': 'Date.Day({0})', 'dayofyear': 'Date.DayOfYear({0})',
+    'weekday': '(Date.DayOfWeek({0}) + 1)', 'hour': 'Time.Hour({0})', 'minute': 'Time.Minute({0})',
+    'second': 'Time.Second({0})',
+}
+_DATEADD = {
+    'year': 'Date.AddYears({1}, {0})', 'quarter': 'Date.AddQuarters({1}, {0})',
+    'month': 'Date.AddMonths({1}, {0})', 'week': 'Date.AddWeeks({1}, {0})', 'day': 'Date.AddDays({1}, {0})',
+}
+_DATETRUNC = {
+    'year': 'Date.StartOfYear({0})', 'quarter': 'Date.StartOfQuarter({0})', 'month': 'Date.StartOfMonth({0})',
+    'week': 'Date.StartOfWeek({0})', 'day': 'Date.From({0})',
+}
+_DATEDIFF = {
+    'day': 'Duration.Days({1} - {0})', 'week': 'Number.IntegerDivide(Duration.Days({1} - {0}), 7)',
+    'month': '((Date.Year({1}) - Date.Year({0})) * 12 + Date.Month({1}) - Date.Month({0}))',
+    'year': '(Date.Year({1}) - Date.Year({0}))',
+}
+_DATE_FUNCTIONS = {'DATEPART': _DATEPART, 'DATEADD': _DATEADD, 'DATETRUNC': _DATETRUNC, 'DATEDIFF': _DATEDIFF}
+
+
+def tokenize_expression(expr: str) -> List[Tuple[str, str, bool]]:
+    """Split a Tableau calculation into (kind, text, preceded_by_space) tokens."""
+    tokens = []
+    pos, spaced = 0, False
+    while pos < len(expr):
+        match = _TOKEN_RE.match(expr, pos)
+        if not match:
+            raise ValueError(f"Unexpected character {expr[pos]!r} at position {pos} in expression: {expr}")
+        kind = match.lastgroup
+        if kind in ('ws', 'comment'):
+            spaced = True
+        else:
+            tokens.append((kind, match.group(), spaced))
+            spaced = False
+        pos = match.end()
+    return tokens
+
+
+def _m_string(literal: str) -> str:
+    """Re-quote a Tableau string literal as an M text literal."""
+    quote = literal[0]
+    body = literal[1:-1].replace(quote * 2, quote)
+    return '"' + body.replace('"', '""') + '"'
+
+
+def _m_field(field: str) -> str:
+    """Render a Tableau [Field] reference as an M field access."""
+    name = field[1:-1].replace(']]', ']')
+    if re.fullmatch(r'[A-Za-z0-9_ .]+', name) and name == name.strip():
+        return f"[{name}]"
+    return '[#"' + name.replace('"', '""') + '"]'
+
+
+def _m_date(literal: str) -> str:
+    """Translate a #yyyy-mm-dd[ hh:mm:ss]# literal into #date/#datetime."""
+    match = re.fullmatch(r'#\s*(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?\s*#', literal)
+    if not match:
+        raise ValueError(f"Unsupported date literal {literal}")
+    year, month, day, hour, minute, second = match.groups()
+    if hour is None:
+        return f"#date({int(year)}, {int(month)}, {int(day)})"
+    return f"#datetime({int(year)}, {int(month)}, {int(day)}, {int(hour)}, {int(minute)}, {int(second or 0)})"
+
+
+class _Translator:
+    """Recursive-descent rewrite of a token list into M, one token at a time."""
+
+    def __init__(self, tokens: List[Tuple[str, str, bool]], expr: str):
+        self.tokens = tokens
+        self.expr = expr
+        self.pos = 0
+
+    def _peek(self) -> Tuple[str, str, bool]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ('eof', '', False)
+
+    def _keyword(self) -> str:
+        kind, text, _ = self._peek()
+        return text.upper() if kind == 'name' else text
+
+    def _expect(self, keyword: str):
+        if self._keyword() != keyword:
+            raise ValueError(f"Expected {keyword} in expression: {self.expr}")
+        self.pos += 1
+
+    def translate(self, stop=frozenset()) -> str:
+        """Translate tokens until one of the stop keywords is reached at this nesting level."""
+        out = ''
+        while self.pos < len(self.tokens) and self._keyword() not in stop:
+            kind, text, spaced = self._peek()
+            self.pos += 1
+            piece = self._piece(kind, text)
+            if out and (spaced or piece in _SPACED or out.rsplit(' ', 1)[-1] in _SPACED):
+                out += ' '
+            out += piece
+        return out
+
+    def _piece(self, kind: str, text: str) -> str:
+        if kind == 'string':
+            return _m_string(text)
+        if kind == 'field':
+            return _m_field(text)
+        if kind == 'date':
+            return _m_date(text)
+        if kind == 'number':
+            return text
+        if kind == 'op':
+            if text == '(':
+                inner = self.translate(frozenset({')'}))
+                self._expect(')')
+                return f"({inner})"
+            if text in (')', ','):
+                raise ValueError(f"Unbalanced {text!r} in expression: {self.expr}")
+            if text == '+' and self._is_text_concat():
+                return '&'
+            return _OPERATORS.get(text, text)
+        upper = text.upper()
+        if upper == 'IF':
+            return self._if()
+        if upper == 'CASE':
+            return self._case()
+        if upper in _KEYWORDS:
+            return _KEYWORDS[upper]
+        if self._keyword() == '(':
+            return self._call(upper)
+        raise ValueError(f"Unsupported identifier {text} in expression: {self.expr}")
+
+    def _is_text_concat(self) -> bool:
+        """Tableau overloads + for text; treat it as & next to a string literal."""
+        prev_kind = self.tokens[self.pos - 2][0] if self.pos >= 2 else None
+        return prev_kind == 'string' or self._peek()[0] == 'string'
+
+    def _if(self) -> str:
+        branches = []
+        condition = self.translate(frozenset({'THEN'}))
+        self._expect('THEN')
+        branches.append(f"if {condition} then {self.translate(frozenset({'ELSEIF', 'ELSE', 'END'}))}")
+        while self._keyword() == 'ELSEIF':
+            self.pos += 1
+            condition = self.translate(frozenset({'THEN'}))
+            self._expect('THEN')
+            branches.append(f"else if {condition} then {self.translate(frozenset({'ELSEIF', 'ELSE', 'END'}))}")
+        otherwise = 'null'
+        if self._keyword() == 'ELSE':
+            self.pos += 1
+            otherwise = self.translate(frozenset({'END'}))
+        self._expect('END')
+        return f"({' '.join(branches)} else {otherwise})"
+
+    def _case(self) -> str:
+        subject = self.translate(frozenset({'WHEN', 'ELSE', 'END'}))
+        branches = []
+        while self._keyword() == 'WHEN':
+            self.pos += 1
+            value = self.translate(frozenset({'THEN'}))
+            self._expect('THEN')
+            result = self.translate(frozenset({'WHEN', 'ELSE', 'END'}))
+            branches.append(f"if {subject} = {value} then {result}")
+        if not branches:
+            raise ValueError(f"CASE without WHEN in expression: {self.expr}")
+        otherwise = 'null'
+        if self._keyword() == 'ELSE':
+            self.pos += 1
+            otherwise = self.translate(frozenset({'END'}))
+        self._expect('END')
+        return f"({' else '.join(branches)} else {otherwise})"
+
+    def _call(self, name: str) -> str:
+        self._expect('(')
+        raw_args = []
+        args = []
+        if self._keyword() != ')':
+            while True:
+                raw_args.append(self._peek())
+                args.append(self.translate(frozenset({',', ')'})))
+                if self._keyword() != ',':
+                    break
+                self.pos += 1
+        self._expect(')')
+
+        if name in _DATE_FUNCTIONS:
+            kind, text, _ = raw_args[0] if raw_args else ('eof', '', False)
+            part = text[1:-1].lower() if kind == 'string' else ''
+            template = _DATE_FUNCTIONS[name].get(part)
+            if template is None:
+                raise ValueError(f"Unsupported {name} part {text or '?'} in expression: {self.expr}")
+            return template.format(*args[1:])
+        templates = _FUNCTIONS.get(name)
+        if templates is None:
+            raise ValueError(f"Unsupported function {name} in expression: {self.expr}")
+        template = templates.get(len(args))
+        if template is None:
+            raise ValueError(f"{name} does not take {len(args)} argument(s) in expression: {self.expr}")
+        return template.format(*args)
+
+
+@lru_cache(maxsize=4096)
 def translate_expression(expr: str) -> str:
-    return (expr.replace('==', '=')
-                .replace('&&', ' and ')
-                .replace('||', ' or ')
-                .replace('!', 'not ')
-                .replace('[', '[') 
-                .replace(']', ']'))
-
-def detect_column_type(node: dict) -> str:
-    col_name = node.get('columnName', '').lower()
-    expression = node.get('expression', '').lower()
-    if expression:
-        if '*' in expression and all('[' in part and ']' in part for part in expression.split('*')):
-            if any(kw in col_name for kw in ['quantity', 'count', 'order', 'num', 'revenue']):
-                return "Int64.Type"
-            return "type number"
-        if any(op in expression for op in ['+', '-', '*', '/']) or '[' in expression:
-            return "type number"
-        if '"' in expression or "'" in expression or '+' in expression:
-            return "type text"
-    if any(kw in col_name for kw in ['amount', 'price', 'cost', 'value', 'total']):
-        return "type number"
-    elif any(kw in col_name for kw in ['date', 'time', 'year', 'month', 'day']):
-        return "type datetime"
-    elif any(kw in col_name for kw in ['flag', 'is_', 'has_']):
-        return "type logical"
-    return "type any"
\ No newline at end of file
+    """Translate a Tableau calculation into an M expression (memoized per expression text)."""
+    translator = _Translator(tokenize_expression(expr), expr)
+    result = translator.translate()
+    if translator.pos != len(translator.tokens):
+        raise ValueError(f"Unexpected {translator.tokens[translator.pos][1]!r} in expression: {expr}")
+    return result
@@ -0,0 +1,227 @@
+from abc import ABC, abstractmethod
+from typing import List, Sequence, Tuple, Union
+from helpers import m_identifier
+
+# Minimal M syntax tree. Handlers return statements built from these nodes and
+# emit() prints them; quoting, #"..." identifiers and indentation live only here.
+
+INDENT = '    '
+
+
+class Expr(ABC):
+    __slots__ = ()
+
+    @abstractmethod
+    def write(self, out: List[str], depth: int):
+        """Append this node's M text to out; depth is the indentation level of the enclosing line."""
+
+
+class Identifier(Expr):
+    """A step, parameter or library name such as JoinKind.Inner; quoted as #"..." when needed."""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def write(self, out: List[str], depth: int):
+        out.append(m_identifier(self.name))
+
+
+class Text(Expr):
+    """A text literal."""
+    __slots__ = ('value',)
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def write(self, out: List[str], depth: int):
+        out.append('"' + self.value.replace('"', '""') + '"')
+
+
+class Verbatim(Expr):
+    """M that is already rendered, such as a translated Tableau calculation or a type."""
+    __slots__ = ('code',)
+
+    def __init__(self, code: str):
+        self.code = code
+
+    def write(self, out: List[str], depth: int):
+        out.append(self.code)
+
+
+class Call(Expr):
+    """function(args); broken puts one argument per line."""
+    __slots__ = ('function', 'args', 'broken')
+
+    def __init__(self, function: str, args: Sequence[Expr], broken: bool = False):
+        self.function = function
+        self.args = tuple(args)
+        self.broken = broken
+
+    def write(self, out: List[str], depth: int):
+        out.append(m_identifier(self.function))
+        _write_items(out, depth, self.args, '(', ')', self.broken)
+
+
+class ListExpr(Expr):
+    """{items}"""
+    __slots__ = ('items', 'broken')
+
+    def __init__(self, items: Sequence[Expr], broken: bool = False):
+        self.items = tuple(items)
+        self.broken = broken
+
+    def write(self, out: List[str], depth: int):
+        _write_items(out, depth, self.items, '{', '}', self.broken)
+
+
+class Record(Expr):
+    """[name = value, ...]"""
+    __slots__ = ('fields', 'broken')
+
+    def __init__(self, fields: Sequence[Tuple[str, Expr]], broken: bool = False):
+        self.fields = tuple(_Field(name, value) for name, value in fields)
+        self.broken = broken
+
+    def write(self, out: List[str], depth: int):
+        _write_items(out, depth, self.fields, '[', ']', self.broken)
+
+
+class RecordType(Record):
+    """type [name = type, ...]; the field values are types."""
+    __slots__ = ()
+
+    def write(self, out: List[str], depth: int):
+        out.append('type ')
+        Record.write(self, out, depth)
+
+
+class _Field(Expr):
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: str, value: Expr):
+        self.name = name
+        self.value = value
+
+    def write(self, out: List[str], depth: int):
+        out.append(m_identifier(self.name) + ' = ')
+        self.value.write(out, depth)
+
+
+class Each(Expr):
+    """each body, a one-argument function over _ (a row, for table functions)."""
+    __slots__ = ('body',)
+
+    def __init__(self, body: Expr):
+        self.body = body
+
+    def write(self, out: List[str], depth: int):
+        out.append('each ')
+        self.body.write(out, depth)
+
+
+def _write_items(out: List[str], depth: int, items: Sequence[Expr], open_: str, close: str, broken: bool):
+    out.append(open_)
+    if broken and items:
+        separator = '\n' + INDENT * (depth + 1)
+        for i, item in enumerate(items):
+            out.append(separator if not i else ',' + separator)
+            item.write(out, depth + 1)
+        out.append('\n' + INDENT * depth + close)
+        return
+    for i, item in enumerate(items):
+        if i:
+            out.append(', ')
+        item.write(out, depth)
+    out.append(close)
+
+
+class Statement(ABC):
+    __slots__ = ()
+
+    @abstractmethod
+    def write(self, out: List[str], depth: int):
+        """Append this statement's M text, indented depth levels, to out."""
+
+
+class Binding(Statement):
+    """name = value inside a let; final leaves off the comma before `in`."""
+    __slots__ = ('name', 'value', 'final')
+
+    def __init__(self, name: str, value: Expr, final: bool = False):
+        self.name = name
+        self.value = value
+        self.final = final
+
+    def write(self, out: List[str], depth: int):
+        out.append(INDENT * depth + m_identifier(self.name) + ' = ')
+        self.value.write(out, depth)
+        if not self.final:
+            out.append(',')
+
+
+class Shared(Statement):
+    """shared name = value; at section level."""
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: str, value: Expr):
+        self.name = name
+        self.value = value
+
+    def write(self, out: List[str], depth: int):
+        out.append(INDENT * depth + 'shared ' + m_identifier(self.name) + ' = ')
+        self.value.write(out, depth)
+        out.append(';')
+
+
+class Comment(Statement):
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def write(self, out: List[str], depth: int):
+        out.append(INDENT * depth + '// ' + self.text)
+
+
+class Raw(Statement):
+    """Lines of M written as given, indented to the enclosing depth (also wraps handlers that return text)."""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def write(self, out: List[str], depth: int):
+        prefix = INDENT * depth
+        out.append('\n'.join(prefix + line if line else line for line in self.text.split('\n')))
+
+
+Steps = Union[Statement, str, Sequence[Union[Statement, str]], None]
+
+NULL = Verbatim('null')
+TRUE = Verbatim('true')
+
+
+def as_statements(steps: Steps) -> List[Statement]:
+    """Handler output as a list of statements; plain text (older plugin handlers) becomes Raw."""
+    if steps is None:
+        return []
+    if isinstance(steps, (Statement, str)):
+        steps = (steps,)
+    return [Raw(step) if isinstance(step, str) else step for step in steps]
+
+
+def emit(steps: Steps, depth: int = 1) -> str:
+    """Render statements as M, one per line, indented depth levels."""
+    out: List[str] = []
+    for i, step in enumerate(as_statements(steps)):
+        if i:
+            out.append('\n')
+        step.write(out, depth)
+    return ''.join(out)
+
+
+def text_list(values: Sequence[str]) -> ListExpr:
+    """{"a", "b"} from column names."""
+    return ListExpr([Text(value) for value in values])
+
@@ -1,161 +1,285 @@
-from typing import List
-from helpers import sanitize_name, translate_expression, detect_column_type
+from dataclasses import replace
+from typing import List, Optional, Tuple
+from flow_graph import container_steps
+from handler_registry import get_handler
+from flow_model import Node
+from helpers import sanitize_name, translate_expression
+from m_ast import (Binding, Call, Comment, Each, Identifier, ListExpr, Record, RecordType, Statement, Text, Verbatim,
+                   as_statements, text_list)
+from optimizer import field_references
+from schema import SMALL_TABLE_ROWS, UNKNOWN, Schema, infer_expression_type, output_schema
 
-def handle_join(node: dict, upstream_tables: List[str]) -> str:
+# Temporary column holding the record of columns a fused run of AddColumn steps computes
+FUSED_COLUMN = 'Fused.Columns'
+# Step types container runs can fuse, when their registered handler is marked `fusable`
+FUSABLE_TYPES = ('.v1.AddColumn', '.v1.Filter')
+
+
+def join_algorithm(left: Schema, right: Schema, left_keys: List[str], right_keys: List[str]) -> Optional[str]:
+    """JoinAlgorithm for Table.Join from the inputs' statistics, or None to leave it to Power Query."""
+    if left.sorted_by and right.sorted_by and \
+            list(left.sorted_by[:len(left_keys)]) == left_keys and list(right.sorted_by[:len(right_keys)]) == right_keys:
+        return 'SortMerge'
+    # Hash the side that is known to be small, streaming the other one
+    left_small = left.rows is not None and left.rows <= SMALL_TABLE_ROWS
+    right_small = right.rows is not None and right.rows <= SMALL_TABLE_ROWS
+    if right_small and (not left_small or right.rows <= left.rows):
+        return 'RightHash'
+    if left_small:
+        return 'LeftHash'
+    return None
+
+
+def handle_join(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> List[Statement]:
     if len(upstream_tables) != 2:
         raise ValueError(f"Join operation requires exactly 2 inputs, got {len(upstream_tables)}")
     left, right = upstream_tables
-    conditions = [(c['leftExpression'].strip('[]'), c['rightExpression'].strip('[]'))
-                  for c in node.get('conditions', [])]
+    conditions = [(c.left.strip('[]'), c.right.strip('[]')) for c in node.conditions]
     if not conditions:
         raise ValueError("Join operation requires at least one condition")
-    return (
-        f"{sanitize_name(node['name'])} = Table.Join(\n"
-        f"    {left},\n"
-        f"    {{{', '.join([f'\"{c[0]}\"' for c in conditions])}}},\n"
-        f"    {right},\n"
-        f"    {{{', '.join([f'\"{c[1]}\"' for c in conditions])}}},\n"
-        f"    JoinKind.{node.get('joinType', 'inner').capitalize()}\n"
-        "),"
-    )
-
-def handle_add_column(node: dict, upstream_tables: List[str]) -> str:
+    left_schema, right_schema = upstream_schemas if upstream_schemas and len(upstream_schemas) == 2 else (UNKNOWN, UNKNOWN)
+    steps: List[Statement] = []
+    for left_key, right_key in conditions:
+        left_type, right_type = left_schema.type_of(left_key), right_schema.type_of(right_key)
+        if 'type any' not in (left_type, right_type) and left_type != right_type:
+            steps.append(Comment(f"Warning: join keys {left_key} ({left_type}) and {right_key} ({right_type}) "
+                                 "have different types, so rows will not match"))
+    left_keys, right_keys = [c[0] for c in conditions], [c[1] for c in conditions]
+    args = [Identifier(left), text_list(left_keys), Identifier(right), text_list(right_keys),
+            Identifier(f"JoinKind.{node.join_type.capitalize()}")]
+    algorithm = join_algorithm(left_schema, right_schema, left_keys, right_keys)
+    if algorithm:
+        args.append(Identifier(f"JoinAlgorithm.{algorithm}"))
+    steps.append(Binding(sanitize_name(node.name), Call('Table.Join', args, broken=True)))
+    return steps
+
+def handle_add_column(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> Binding:
     if len(upstream_tables) != 1:
         raise ValueError(f"AddColumn requires exactly 1 input, got {len(upstream_tables)}")
-    if 'columnName' not in node or 'expression' not in node:
+    if node.column_name is None or node.expression is None:
         raise ValueError("AddColumn node missing required properties")
-    return (
-        f"{sanitize_name(node['name'])} = Table.AddColumn(\n"
-        f"    {upstream_tables[0]},\n"
-        f"    \"{node['columnName']}\",\n"
-        f"    each {translate_expression(node['expression'])},\n"
-        f"    {detect_column_type(node)}\n"
-        "),"
-    )
-
-def handle_aggregate(node: dict, upstream_tables: List[str]) -> str:
+    schema = upstream_schemas[0] if upstream_schemas else UNKNOWN
+    return Binding(sanitize_name(node.name), Call('Table.AddColumn', [
+        Identifier(upstream_tables[0]),
+        Text(node.column_name),
+        Each(Verbatim(translate_expression(node.expression))),
+        Verbatim(infer_expression_type(node.expression, schema)),
+    ], broken=True))
+
+def handle_aggregate(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> Binding:
     if len(upstream_tables) != 1:
         raise ValueError(f"Aggregate requires exactly 1 input, got {len(upstream_tables)}")
-    groups = [f.strip('[]') for f in node.get('groupByFields', [])]
+    groups = [f.strip('[]') for f in node.group_by]
     aggregations = []
-    for agg in node.get('aggregations', []):
-        agg_type = agg.get('aggregationType', 'Sum').capitalize()
-        column = agg.get('column', '').strip('[]')
-        new_name = agg.get('newName', f"{column}_{agg_type.lower()}")
-        aggregations.append(f"{{ \"{column}\", List.{agg_type}, \"{new_name}\" }}")
+    for agg in node.aggregations:
+        agg_type = agg.aggregation_type.capitalize()
+        column = agg.column.strip('[]')
+        new_name = agg.new_name or f"{column}_{agg_type.lower()}"
+        aggregations.append(ListExpr([Text(column), Identifier(f"List.{agg_type}"), Text(new_name)]))
     if not groups and not aggregations:
         raise ValueError("Aggregate operation requires groupByFields or aggregations")
-    return (
-        f"{sanitize_name(node['name'])} = Table.Group(\n"
-        f"    {upstream_tables[0]},\n"
-        f"    {{{', '.join([f'\"{g}\"' for g in groups])}}},\n"
-        f"    {{{', '.join(aggregations)}}}\n"
-        "),"
-    )
-
-def handle_union(node: dict, upstream_tables: List[str]) -> str:
+    schema = upstream_schemas[0] if upstream_schemas else UNKNOWN
+    args = [Identifier(upstream_tables[0]), text_list(groups), ListExpr(aggregations)]
+    # Input already sorted on the keys: each group is one run of rows, so group locally
+    if schema.sorted_on(groups):
+        args.append(Identifier('GroupKind.Local'))
+    return Binding(sanitize_name(node.name), Call('Table.Group', args, broken=True))
+
+def handle_union(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> Binding:
     if len(upstream_tables) < 2:
         raise ValueError(f"Union requires at least 2 inputs, got {len(upstream_tables)}")
-    return (
-        f"{sanitize_name(node['name'])} = Table.Combine(\n"
-        f"    {{{', '.join(upstream_tables)}}}\n"
-        "),"
-    )
+    return Binding(sanitize_name(node.name), Call('Table.Combine', [
+        ListExpr([Identifier(table) for table in upstream_tables]),
+    ], broken=True))
 
-def handle_pivot(node: dict, upstream_tables: List[str]) -> str:
+def handle_pivot(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> Binding:
     if len(upstream_tables) != 1:
         raise ValueError(f"Pivot requires exactly 1 input, got {len(upstream_tables)}")
-    pivot_col = node.get('pivotColumn', '').strip('[]')
-    value_col = node.get('valueColumn', '').strip('[]')
-    pivot_type = node.get('pivotType', 'columns')
+    pivot_col = node.pivot_column.strip('[]')
+    value_col = node.value_column.strip('[]')
+    pivot_type = node.pivot_type
     if not pivot_col or not value_col:
         raise ValueError("Pivot operation requires pivotColumn and valueColumn")
+    table = Identifier(upstream_tables[0])
     if pivot_type == 'columns':
-        return (
-            f"{sanitize_name(node['name'])} = Table.Pivot(\n"
-            f"    Table.Distinct(Table.SelectColumns({upstream_tables[0]}, \"{pivot_col}\")),\n"
-            f"    {upstream_tables[0]}[[{pivot_col}]],\n"
-            f"    \"{pivot_col}\",\n"
-            f"    \"{value_col}\",\n"
-            "    List.Sum\n"
-            "),"
-        )
+        # The new columns are the distinct pivot values, read in one pass over the column
+        call = Call('Table.Pivot', [
+            table,
+            Call('List.Distinct', [Call('Table.Column', [table, Text(pivot_col)])]),
+            Text(pivot_col),
+            Text(value_col),
+            Identifier('List.Sum'),
+        ], broken=True)
     else:
-        return (
-            f"{sanitize_name(node['name'])} = Table.Unpivot(\n"
-            f"    {upstream_tables[0]},\n"
-            f"    {node.get('valueColumns', {})},\n"
-            f"    \"{pivot_col}\",\n"
-            f"    \"{value_col}\"\n"
-            "),"
-        )
-
-def handle_filter(node: dict, upstream_tables: List[str]) -> str:
+        call = Call('Table.Unpivot', [
+            table,
+            text_list([c.strip('[]') for c in node.value_columns]),
+            Text(pivot_col),
+            Text(value_col),
+        ], broken=True)
+    return Binding(sanitize_name(node.name), call)
+
+def handle_filter(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> Binding:
     if len(upstream_tables) != 1:
         raise ValueError(f"Filter requires exactly 1 input, got {len(upstream_tables)}")
-    condition = node.get('filterExpression', '')
+    condition = node.filter_expression
     if not condition:
         raise ValueError("Filter operation requires filterExpression")
-    return (
-        f"{sanitize_name(node['name'])} = Table.SelectRows(\n"
-        f"    {upstream_tables[0]},\n"
-        f"    each {translate_expression(condition)}\n"
-        "),"
-    )
-
-def handle_container(node: dict, upstream_tables: List[str]) -> str:
+    return Binding(sanitize_name(node.name), Call('Table.SelectRows', [
+        Identifier(upstream_tables[0]),
+        Each(Verbatim(translate_expression(condition))),
+    ], broken=True))
+
+def handle_container(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> List[Statement]:
     """Handle container nodes by processing sub-nodes in loomContainer."""
     if len(upstream_tables) != 1:
         raise ValueError(f"Container requires exactly 1 input, got {len(upstream_tables)}")
-    container_name = sanitize_name(node['name'])
+    container_name = sanitize_name(node.name)
     upstream_table = upstream_tables[0]
 
     # Check for sub-nodes in loomContainer
-    container_data = node.get('loomContainer', {})
-    sub_nodes = container_data.get('nodes', {})
+    sub_nodes = node.sub_nodes
     
     if not sub_nodes:
         # No sub-nodes, just pass through the upstream table
-        return (
-            f"// Container: {container_name}\n"
-            f"{container_name} = {upstream_table},"
-        )
-
-    # Process sub-nodes (e.g., AddColumn in Clean 6)
-    handlers = {
-        '.v1.SimpleJoin': handle_join,
-        '.v1.AddColumn': handle_add_column,
-        '.v1.Aggregate': handle_aggregate,
-        '.v1.Union': handle_union,
-        '.v1.Pivot': handle_pivot,
-        '.v1.Filter': handle_filter,
-        '.v2018_2_3.SuperJoin': handle_super_join
-    }
-    
-    transformations = []
-    current_table = upstream_table
-    
-    for sub_node_id, sub_node in sub_nodes.items():
-        sub_node_type = sub_node.get('nodeType', 'Unknown')
-        handler = handlers.get(sub_node_type)
+        return [Comment(f"Container: {container_name}"), Binding(container_name, Identifier(upstream_table))]
+
+    # Expand sub-nodes in dependency order; entry steps read the container's input
+    graph, order, blocked, output_id = container_steps(node)
+    transformations: List[Statement] = [Comment(f"Container: {container_name}")]
+    tables = {}
+    schemas = {}
+    input_schema = upstream_schemas[0] if upstream_schemas else UNKNOWN
+
+    position = 0
+    while position < len(order):
+        sub_node_id = order[position]
+        sub_node = sub_nodes[sub_node_id]
+        deps = graph.predecessors.get(sub_node_id)
+        inputs = [tables[d] for d in deps] if deps else [upstream_table]
+        input_schemas = [schemas[d] for d in deps] if deps else [input_schema]
+        end = _fusion_run(node, graph, order, position)
+        if end - position > 1:
+            # Consecutive row-wise steps become one pass over the table
+            run = [sub_nodes[nid] for nid in order[position:end]]
+            steps, result = _fuse(run, inputs[0], input_schemas[0])
+            transformations.extend(steps)
+            schema = input_schemas[0]
+            for nid, step in zip(order[position:end], run):
+                schema = output_schema(step, [schema])
+                tables[nid] = result
+                schemas[nid] = schema
+            position = end
+            continue
+        position += 1
+        handler = get_handler(sub_node.node_type)
         if not handler:
-            transformations.append(f"// Warning: No handler for sub-node type {sub_node_type} in {container_name}")
+            transformations.append(Comment(f"Warning: No handler for sub-node type {sub_node.node_type} in {container_name}"))
+            # Let downstream steps read straight through the unsupported one
+            tables[sub_node_id] = inputs[0]
+            schemas[sub_node_id] = input_schemas[0]
             continue
-        
-        # Generate M code for the sub-node
-        sub_node_code = handler(sub_node, [current_table])
-        transformations.append(sub_node_code)
-        # Update current_table to the result of this transformation
-        current_table = sanitize_name(sub_node['name'])
-    
+
+        transformations.extend(as_statements(handler(sub_node, inputs, input_schemas)))
+        tables[sub_node_id] = sanitize_name(sub_node.name)
+        schemas[sub_node_id] = output_schema(sub_node, input_schemas)
+
+    if blocked:
+        names = ', '.join(sub_nodes[nid].name or nid for nid in blocked)
+        transformations.append(Comment(f"Error: Circular dependency inside {container_name}: {names}"))
+
     # Combine transformations into the container output
-    return (
-        f"// Container: {container_name}\n"
-        + "\n".join(transformations) + f"\n{container_name} = {current_table},"
-    )
+    transformations.append(Binding(container_name, Identifier(tables.get(output_id, upstream_table))))
+    return transformations
 
-def handle_super_join(node: dict, upstream_tables: List[str]) -> str:
-    if 'actionNode' not in node:
+def _fusion_run(container: Node, graph, order: List[str], start: int) -> int:
+    """End (exclusive) of the chain of AddColumn/Filter steps from order[start] that can be fused.
+
+    Filters may only read columns that exist before the run, so they can all be
+    applied first; an AddColumn may not read a column added earlier in the run,
+    since those only exist once the run's record is expanded.
+    """
+    sub_nodes = container.sub_nodes
+    added = set()
+    filters = adds = 0
+    end = start
+    while end < len(order):
+        nid = order[end]
+        step = sub_nodes[nid]
+        # A plugin replacing a built-in handler decides for itself how its steps look, unless it
+        # declares they look like the built-in ones (wrappers made with functools.wraps keep the flag)
+        if step.node_type not in FUSABLE_TYPES or not getattr(get_handler(step.node_type), 'fusable', False):
+            break
+        if end > start:
+            previous = order[end - 1]
+            followers = [s for s in graph.successors.get(previous, []) if s in sub_nodes]
+            if graph.predecessors.get(nid) != [previous] or followers != [nid]:
+                break
+        expression = step.filter_expression if step.node_type == '.v1.Filter' else step.expression
+        refs = field_references(expression) if expression else None
+        if refs is None or refs & added:
+            break
+        if step.node_type == '.v1.Filter':
+            filters += 1
+        else:
+            # Fields are in scope inside the record, so names that could shadow _ or a
+            # library function such as Date.Month are left unfused
+            if step.column_name is None or step.column_name in added or step.column_name == '_' \
+                    or '.' in step.column_name:
+                break
+            added.add(step.column_name)
+            adds += 1
+        end += 1
+    # Only worth it when the run ends up with fewer passes than steps
+    return end if (filters > 0) + (adds > 0) < end - start else start + 1
+
+def _fuse(run: List[Node], table: str, schema: Schema) -> Tuple[List[Statement], str]:
+    """Steps for a fusable run: its filters as one SelectRows, then its new columns as one record AddColumn.
+
+    Returns the statements and the name of the binding that holds the run's result.
+    """
+    filters = [step for step in run if step.node_type == '.v1.Filter']
+    adds = [step for step in run if step.node_type == '.v1.AddColumn']
+    # Filters read only columns from before the run, so moving them ahead of new columns keeps the result
+    hoisted = any(step.node_type == '.v1.Filter' for step in run[run.index(adds[0]):]) if adds else False
+    names = [step.name for step in run]
+    if len(names) > 6:
+        names = names[:3] + ['...'] + names[-2:]
+    steps: List[Statement] = [Comment(f"Fused {len(run)} steps: {', '.join(names)}"
+                                      + (" (filters applied first)" if hoisted else ""))]
+    if len(filters) == 1:
+        steps.append(handle_filter(filters[0], [table]))
+    elif filters:
+        condition = ' and '.join(f"({translate_expression(step.filter_expression)})" for step in filters)
+        steps.append(Binding(sanitize_name(filters[-1].name),
+                             Call('Table.SelectRows', [Identifier(table), Each(Verbatim(condition))], broken=True)))
+    if filters:
+        table = sanitize_name(filters[-1].name)
+    if len(adds) == 1:
+        steps.append(handle_add_column(adds[0], [table], [schema]))
+        table = sanitize_name(adds[0].name)
+    elif adds:
+        name = sanitize_name(adds[-1].name)
+        values = [(step.column_name, Verbatim(translate_expression(step.expression))) for step in adds]
+        # Field types in a record type are written without the leading `type`
+        types = [(step.column_name, Verbatim(infer_expression_type(step.expression, schema).replace('type ', '', 1)))
+                 for step in adds]
+        steps.append(Binding(f"{name}_Fused", Call('Table.AddColumn', [
+            Identifier(table), Text(FUSED_COLUMN), Each(Record(values, broken=True)), RecordType(types),
+        ], broken=True)))
+        steps.append(Binding(name, Call('Table.ExpandRecordColumn', [
+            Identifier(f"{name}_Fused"), Text(FUSED_COLUMN), text_list([step.column_name for step in adds]),
+        ], broken=True)))
+        table = name
+    return steps, table
+
+def handle_super_join(node: Node, upstream_tables: List[str], upstream_schemas: Optional[List[Schema]] = None) -> List[Statement]:
+    if node.action is None:
         raise ValueError("SuperJoin node missing actionNode")
-    # Process the internal join node
-    return handle_join(node['actionNode'], upstream_tables)
+    # Process the internal join node, bound under the SuperJoin's own name as downstream steps expect
+    return handle_join(replace(node.action, name=node.name), upstream_tables, upstream_schemas)
+
+handle_add_column.fusable = handle_filter.fusable = True
+for _handler in (handle_join, handle_add_column, handle_aggregate, handle_union, handle_pivot, handle_filter,
+                 handle_container, handle_super_join):
+    _handler.pure = True
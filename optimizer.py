@@ -0,0 +1,375 @@
+import re
+from dataclasses import astuple, is_dataclass, replace
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
+from flow_graph import FlowGraph, container_steps
+from flow_model import SOURCE_TYPES, NextNode, Node
+from helpers import tokenize_expression
+from schema import UNKNOWN, Schema, output_schema, source_schema
+
+JOIN_TYPES = ('.v1.SimpleJoin', '.v2018_2_3.SuperJoin')
+# Which join inputs a row filter may be pushed into without changing the result
+PUSHABLE_JOIN_SIDES = {'inner': (0, 1), 'left': (0,), 'right': (1,)}
+
+# Marker for "every column of the table is needed"
+ALL = None
+
+
+class PushdownPlan:
+    """Projection and row-filter pushdown decisions for one flow."""
+    __slots__ = ('source_columns', 'source_filters', 'removed', 'rewritten')
+
+    def __init__(self):
+        # Source node ID -> columns to keep, in sheet order
+        self.source_columns: Dict[str, List[str]] = {}
+        # Source node ID -> Tableau filter expressions applied while loading
+        self.source_filters: Dict[str, List[str]] = {}
+        # Node ID -> note; the node is emitted as an alias of its input
+        self.removed: Dict[str, str] = {}
+        # Node ID -> replacement node (merged filters, containers with absorbed steps)
+        self.rewritten: Dict[str, Node] = {}
+
+
+def field_references(expr: str) -> Optional[Set[str]]:
+    """Column names referenced by a Tableau calculation, or None if it cannot be parsed."""
+    try:
+        tokens = tokenize_expression(expr)
+    except ValueError:
+        return None
+    return {text[1:-1].replace(']]', ']') for kind, text, _ in tokens if kind == 'field'}
+
+
+def _chain(container: Node) -> Optional[List[str]]:
+    """A container's sub-node IDs in order if they form one linear chain, else None."""
+    graph, order, blocked, _ = container_steps(container)
+    if blocked:
+        return None
+    entries = 0
+    for nid in order:
+        preds = graph.predecessors.get(nid, [])
+        succs = [s for s in graph.successors.get(nid, []) if s in container.sub_nodes]
+        if len(preds) > 1 or len(succs) > 1:
+            return None
+        entries += not preds
+    return order if entries <= 1 else None
+
+
+def _join_node(node: Node) -> Node:
+    if node.node_type == '.v2018_2_3.SuperJoin':
+        return node.action or Node(node.id, '.v1.SimpleJoin')
+    return node
+
+
+class _Planner:
+    def __init__(self, graph: FlowGraph, order: List[str]):
+        self.graph = graph
+        self.order = order
+        self.plan = PushdownPlan()
+        self.schemas: Dict[str, Schema] = {}
+        for nid, node in graph.nodes.items():
+            if node.node_type in SOURCE_TYPES:
+                self.schemas[nid] = source_schema(node)
+        for nid in order:
+            inputs = [self.schemas.get(dep, UNKNOWN) for dep in graph.dependencies(nid)]
+            self.schemas[nid] = output_schema(graph.nodes[nid], inputs)
+
+    def _single_input(self, node_id: str) -> Optional[str]:
+        deps = self.graph.dependencies(node_id)
+        return deps[0] if len(deps) == 1 else None
+
+    def _transparent(self, node: Node, refs: Set[str]) -> bool:
+        """True if a row filter on refs gives the same rows before or after this step."""
+        node_type = node.node_type
+        if node_type == '.v1.Filter':
+            return True
+        if node_type == '.v1.AddColumn':
+            return node.column_name not in refs
+        if node_type == '.v1.Container':
+            return all(self._transparent(sub, refs) for sub in node.sub_nodes.values())
+        return False
+
+    def _push_target(self, start: Optional[str], refs: Set[str]) -> Optional[str]:
+        """Follow single-consumer steps upstream from start; return the source a filter on refs can move to."""
+        current = start
+        while current is not None:
+            node = self.graph.nodes.get(current)
+            if node is None or len(self.graph.successors.get(current, [])) != 1:
+                return None
+            node_type = node.node_type
+            if node_type in SOURCE_TYPES:
+                schema = self.schemas[current]
+                return current if refs <= set(schema.columns) else None
+            if node_type in JOIN_TYPES:
+                current = self._join_side(current, refs)
+                continue
+            if current not in self.plan.removed and not self._transparent(node, refs):
+                return None
+            current = self._single_input(current)
+        return None
+
+    def _join_side(self, join_id: str, refs: Set[str]) -> Optional[str]:
+        """The join input that alone provides refs, if the join type allows filtering it."""
+        deps = self.graph.dependencies(join_id)
+        if len(deps) != 2:
+            return None
+        sides = [self.schemas.get(dep, UNKNOWN) for dep in deps]
+        if not all(s.complete for s in sides):
+            return None
+        join_type = _join_node(self.graph.nodes[join_id]).join_type.lower()
+        for side in PUSHABLE_JOIN_SIDES.get(join_type, ()):
+            other = sides[1 - side]
+            if refs <= set(sides[side].columns) and not refs & set(other.columns):
+                return deps[side]
+        return None
+
+    def push_filters(self):
+        for nid in self.order:
+            node = self.graph.nodes[nid]
+            if node.node_type == '.v1.Filter':
+                self._push_top_level_filter(nid, node)
+            elif node.node_type == '.v1.Container':
+                self._push_container_filters(nid, node)
+
+    def _push_top_level_filter(self, nid: str, node: Node):
+        expr = node.filter_expression or ''
+        refs = field_references(expr) if expr else None
+        if refs is None:
+            return
+        source = self._push_target(self._single_input(nid), refs)
+        if source is not None:
+            self.plan.source_filters.setdefault(source, []).append(expr)
+            self.plan.removed[nid] = f"filter pushed down to {self.graph.nodes[source].name}"
+            return
+        # Not pushable: fold a directly preceding filter into this one instead
+        upstream = self._single_input(nid)
+        upstream_node = self.plan.rewritten.get(upstream, self.graph.nodes.get(upstream)) if upstream else None
+        if (upstream_node and upstream_node.node_type == '.v1.Filter' and upstream not in self.plan.removed
+                and len(self.graph.successors.get(upstream, [])) == 1):
+            merged = replace(self.plan.rewritten.get(nid, node),
+                             filter_expression=f"({upstream_node.filter_expression or ''}) AND ({expr})")
+            self.plan.rewritten[nid] = merged
+            self.plan.removed[upstream] = f"filter merged into {node.name}"
+
+    def _push_container_filters(self, nid: str, node: Node):
+        sub_nodes = node.sub_nodes
+        order = _chain(node)
+        if order is None:
+            # A filter on one branch must not be applied to the others
+            return
+        absorbed = []
+        passed: List[Node] = []
+        for sub_id in order:
+            sub = sub_nodes[sub_id]
+            expr = (sub.filter_expression or '') if sub.node_type == '.v1.Filter' else ''
+            refs = field_references(expr) if expr else None
+            if refs is not None and all(self._transparent(p, refs) for p in passed):
+                source = self._push_target(self._single_input(nid), refs)
+                if source is not None:
+                    self.plan.source_filters.setdefault(source, []).append(expr)
+                    absorbed.append(sub_id)
+                    continue
+            passed.append(sub)
+        if absorbed:
+            # Reconnect the remaining steps so the chain skips the absorbed filters
+            kept = [sub_id for sub_id in order if sub_id not in absorbed]
+            rewired = {}
+            for i, sub_id in enumerate(kept):
+                following = (NextNode(kept[i + 1]),) if i + 1 < len(kept) else ()
+                rewired[sub_id] = replace(sub_nodes[sub_id], next_nodes=following)
+            self.plan.rewritten[nid] = replace(node, sub_nodes=rewired,
+                                               input_node=kept[0] if kept else None,
+                                               output_node=kept[-1] if kept else None)
+
+    def project_columns(self):
+        """Propagate the columns each step needs back to the sources."""
+        needs: Dict[str, Optional[Set[str]]] = {}
+
+        def require(node_id: str, columns: Optional[Set[str]]):
+            if node_id not in needs:
+                needs[node_id] = set() if columns is not ALL else ALL
+            if needs[node_id] is ALL:
+                return
+            if columns is ALL:
+                needs[node_id] = ALL
+            else:
+                needs[node_id] |= columns
+
+        # Outputs, and dead-end steps (still exposed as tables), need everything
+        for nid, node in self.graph.nodes.items():
+            if node.node_type == '.v1.WriteToHyper':
+                for dep in self.graph.predecessors.get(nid, []):
+                    require(dep, ALL)
+            elif not self.graph.successors.get(nid):
+                require(nid, ALL)
+
+        for nid in reversed(self.order):
+            node = self.plan.rewritten.get(nid, self.graph.nodes[nid])
+            needed = needs.get(nid, set())
+            deps = self.graph.dependencies(nid)
+            if nid in self.plan.removed:
+                for dep in deps:
+                    require(dep, needed)
+                continue
+            for dep, columns in zip(deps, self._input_needs(nid, node, needed, deps)):
+                require(dep, columns)
+
+        for nid, node in self.graph.nodes.items():
+            if node.node_type not in SOURCE_TYPES or needs.get(nid) is ALL:
+                continue
+            schema = self.schemas[nid]
+            keep = [c for c in schema.columns if c in needs.get(nid, set())]
+            if schema.complete and schema.columns and len(keep) < len(schema.columns):
+                self.plan.source_columns[nid] = keep
+
+    def _input_needs(self, nid: str, node: Node, needed: Optional[Set[str]], deps: List[str]) -> List[Optional[Set[str]]]:
+        """Columns each input must supply so node can produce `needed`."""
+        node_type = node.node_type
+        if node_type in JOIN_TYPES:
+            join = _join_node(node)
+            keys = [{c.left.strip('[]') for c in join.conditions},
+                    {c.right.strip('[]') for c in join.conditions}]
+            result = []
+            for i, dep in enumerate(deps):
+                side = self.schemas.get(dep, UNKNOWN)
+                if needed is ALL or not side.complete or i >= len(keys):
+                    result.append(ALL)
+                else:
+                    result.append((needed & set(side.columns)) | keys[i])
+            return result
+        if node_type == '.v1.Aggregate':
+            columns = {g.strip('[]') for g in node.group_by}
+            columns |= {a.column.strip('[]') for a in node.aggregations}
+            return [columns for _ in deps]
+        if node_type == '.v1.Union':
+            return [needed for _ in deps]
+        if node_type == '.v1.Container':
+            order = _chain(node)
+            if order is None:
+                return [ALL for _ in deps]
+            for sub_id in reversed(order):
+                needed = self._step_needs(node.sub_nodes[sub_id], needed)
+            return [needed for _ in deps]
+        return [self._step_needs(node, needed) for _ in deps]
+
+    def _step_needs(self, node: Node, needed: Optional[Set[str]]) -> Optional[Set[str]]:
+        """Input columns of a single-input row-wise step."""
+        node_type = node.node_type
+        if needed is ALL:
+            return ALL
+        if node_type == '.v1.Filter':
+            refs = field_references(node.filter_expression or '')
+            return ALL if refs is None else needed | refs
+        if node_type == '.v1.AddColumn':
+            refs = field_references(node.expression or '')
+            return ALL if refs is None else (needed - {node.column_name}) | refs
+        return ALL
+
+
+def plan_pushdown(graph: FlowGraph, order: List[str]) -> PushdownPlan:
+    """Decide which row filters and column projections can move into the LoadExcel/LoadCsv sources.
+
+    order is the scheduled (topological) order of the non-source nodes.
+    """
+    planner = _Planner(graph, order)
+    planner.push_filters()
+    planner.project_columns()
+    return planner.plan
+
+
+# Node attributes that never change what a step computes
+_IDENTITY_SLOTS = ('id', 'name', 'next_nodes')
+_EXPRESSION_SLOTS = ('expression', 'filter_expression')
+# Node.extra keys Prep writes for its own UI and bookkeeping
+_ANNOTATION_KEYS = frozenset(('description', 'beforeActionAnnotations', 'afterActionAnnotations', 'updateTimestamp',
+                              'serialize', 'debugModeRowLimit'))
+# String literals and [field] names are kept verbatim; whitespace and comments outside them are dropped
+_INSIGNIFICANT_RE = re.compile(r"""("(?:[^"]|"")*"|'(?:[^']|'')*'|\[(?:[^\]]|\]\])*\])|\s+|//[^\n]*""")
+
+
+@lru_cache(maxsize=4096)
+def normalize_expression(expr: Optional[str]) -> Optional[str]:
+    """Tableau calculation with whitespace and comments that do not separate tokens removed."""
+    if expr is None:
+        return None
+    return _INSIGNIFICANT_RE.sub(_keep_significant, expr)
+
+
+def _keep_significant(match: re.Match) -> str:
+    if match.group(1):
+        return match.group(1)
+    # A gap between two words (IF x THEN y) still separates tokens
+    text, start, end = match.string, match.start(), match.end()
+    if 0 < start and end < len(text) and (text[start - 1].isalnum() or text[start - 1] == '_') \
+            and (text[end].isalnum() or text[end] == '_'):
+        return ' '
+    return ''
+
+
+def _operation(node: Node) -> tuple:
+    parts = []
+    for slot in _OPERATION_SLOTS:
+        value = getattr(node, slot)
+        if slot == 'sub_nodes':
+            value = _container_operation(node) if value else None
+        elif not value:
+            pass
+        elif slot in _EXPRESSION_SLOTS:
+            value = normalize_expression(value)
+        elif slot == 'action':
+            value = _operation(value)
+        elif slot == 'extra':
+            value = tuple(sorted((key, item) for key, item in value.items() if key not in _ANNOTATION_KEYS))
+        elif isinstance(value, (tuple, list)):
+            value = tuple(astuple(item) if is_dataclass(item) else item for item in value)
+        parts.append(value)
+    return tuple(parts)
+
+
+def _container_operation(node: Node) -> tuple:
+    """A container's sub-steps and wiring with sub-node IDs replaced by their position.
+
+    Two containers running the same steps in the same arrangement compare
+    equal whatever IDs (and names) Prep gave their sub-nodes.
+    """
+    position = {nid: i for i, nid in enumerate(node.sub_nodes)}
+    steps = tuple((_operation(sub), tuple((position.get(nn.node_id, nn.node_id), nn.namespace)
+                                          for nn in sub.next_nodes))
+                  for sub in node.sub_nodes.values())
+    return (steps, tuple(position.get(nid, nid) for nid in node.initial_nodes),
+            position.get(node.input_node, node.input_node), position.get(node.output_node, node.output_node))
+
+
+# Container wiring is compared by position in _container_operation instead
+_WIRING_SLOTS = ('initial_nodes', 'input_node', 'output_node')
+_OPERATION_SLOTS = tuple(slot for slot in Node.__slots__ if slot not in _IDENTITY_SLOTS + _WIRING_SLOTS)
+
+
+class StepIndex:
+    """Steps generated so far, looked up by what they compute.
+
+    A step's identity is its normalized operation plus the (deduplicated)
+    inputs it reads, in port order; two steps with the same identity produce
+    the same table. Steps are bucketed by node type and inputs first, so the
+    operation is only normalized when another step shares both.
+    """
+    __slots__ = ('_buckets',)
+
+    def __init__(self):
+        # (node type, upstream IDs) -> [node ID, node, normalized operation or None until needed]
+        self._buckets: Dict[tuple, List[list]] = {}
+
+    def find(self, node: Node, upstream: List[str]) -> Optional[str]:
+        """ID of an earlier step computing the same table as node, if any."""
+        bucket = self._buckets.get((node.node_type, tuple(upstream)))
+        if not bucket:
+            return None
+        operation = _operation(node)
+        for entry in bucket:
+            if entry[2] is None:
+                entry[2] = _operation(entry[1])
+            if entry[2] == operation:
+                return entry[0]
+        return None
+
+    def add(self, node_id: str, node: Node, upstream: List[str]):
+        self._buckets.setdefault((node.node_type, tuple(upstream)), []).append([node_id, node, None])
@@ -1,13 +1,42 @@
-import magic
 import gzip
-import zipfile
+import json
 import shutil
-import os
+import sys
+import zipfile
+
+ZIP_MAGIC = b'PK\x03\x04'
+GZIP_MAGIC = b'\x1f\x8b'
+FLOW_MEMBER = 'flow'
 
 def detect_file_type(file_path):
-    """Detect the file type using magic library."""
-    file_type = magic.from_file(file_path, mime=True)
-    return file_type
+    """Detect the file type from its leading magic bytes."""
+    with open(file_path, 'rb') as f:
+        head = f.read(len(ZIP_MAGIC))
+    if head.startswith(ZIP_MAGIC):
+        return 'application/zip'
+    if head.startswith(GZIP_MAGIC):
+        return 'application/gzip'
+    return 'application/json'
+
+def _find_flow_member(archive: zipfile.ZipFile) -> str:
+    """Locate the flow document inside a packaged .tfl archive."""
+    for name in archive.namelist():
+        if name.rstrip('/').split('/')[-1] == FLOW_MEMBER:
+            return name
+    raise ValueError(f"No '{FLOW_MEMBER}' document found in archive")
+
+def load_flow(file_path) -> dict:
+    """Load the flow JSON from a .tfl archive or a plain JSON file without extracting to disk."""
+    file_type = detect_file_type(file_path)
+    if 'gzip' in file_type:
+        with gzip.open(file_path, 'rb') as f:
+            return json.load(f)
+    if 'zip' in file_type:
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            with zip_ref.open(_find_flow_member(zip_ref)) as f:
+                return json.load(f)
+    with open(file_path, 'rb') as f:
+        return json.load(f)
 
 def extract_gzip(file_path, output_path):
     """Extract a gzip file."""
@@ -42,6 +71,7 @@ def process_tfl_file(file_path):
     else:
         print("Unknown or proprietary format. Further analysis needed.")
 
-# Example Usage
-tfl_file = r"D:\MScript Testing\MScript Testing\Demo_Analysis.tfl"
-process_tfl_file(tfl_file)
+if __name__ == "__main__":
+    # Example Usage: python parse_tfl.py Demo_Analysis.tfl
+    for tfl_file in sys.argv[1:]:
+        process_tfl_file(tfl_file)
@@ -0,0 +1,94 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple, TypeVar
+
+T = TypeVar('T')
+
+PHASES = ('load', 'schedule', 'sources', 'transformations', 'output', 'write')
+
+
+class ConversionStats:
+    """Phase timings, counters and per-node timings for one conversion.
+
+    Only allocated when profiling is enabled; the converter checks for None
+    before every measurement, so a disabled run pays a single attribute test.
+    """
+    __slots__ = ('phases', 'handler_seconds', 'handler_calls', 'node_seconds',
+                 'dependency_lookups', 'cache_hits', 'cache_misses', 'flow_cache_hit')
+
+    def __init__(self):
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        # Node type -> total handler time / number of calls
+        self.handler_seconds: Dict[str, float] = defaultdict(float)
+        self.handler_calls: Dict[str, int] = defaultdict(int)
+        # Node ID -> (node type, seconds spent generating its code)
+        self.node_seconds: Dict[str, Tuple[str, float]] = {}
+        self.dependency_lookups = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.flow_cache_hit = False
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the time spent inside the block to a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def timed_iter(self, name: str, iterator: Iterator[T]) -> Iterator[T]:
+        """Pass items through, charging only the time spent producing them to a phase."""
+        perf_counter = time.perf_counter
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.phases[name] = self.phases.get(name, 0.0) + perf_counter() - start
+                return
+            self.phases[name] = self.phases.get(name, 0.0) + perf_counter() - start
+            yield item
+
+    def record_node(self, node_id: str, node_type: str, seconds: float):
+        self.node_seconds[node_id] = (node_type, seconds)
+        self.handler_seconds[node_type] += seconds
+        self.handler_calls[node_type] += 1
+
+    def slowest_nodes(self, limit: int = 10) -> List[Tuple[str, str, float]]:
+        ranked = sorted(self.node_seconds.items(), key=lambda item: item[1][1], reverse=True)
+        return [(node_id, node_type, seconds) for node_id, (node_type, seconds) in ranked[:limit]]
+
+    def to_dict(self) -> dict:
+        return {
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'total_seconds': round(sum(self.phases.values()), 6),
+            'handlers': {
+                node_type: {'calls': self.handler_calls[node_type], 'seconds': round(seconds, 6)}
+                for node_type, seconds in sorted(self.handler_seconds.items())
+            },
+            'dependency_lookups': self.dependency_lookups,
+            'cache': {'flow_hit': self.flow_cache_hit, 'hits': self.cache_hits, 'misses': self.cache_misses},
+            'nodes': {
+                node_id: {'type': node_type, 'seconds': round(seconds, 6)}
+                for node_id, (node_type, seconds) in self.node_seconds.items()
+            },
+        }
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self) -> str:
+        """Short human-readable report for --debug."""
+        lines = ["Conversion profile:"]
+        for name, seconds in self.phases.items():
+            lines.append(f"  {name:<16} {seconds * 1000:10.2f} ms")
+        for node_type, seconds in sorted(self.handler_seconds.items(), key=lambda item: -item[1]):
+            lines.append(f"  handler {node_type:<24} {self.handler_calls[node_type]:6d} calls {seconds * 1000:10.2f} ms")
+        lines.append(f"  dependency lookups {self.dependency_lookups}, "
+                     f"cache hits {self.cache_hits}, misses {self.cache_misses}"
+                     + (", whole flow reused from cache" if self.flow_cache_hit else ""))
+        return "\n".join(lines)
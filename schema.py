@@ -0,0 +1,303 @@
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+from flow_graph import container_steps
+from flow_model import Node
+from helpers import tokenize_expression
+from m_ast import ListExpr, Text, Verbatim
+
+# Tableau Prep field types -> M type expressions
+TABLEAU_TYPES = {
+    'integer': 'Int64.Type',
+    'real': 'type number',
+    'string': 'type text',
+    'date': 'type date',
+    'datetime': 'type datetime',
+    'bool': 'type logical',
+    'boolean': 'type logical',
+}
+NUMERIC_TYPES = ('Int64.Type', 'type number')
+
+# Tables known (from statistics) to have at most this many rows are cheap to hold in memory
+SMALL_TABLE_ROWS = 100000
+
+_COMPARISONS = {'=', '==', '!=', '<>', '<', '>', '<=', '>=', '&&', '||', '!', 'AND', 'OR', 'NOT'}
+_FUNCTION_TYPES = {
+    'type text': {'UPPER', 'LOWER', 'TRIM', 'LTRIM', 'RTRIM', 'LEFT', 'RIGHT', 'MID', 'REPLACE', 'STR'},
+    'type logical': {'CONTAINS', 'STARTSWITH', 'ENDSWITH', 'ISNULL'},
+    'Int64.Type': {'LEN', 'FIND', 'INT', 'YEAR', 'QUARTER', 'MONTH', 'WEEK', 'DAY', 'DATEPART', 'DATEDIFF'},
+    'type number': {'FLOAT', 'SQRT', 'POWER', 'EXP', 'LN', 'LOG', 'CEILING', 'FLOOR'},
+    'type date': {'DATE', 'TODAY', 'DATEADD', 'DATETRUNC'},
+    'type datetime': {'DATETIME', 'NOW'},
+}
+# Functions whose result has the type of the given argument
+_PASSTHROUGH_FUNCTIONS = {'ABS': 0, 'ROUND': 0, 'ZN': 0, 'MIN': 0, 'MAX': 0, 'IFNULL': 0, 'IIF': 1}
+
+
+class Schema:
+    """Ordered column -> M type mapping for one table.
+
+    complete is False when the column set cannot be known statically
+    (e.g. after a pivot), so consumers must not assume it is exhaustive.
+    rows (an upper-bound estimate) and sorted_by come from the statistics
+    file, when one is given, and are None / empty when unknown.
+    """
+    __slots__ = ('columns', 'complete', 'rows', 'sorted_by')
+
+    def __init__(self, columns: Optional[Dict[str, str]] = None, complete: bool = True,
+                 rows: Optional[int] = None, sorted_by: Tuple[str, ...] = ()):
+        self.columns: Dict[str, str] = dict(columns or {})
+        self.complete = complete
+        self.rows = rows
+        self.sorted_by = sorted_by
+
+    def type_of(self, column: str) -> str:
+        return self.columns.get(column, 'type any')
+
+    def with_column(self, column: str, m_type: str) -> 'Schema':
+        columns = dict(self.columns)
+        columns[column] = m_type
+        return Schema(columns, self.complete, self.rows, self.sorted_by)
+
+    def select(self, columns: List[str]) -> 'Schema':
+        """Projection onto columns; the sort order survives up to the first dropped column."""
+        sorted_by = []
+        for column in self.sorted_by:
+            if column not in columns:
+                break
+            sorted_by.append(column)
+        return Schema({c: self.type_of(c) for c in columns}, rows=self.rows, sorted_by=tuple(sorted_by))
+
+    def sorted_on(self, keys: Iterable[str]) -> bool:
+        """Whether rows with equal values in keys are known to be adjacent (sorted by them, in any order)."""
+        keys = set(keys)
+        return bool(keys) and set(self.sorted_by[:len(keys)]) == keys
+
+    def m_type_list(self) -> ListExpr:
+        """The column/type list argument of Table.TransformColumnTypes."""
+        return ListExpr([ListExpr([Text(name), Verbatim(m_type)]) for name, m_type in self.columns.items()])
+
+
+UNKNOWN = Schema(complete=False)
+
+
+def source_schema(node: Node) -> Schema:
+    """Build a source schema from a LoadExcel/LoadCsv node's typed `fields`, in ordinal order."""
+    fields = sorted(node.fields, key=lambda f: f.ordinal)
+    return Schema({f.name: TABLEAU_TYPES.get(f.type, 'type any') for f in fields})
+
+
+def load_statistics(path: str) -> Dict[str, dict]:
+    """Read a table statistics file: {"tables": {name: {"rows": int, "sorted_by": [column, ...]}}}.
+
+    Tables are matched to sources by node name, step name or node ID.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cannot read statistics file {path}: {str(e)}")
+    tables = data.get('tables') if isinstance(data, dict) else None
+    if not isinstance(tables, dict):
+        raise ValueError(f"Statistics file {path} must contain a \"tables\" object")
+    statistics = {}
+    for name, entry in tables.items():
+        rows = entry.get('rows') if isinstance(entry, dict) else None
+        sorted_by = entry.get('sorted_by', []) if isinstance(entry, dict) else None
+        if (rows is not None and (not isinstance(rows, int) or rows < 0)) or not isinstance(sorted_by, list):
+            raise ValueError(f"Invalid statistics for table {name} in {path}")
+        statistics[name] = {'rows': rows, 'sorted_by': [str(c) for c in sorted_by]}
+    return statistics
+
+
+def with_statistics(schema: Schema, entry: Optional[dict]) -> Schema:
+    if not entry:
+        return schema
+    return Schema(schema.columns, schema.complete, entry.get('rows'), tuple(entry.get('sorted_by') or ()))
+
+
+def output_schema(node: Node, inputs: List[Schema]) -> Schema:
+    """Propagate input schemas through one node."""
+    node_type = node.node_type
+    first = inputs[0] if inputs else UNKNOWN
+
+    if node_type in ('.v1.Filter',):
+        return first
+    if node_type == '.v1.AddColumn':
+        return first.with_column(node.column_name or '', infer_expression_type(node.expression or '', first))
+    if node_type == '.v1.Container':
+        if not node.sub_nodes:
+            return first
+        graph, order, _, output = container_steps(node)
+        schemas: Dict[str, Schema] = {}
+        for sub_id in order:
+            deps = graph.predecessors.get(sub_id)
+            schemas[sub_id] = output_schema(node.sub_nodes[sub_id], [schemas[d] for d in deps] if deps else [first])
+        return schemas.get(output, first)
+    if node_type == '.v2018_2_3.SuperJoin':
+        return output_schema(node.action, inputs) if node.action is not None else UNKNOWN
+    if node_type == '.v1.SimpleJoin':
+        columns: Dict[str, str] = {}
+        for schema in inputs:
+            for name, m_type in schema.columns.items():
+                columns.setdefault(name, m_type)
+        # Row order after a join is not guaranteed, and a join can multiply rows
+        return Schema(columns, all(s.complete for s in inputs))
+    if node_type == '.v1.Aggregate':
+        groups = [g.strip('[]') for g in node.group_by]
+        columns = {g: first.type_of(g) for g in groups}
+        for agg in node.aggregations:
+            agg_type = agg.aggregation_type.capitalize()
+            column = agg.column.strip('[]')
+            new_name = agg.new_name or f"{column}_{agg_type.lower()}"
+            columns[new_name] = _aggregate_type(agg_type, first.type_of(column))
+        # Groups come out in order of first appearance, so sorted input stays sorted
+        return Schema(columns, rows=first.rows, sorted_by=first.sorted_by[:len(groups)] if first.sorted_on(groups) else ())
+    if node_type == '.v1.Union':
+        columns = {}
+        for schema in inputs:
+            for name, m_type in schema.columns.items():
+                if columns.get(name, m_type) != m_type:
+                    m_type = 'type any'
+                columns[name] = m_type
+        rows = sum(s.rows for s in inputs) if all(s.rows is not None for s in inputs) else None
+        return Schema(columns, all(s.complete for s in inputs), rows)
+    if node_type == '.v1.Pivot':
+        if node.pivot_type == 'columns':
+            return UNKNOWN
+        value_columns = [c.strip('[]') for c in node.value_columns]
+        columns = {n: t for n, t in first.columns.items() if n not in value_columns}
+        columns[node.pivot_column.strip('[]')] = 'type text'
+        columns[node.value_column.strip('[]')] = first.type_of(value_columns[0]) if value_columns else 'type any'
+        return Schema(columns, first.complete)
+    return UNKNOWN
+
+
+def _aggregate_type(agg_type: str, column_type: str) -> str:
+    if agg_type in ('Count', 'Countd'):
+        return 'Int64.Type'
+    if agg_type in ('Sum', 'Min', 'Max'):
+        return column_type if column_type in NUMERIC_TYPES or agg_type != 'Sum' else 'type number'
+    return 'type number'
+
+
+def infer_expression_type(expr: str, schema: Schema) -> str:
+    """Static M type of a Tableau calculation, given the schema of the table it runs on."""
+    try:
+        tokens = tokenize_expression(expr)
+    except ValueError:
+        return 'type any'
+    return _infer(tokens, schema)
+
+
+def _word(token: Tuple[str, str, bool]) -> str:
+    return token[1].upper() if token[0] == 'name' else token[1]
+
+
+def _infer(tokens: list, schema: Schema) -> str:
+    if not tokens:
+        return 'type any'
+    if _word(tokens[0]) in ('IF', 'CASE'):
+        branch = _first_branch(tokens)
+        return _infer(branch, schema) if branch else 'type any'
+
+    operands, operators = _split_operands(tokens)
+    if operators & _COMPARISONS:
+        return 'type logical'
+    types = [_operand_type(op, schema) for op in operands]
+    if len(types) == 1:
+        return types[0]
+    if 'type text' in types:
+        return 'type text'
+    for temporal in ('type datetime', 'type date'):
+        if temporal in types and operators <= {'+', '-'}:
+            return temporal
+    if all(t in NUMERIC_TYPES for t in types):
+        if '/' in operators or 'type number' in types:
+            return 'type number'
+        return 'Int64.Type'
+    return 'type any'
+
+
+def _first_branch(tokens: list) -> list:
+    """Tokens of the first THEN branch of an IF/CASE expression."""
+    depth = 0
+    start = None
+    for i, token in enumerate(tokens[1:], 1):
+        word = _word(token)
+        if word in ('(', 'IF', 'CASE'):
+            depth += 1
+        elif word in (')', 'END'):
+            depth -= 1
+        elif depth == 0 and word == 'THEN' and start is None:
+            start = i + 1
+        elif depth == 0 and start is not None and word in ('ELSEIF', 'ELSE', 'WHEN'):
+            return tokens[start:i]
+    return tokens[start:-1] if start is not None else []
+
+
+def _split_operands(tokens: list):
+    """Split top-level tokens into operand token lists and the set of operators between them."""
+    operands, operators = [], set()
+    current: list = []
+    depth = 0
+    for token in tokens:
+        word = _word(token)
+        if word == '(':
+            depth += 1
+        elif word == ')':
+            depth -= 1
+        if depth == 0 and ((token[0] == 'op' and word not in ('(', ')')) or word in ('AND', 'OR', 'NOT')):
+            operators.add(word)
+            if current:
+                operands.append(current)
+            current = []
+            continue
+        current.append(token)
+    if current:
+        operands.append(current)
+    return operands, operators
+
+
+def _operand_type(tokens: list, schema: Schema) -> str:
+    kind, text, _ = tokens[0]
+    word = _word(tokens[0])
+    if len(tokens) == 1:
+        if kind == 'field':
+            return schema.type_of(text[1:-1].replace(']]', ']'))
+        if kind == 'number':
+            return 'type number' if any(c in text for c in '.eE') else 'Int64.Type'
+        if kind == 'string':
+            return 'type text'
+        if kind == 'date':
+            return 'type datetime' if ':' in text else 'type date'
+        if word in ('TRUE', 'FALSE'):
+            return 'type logical'
+        return 'type any'
+    if word == '(':
+        return _infer(tokens[1:-1], schema)
+    if kind == 'name' and _word(tokens[1]) == '(':
+        for m_type, names in _FUNCTION_TYPES.items():
+            if word in names:
+                return m_type
+        if word in _PASSTHROUGH_FUNCTIONS:
+            args = _split_arguments(tokens[2:-1])
+            index = _PASSTHROUGH_FUNCTIONS[word]
+            return _infer(args[index], schema) if index < len(args) else 'type any'
+    return _infer(tokens, schema) if word in ('IF', 'CASE') else 'type any'
+
+
+def _split_arguments(tokens: list) -> List[list]:
+    args, current, depth = [], [], 0
+    for token in tokens:
+        word = _word(token)
+        if word == '(':
+            depth += 1
+        elif word == ')':
+            depth -= 1
+        elif word == ',' and depth == 0:
+            args.append(current)
+            current = []
+            continue
+        current.append(token)
+    args.append(current)
+    return args
@@ -0,0 +1,39 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+
+def source_node(nid: str, name: str, columns, next_nodes=()) -> dict:
+    """A LoadExcel node reading sheet name with the given columns."""
+    return {
+        'nodeType': '.v1.LoadExcel', 'name': name, 'id': nid, 'connectionId': 'conn-1',
+        'nextNodes': [{'namespace': 'Default', 'nextNodeId': n, 'nextNamespace': 'Default'} for n in next_nodes],
+        'fields': [{'name': c, 'type': 'integer', 'ordinal': i} for i, c in enumerate(columns)],
+        'relation': {'type': 'table', 'table': f"[{name}$]"},
+    }
+
+
+def step_node(nid: str, node_type: str, name: str, next_nodes=(), **attributes) -> dict:
+    return dict(nodeType=node_type, name=name, id=nid, **attributes,
+                nextNodes=[{'namespace': 'Default', 'nextNodeId': n, 'nextNamespace': 'Default'} for n in next_nodes])
+
+
+@pytest.fixture
+def flow_file(tmp_path):
+    """Write a flow document built from nodes and return its path."""
+    def write(nodes, initial=None, name='flow.json'):
+        path = tmp_path / name
+        path.write_text(json.dumps({
+            'initialNodes': initial if initial is not None else [n['id'] for n in nodes if n['nodeType'] == '.v1.LoadExcel'],
+            'nodes': {n['id']: n for n in nodes},
+            'connections': {'conn-1': {'connectionType': '.v1.SqlConnection', 'id': 'conn-1',
+                                       'connectionAttributes': {'filename': 'C:\\data\\Test.xlsx',
+                                                                'class': 'excel-direct'}}},
+        }), encoding='utf-8')
+        return str(path)
+    return write
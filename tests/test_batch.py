@@ -0,0 +1,41 @@
+import os
+
+from conftest import source_node, step_node
+
+from batch import ConversionOptions, collect_inputs, run_batch
+
+
+def test_rerun_skips_own_summary_and_outputs(tmp_path, flow_file):
+    flow_file([
+        source_node('s', 'Sales', ['Key', 'A'], next_nodes=['f']),
+        step_node('f', '.v1.Filter', 'Big', filterExpression='[A] > 1'),
+    ])
+    output_dir = str(tmp_path / 'converted')
+    for _ in range(2):
+        summary = run_batch([str(tmp_path)], output_dir, jobs=1)
+        assert (summary['total'], summary['failed']) == (1, 0)
+
+
+def test_options_reach_every_worker(tmp_path, flow_file):
+    for name in ('a.json', 'b.json'):
+        flow_file([
+            source_node('s', 'Sales', ['Key', 'A'], next_nodes=['f']),
+            step_node('f', '.v1.Filter', 'Big', next_nodes=['o'], filterExpression='[A] > 1'),
+            step_node('o', '.v1.WriteToHyper', 'Out'),
+        ], name=name)
+    output_dir = str(tmp_path / 'converted')
+    options = ConversionOptions(pushdown=True, output_queries=True)
+    summary = run_batch([str(tmp_path)], output_dir, options, jobs=2)
+    assert (summary['total'], summary['failed']) == (2, 0)
+    for result in summary['results']:
+        with open(result['output'], encoding='utf-8') as f:
+            assert '// Big: filter pushed down to Sales' in f.read()
+    assert sorted(os.listdir(output_dir)) == ['a.pq', 'b.pq', 'summary.json']
+
+
+def test_collect_inputs_skips_excluded_paths(tmp_path):
+    (tmp_path / 'out').mkdir()
+    for name in ('a.json', 'report.json', 'out/b.json'):
+        (tmp_path / name).write_text('{}')
+    found = collect_inputs([str(tmp_path)], exclude=[str(tmp_path / 'out'), str(tmp_path / 'report.json')])
+    assert found == [str(tmp_path / 'a.json')]
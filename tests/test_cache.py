@@ -0,0 +1,71 @@
+import pytest
+from conftest import source_node, step_node
+
+from cache import MemoryCache
+from converter import TFLToMConverter
+from handler_registry import REGISTRY
+
+# Settings the first conversion warms the cache with; each case below changes one of them
+BASE = {'pushdown': True, 'output_queries': True, 'merge_steps': True,
+        'statistics': {'Sales': {'rows': 1000000, 'sorted_by': []}}, 'incremental': None}
+
+
+def _flow(flow_file):
+    return flow_file([
+        source_node('s', 'Sales', ['Key', 'A'], next_nodes=['f', 'g']),
+        step_node('f', '.v1.Filter', 'Big', next_nodes=['o'], filterExpression='[A] > 1'),
+        step_node('g', '.v1.Filter', 'Also Big', next_nodes=['p'], filterExpression='[A] > 1'),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+        step_node('p', '.v1.WriteToHyper', 'Out Too'),
+        source_node('c', 'Customers', ['CKey'], next_nodes=['n']),
+        step_node('n', '.v1.Filter', 'Few', next_nodes=['q'], filterExpression='[CKey] < 5'),
+        step_node('q', '.v1.WriteToHyper', 'Customer Out'),
+    ])
+
+
+def _convert(path, cache, settings):
+    converter = TFLToMConverter(path)
+    converter.enable_profiling()
+    converter.enable_pushdown(settings['pushdown'])
+    converter.enable_output_queries(settings['output_queries'])
+    converter.enable_step_merging(settings['merge_steps'])
+    converter.set_statistics(settings['statistics'])
+    converter.enable_incremental_refresh(settings['incremental'])
+    converter.set_cache(cache)
+    return converter.convert(), converter.stats.flow_cache_hit
+
+
+def test_unchanged_settings_hit(flow_file):
+    path = _flow(flow_file)
+    cache = MemoryCache()
+    script, hit = _convert(path, cache, BASE)
+    assert not hit
+    assert _convert(path, cache, BASE) == (script, True)
+
+
+@pytest.mark.parametrize('setting, value', [
+    ('pushdown', False),
+    ('output_queries', False),
+    ('merge_steps', False),
+    ('statistics', {'Sales': {'rows': 10, 'sorted_by': []}}),
+    ('incremental', {'Sales': 'Key'}),
+])
+def test_changed_setting_misses(flow_file, setting, value):
+    path = _flow(flow_file)
+    cache = MemoryCache()
+    changed = dict(BASE, **{setting: value})
+    base_script, _ = _convert(path, cache, BASE)
+    script, hit = _convert(path, cache, changed)
+    assert not hit
+    # Same script as a cold conversion, and not the one cached for the old settings
+    assert script == _convert(path, MemoryCache(), changed)[0]
+    assert script != base_script
+
+
+def test_plugin_change_misses(flow_file, monkeypatch):
+    path = _flow(flow_file)
+    cache = MemoryCache()
+    script, _ = _convert(path, cache, BASE)
+    fingerprint = REGISTRY.fingerprint()
+    monkeypatch.setattr(REGISTRY, 'fingerprint', lambda: fingerprint + [('.v1.Custom', 'my_plugin:handle')])
+    assert _convert(path, cache, BASE) == (script, False)
@@ -0,0 +1,122 @@
+import pytest
+from conftest import step_node
+
+from converter import TFLToMConverter
+from executor import FlowExecutor
+
+pd = pytest.importorskip('pandas')
+
+SALES = 'Key,Region,Amount\n1,East,10\n2,West,20\n3,East,30\n4,North,5\n'
+CUSTOMERS = 'CKey,Name\n1,Ann\n2,Bob\n3,Cid\n'
+
+
+def csv_source(nid: str, name: str, columns, next_nodes=(), namespace='Default') -> dict:
+    """A LoadCsv node reading <name>.csv; columns are (name, Prep type) pairs."""
+    node = step_node(nid, '.v1.LoadCsv', name, next_nodes, connectionId='conn-1',
+                     relation={'type': 'table', 'table': f"[{name.lower()}#csv]"},
+                     fields=[{'name': c, 'type': t, 'ordinal': i} for i, (c, t) in enumerate(columns)])
+    for edge in node['nextNodes']:
+        edge['nextNamespace'] = namespace
+    return node
+
+
+def _sales(next_nodes, namespace='Default'):
+    return csv_source('s', 'Sales', [('Key', 'integer'), ('Region', 'string'), ('Amount', 'integer')],
+                      next_nodes, namespace)
+
+
+def _run(flow_file, tmp_path, nodes, chunk_rows=50000, **files):
+    for name, text in {'sales': SALES, **files}.items():
+        (tmp_path / f"{name}.csv").write_text(text, encoding='utf-8')
+    sources = [n['id'] for n in nodes if n['nodeType'] == '.v1.LoadCsv']
+    converter = TFLToMConverter(flow_file(nodes, initial=sources))
+    return FlowExecutor(converter, str(tmp_path), chunk_rows=chunk_rows).run()['Out']
+
+
+def _rows(table):
+    return [tuple(None if pd.isna(v) else v for v in row) for row in table.itertuples(index=False)]
+
+
+@pytest.mark.parametrize('join_type, expected', [
+    ('inner', [(1, 'East', 10, 1, 'Ann'), (2, 'West', 20, 2, 'Bob'), (3, 'East', 30, 3, 'Cid')]),
+    ('left', [(1, 'East', 10, 1, 'Ann'), (2, 'West', 20, 2, 'Bob'), (3, 'East', 30, 3, 'Cid'),
+              (4, 'North', 5, None, None)]),
+])
+def test_join(flow_file, tmp_path, join_type, expected):
+    table = _run(flow_file, tmp_path, [
+        _sales(['j'], 'Left'),
+        csv_source('c', 'Customers', [('CKey', 'integer'), ('Name', 'string')], ['j'], 'Right'),
+        step_node('j', '.v1.SimpleJoin', 'J', ['o'], joinType=join_type,
+                  conditions=[{'leftExpression': '[Key]', 'rightExpression': '[CKey]', 'comparator': '=='}]),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+    ], customers=CUSTOMERS)
+    assert list(table.columns) == ['Key', 'Region', 'Amount', 'CKey', 'Name']
+    assert _rows(table) == expected
+
+
+def test_aggregate_sum_avg_count(flow_file, tmp_path):
+    table = _run(flow_file, tmp_path, [
+        _sales(['a']),
+        step_node('a', '.v1.Aggregate', 'A', ['o'], groupByFields=['[Region]'], aggregations=[
+            {'column': '[Amount]', 'aggregationType': 'Sum', 'newName': 'Total'},
+            {'column': '[Amount]', 'aggregationType': 'Avg', 'newName': 'Mean'},
+            {'column': '[Amount]', 'aggregationType': 'Count', 'newName': 'Rows'},
+        ]),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+    ])
+    assert list(table.columns) == ['Region', 'Total', 'Mean', 'Rows']
+    assert _rows(table) == [('East', 40, 20.0, 2), ('West', 20, 20.0, 1), ('North', 5, 5.0, 1)]
+
+
+def test_pivot_columns_sums_each_value_into_its_own_column(flow_file, tmp_path):
+    table = _run(flow_file, tmp_path, [
+        csv_source('s', 'Quarters', [('Year', 'integer'), ('Quarter', 'string'), ('Value', 'integer')], ['p']),
+        step_node('p', '.v1.Pivot', 'P', ['o'], pivotType='columns', pivotColumn='[Quarter]', valueColumn='[Value]'),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+    ], quarters='Year,Quarter,Value\n2020,Q1,1\n2020,Q2,2\n2021,Q1,3\n2020,Q1,4\n')
+    assert list(table.columns) == ['Year', 'Q1', 'Q2']
+    assert _rows(table) == [(2020, 5, 2), (2021, 3, None)]
+
+
+def test_pivot_rows_unpivots_each_row_in_place(flow_file, tmp_path):
+    table = _run(flow_file, tmp_path, [
+        csv_source('s', 'Wide', [('Year', 'integer'), ('Q1', 'integer'), ('Q2', 'integer')], ['p']),
+        step_node('p', '.v1.Pivot', 'P', ['o'], pivotType='rows', pivotColumn='[Quarter]', valueColumn='[Value]',
+                  valueColumns=['[Q1]', '[Q2]']),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+    ], wide='Year,Q1,Q2\n2020,1,2\n2021,3,4\n')
+    assert list(table.columns) == ['Year', 'Quarter', 'Value']
+    assert _rows(table) == [(2020, 'Q1', 1), (2020, 'Q2', 2), (2021, 'Q1', 3), (2021, 'Q2', 4)]
+
+
+@pytest.mark.parametrize('expression, keys', [
+    ('[Amount] > 10', [2, 3]),
+    ('[Amount] >= 10 AND [Region] != "West"', [1, 3]),
+    ('[Region] = "North" OR [Key] = 1', [1, 4]),
+    ('NOT ([Region] = "East")', [2, 4]),
+    ('CONTAINS([Region], "st")', [1, 2, 3]),
+    ('IF [Amount] > 15 THEN TRUE ELSE FALSE END', [2, 3]),
+])
+def test_filter(flow_file, tmp_path, expression, keys):
+    table = _run(flow_file, tmp_path, [
+        _sales(['f']),
+        step_node('f', '.v1.Filter', 'F', ['o'], filterExpression=expression),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+    ])
+    assert table['Key'].tolist() == keys
+
+
+def test_chunked_output_matches_unchunked(flow_file, tmp_path):
+    nodes = [
+        _sales(['f']),
+        step_node('f', '.v1.Filter', 'F', ['a'], filterExpression='[Amount] > 0'),
+        step_node('a', '.v1.Aggregate', 'A', ['o'], groupByFields=['[Region]'],
+                  aggregations=[{'column': '[Amount]', 'aggregationType': 'Sum', 'newName': 'Total'}]),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+    ]
+    # Rows repeated across chunk boundaries must still be removed once by the source's Table.Distinct
+    sales = SALES + '1,East,10\n2,West,20\n5,West,\n'
+    whole = _run(flow_file, tmp_path, nodes, sales=sales)
+    for chunk_rows in (1, 2, 3):
+        pd.testing.assert_frame_equal(_run(flow_file, tmp_path, nodes, chunk_rows=chunk_rows, sales=sales), whole)
+    assert _rows(whole) == [('East', 40), ('West', 20), ('North', 5)]
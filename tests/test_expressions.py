@@ -0,0 +1,55 @@
+import re
+
+import pytest
+
+from helpers import translate_expression
+
+
+@pytest.mark.parametrize('expr, expected', [
+    # Operators
+    ('[A] != 1', '[A] <> 1'),
+    ('[A] == 1 && [B] <> 2 || ![C]', '[A] = 1 and [B] <> 2 or not [C]'),
+    ('[A] >= 1 AND NOT [B]', '[A] >= 1 and not [B]'),
+    # Literals and field references
+    ("'it''s'", '"it\'s"'),
+    ("'say \"hi\"'", '"say ""hi"""'),
+    ('"say ""hi"""', '"say ""hi"""'),
+    ('[Order Date] >= #2024-01-31#', '[Order Date] >= #date(2024, 1, 31)'),
+    ('#2024-01-31 08:05#', '#datetime(2024, 1, 31, 8, 5, 0)'),
+    ('[a"b]', '[#"a""b"]'),
+    # + is text concatenation next to a string literal, addition otherwise
+    ('[Name] + " x"', '[Name] & " x"'),
+    ('"a" + [B]', '"a" & [B]'),
+    ('[A] + [B]', '[A] + [B]'),
+    # Conditionals
+    ('IF [A] > 1 THEN "big" ELSEIF [A] > 0 THEN "small" ELSE "none" END',
+     '(if [A] > 1 then "big" else if [A] > 0 then "small" else "none")'),
+    ('IF [A] THEN 1 END', '(if [A] then 1 else null)'),
+    ('CASE [Region] WHEN "East" THEN 1 WHEN "West" THEN 2 ELSE 0 END',
+     '(if [Region] = "East" then 1 else if [Region] = "West" then 2 else 0)'),
+    # Date parts
+    ('DATEPART("month", [D])', 'Date.Month([D])'),
+    ("DATEPART('weekday', [D])", '(Date.DayOfWeek([D]) + 1)'),
+    ('DATETRUNC("quarter", [D])', 'Date.StartOfQuarter([D])'),
+    ('DATEADD("day", 7, [D])', 'Date.AddDays([D], 7)'),
+    # Nested calls
+    ('UPPER(LEFT(TRIM([Name]), ROUND([N] * 2, 0)))',
+     'Text.Upper(Text.Start(Text.Trim([Name]), Number.Round([N] * 2, 0)))'),
+    ('IFNULL(MAX([A], [B]), 0)', '(if List.Max({[A], [B]}) = null then 0 else List.Max({[A], [B]}))'),
+])
+def test_translate_expression(expr, expected):
+    assert translate_expression(expr) == expected
+
+
+@pytest.mark.parametrize('expr, message', [
+    ('[A] % 2', "Unexpected character '%'"),
+    ('DATEPART("fortnight", [D])', 'Unsupported DATEPART part "fortnight"'),
+    ('FOO([A])', 'Unsupported function FOO'),
+    ('LEFT([A])', 'LEFT does not take 1 argument(s)'),
+    ('(1', 'Expected )'),
+    ('1)', "Unbalanced ')'"),
+    ('CASE [A] END', 'CASE without WHEN'),
+])
+def test_untranslatable_expression_is_rejected(expr, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        translate_expression(expr)
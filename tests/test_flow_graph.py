@@ -0,0 +1,74 @@
+from conftest import source_node, step_node
+
+from converter import TFLToMConverter
+from flow_graph import FlowGraph
+from flow_model import parse_flow
+
+
+def _edge(target, namespace):
+    return {'namespace': 'Default', 'nextNodeId': target, 'nextNamespace': namespace}
+
+
+def _graph(nodes):
+    return FlowGraph(parse_flow({'nodes': {n['id']: n for n in nodes}}).nodes)
+
+
+def test_self_join_keeps_both_ports():
+    source = source_node('s', 'Sales', ['Key'])
+    source['nextNodes'] = [_edge('j', 'Right'), _edge('j', 'Left')]
+    graph = _graph([source, {'nodeType': '.v1.SimpleJoin', 'name': 'J', 'id': 'j', 'nextNodes': []}])
+    assert graph.predecessors['j'] == ['s', 's']
+    assert graph.schedule(['j']) == (['j'], [])
+
+
+def test_repeated_edge_to_one_port_counts_once():
+    source = source_node('s', 'Sales', ['Key'])
+    source['nextNodes'] = [_edge('f', 'Default'), _edge('f', 'Default')]
+    graph = _graph([source, {'nodeType': '.v1.Filter', 'name': 'F', 'id': 'f', 'nextNodes': []}])
+    assert graph.predecessors['f'] == ['s']
+
+
+def test_self_join_converts_with_both_inputs(flow_file):
+    source = source_node('s', 'Sales', ['Key', 'A'])
+    source['nextNodes'] = [_edge('j', 'Left'), _edge('j', 'Right')]
+    path = flow_file([source, {
+        'nodeType': '.v1.SimpleJoin', 'name': 'J', 'id': 'j', 'joinType': 'inner',
+        'nextNodes': [_edge('o', 'Default')],
+        'conditions': [{'leftExpression': '[Key]', 'rightExpression': '[A]', 'comparator': '=='}],
+    }, {'nodeType': '.v1.WriteToHyper', 'name': 'Out', 'id': 'o', 'nextNodes': []}])
+    for output_queries in (False, True):
+        converter = TFLToMConverter(path)
+        converter.enable_output_queries(output_queries)
+        converter.enable_pushdown(output_queries)
+        script = converter.convert()
+        assert 'J = Table.Join(\n        Sales,\n        {"Key"},\n        Sales,\n        {"A"},' in script
+
+
+def _steps(edges, ids):
+    """Filter steps wired by (source, target) edges, defined in the order of ids."""
+    return [step_node(nid, '.v1.Filter', nid.upper(), [t for s, t in edges if s == nid]) for nid in ids]
+
+
+def test_schedule_is_kahn_order_with_ties_in_input_order():
+    edges = [('a', 'b'), ('a', 'c'), ('b', 'd'), ('c', 'd')]
+    graph = _graph(_steps(edges, 'abcde'))
+    # a and e are ready first, in the order given; c is released before b for the same reason
+    assert graph.schedule(['d', 'c', 'b', 'a', 'e']) == (['a', 'e', 'c', 'b', 'd'], [])
+    assert graph.schedule(['e', 'a', 'b', 'c', 'd']) == (['e', 'a', 'b', 'c', 'd'], [])
+    assert graph.schedule(['d', 'c', 'b', 'a', 'e']) == graph.schedule(['d', 'c', 'b', 'a', 'e'])
+
+
+def test_three_node_cycle_is_reported_as_one_scc():
+    # w feeds the cycle x -> y -> z -> x; v only reads from it
+    edges = [('w', 'x'), ('x', 'y'), ('y', 'z'), ('z', 'x'), ('z', 'v')]
+    graph = _graph(_steps(edges, 'wxyzv'))
+    order, blocked = graph.schedule('wxyzv')
+    assert (order, blocked) == (['w'], ['x', 'y', 'z', 'v'])
+    members, cycle_edges = zip(*graph.find_cycles(blocked))
+    assert members == (['x', 'y', 'z'],)
+    assert sorted(cycle_edges[0]) == [('x', 'y'), ('y', 'z'), ('z', 'x')]
+
+
+def test_self_loop_is_a_cycle_but_a_chain_is_not():
+    graph = _graph(_steps([('a', 'a'), ('b', 'c')], 'abc'))
+    assert graph.find_cycles('abc') == [(['a'], [('a', 'a')])]
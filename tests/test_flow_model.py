@@ -0,0 +1,18 @@
+from types import MappingProxyType
+
+from flow_model import Node, parse_node
+
+
+def test_node_defaults_are_shared_and_read_only():
+    first, second = Node('a', '.v1.Filter'), Node('b', '.v1.Filter')
+    assert first.sub_nodes == {} and first.extra == {}
+    assert first.sub_nodes is second.sub_nodes and first.extra is second.extra
+    assert isinstance(first.sub_nodes, MappingProxyType) and isinstance(first.extra, MappingProxyType)
+
+
+def test_unmodelled_keys_are_frozen_into_extra():
+    node = parse_node({'id': 'x', 'nodeType': '.acme.Drop', 'name': 'Drop', 'columns': ['A'],
+                       'settings': {'strict': True}})
+    assert node.extra == {'columns': ('A',), 'settings': {'strict': True}}
+    assert isinstance(node.extra['settings'], MappingProxyType)
+    assert 'name' not in node.extra
@@ -0,0 +1,48 @@
+import functools
+
+import pytest
+from conftest import source_node, step_node
+
+from converter import TFLToMConverter
+from handler_registry import REGISTRY
+from node_handlers import FUSED_COLUMN
+
+
+def _container_flow(flow_file):
+    sub_nodes = [
+        step_node('a1', '.v1.AddColumn', 'Add X', next_nodes=['a2'], columnName='X', expression='[A] * 2'),
+        step_node('a2', '.v1.AddColumn', 'Add Y', columnName='Y', expression='[A] * 3'),
+    ]
+    return flow_file([
+        source_node('s', 'Sales', ['Key', 'A'], next_nodes=['c']),
+        step_node('c', '.v1.Container', 'Clean', loomContainer={
+            'initialNodes': ['a1'], 'nodes': {n['id']: n for n in sub_nodes}},
+            namespacesToInput={'Default': {'nodeId': 'a1', 'namespace': 'Default'}},
+            namespacesToOutput={'Default': {'nodeId': 'a2', 'namespace': 'Default'}}),
+    ])
+
+
+@pytest.fixture
+def replace_add_column():
+    original = REGISTRY.get('.v1.AddColumn')
+    yield lambda handler: REGISTRY.register('.v1.AddColumn', handler)
+    REGISTRY.register_lazy('.v1.AddColumn', 'node_handlers:handle_add_column')
+    assert REGISTRY.get('.v1.AddColumn') is original
+
+
+def test_container_adds_are_fused(flow_file):
+    assert FUSED_COLUMN in TFLToMConverter(_container_flow(flow_file)).convert()
+
+
+def test_wrapped_builtin_handler_still_fuses(flow_file, replace_add_column):
+    original = REGISTRY.get('.v1.AddColumn')
+    replace_add_column(functools.wraps(original)(lambda *args: original(*args)))
+    assert FUSED_COLUMN in TFLToMConverter(_container_flow(flow_file)).convert()
+
+
+def test_replacement_handler_is_not_fused_unless_marked(flow_file, replace_add_column):
+    original = REGISTRY.get('.v1.AddColumn')
+    replace_add_column(lambda *args: original(*args))
+    script = TFLToMConverter(_container_flow(flow_file)).convert()
+    assert FUSED_COLUMN not in script
+    assert 'Add_Y = Table.AddColumn(' in script
@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_cli_import_does_not_load_builtin_handlers():
+    # Built-in handlers are registered lazily; importing the CLI must not pull them in
+    code = "import sys, MScriptGenerator; print('node_handlers' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
@@ -0,0 +1,28 @@
+import io
+
+import pytest
+from conftest import source_node, step_node
+
+from converter import TFLToMConverter
+
+
+@pytest.mark.parametrize('mapping, message', [
+    ({'Missing': 'Key'}, 'sources not found'),
+    ({'Sales': 'Nope'}, 'column Nope not found'),
+    ({'Sales': 'Name'}, 'must be a date'),
+])
+def test_bad_mapping_is_rejected_before_output(flow_file, mapping, message):
+    source = source_node('s', 'Sales', ['Key'], next_nodes=['f'])
+    source['fields'].append({'name': 'Name', 'type': 'string', 'ordinal': 1})
+    converter = TFLToMConverter(flow_file([source, step_node('f', '.v1.Filter', 'Big', filterExpression='[Key] > 1')]))
+    converter.enable_incremental_refresh(mapping)
+    out = io.StringIO()
+    with pytest.raises(RuntimeError, match=message):
+        converter.convert_to(out)
+    assert out.getvalue() == ''
+
+
+def test_mapped_source_is_filtered(flow_file):
+    converter = TFLToMConverter(flow_file([source_node('s', 'Sales', ['Key'])]))
+    converter.enable_incremental_refresh({'Sales': 'Key'})
+    assert 'Date.Year(RangeStart) * 10000' in converter.convert()
@@ -0,0 +1,84 @@
+import pytest
+
+from m_ast import (Binding, Call, Comment, Each, Identifier, ListExpr, Raw, Record, RecordType, Shared, Text,
+                   Verbatim, as_statements, emit, text_list)
+
+
+def test_text_doubles_quotes():
+    assert emit(Binding('A', Text('say "hi"'), final=True), 0) == 'A = "say ""hi"""'
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('Sales', 'Sales'),
+    ('Table.Join', 'Table.Join'),
+    ('_Step2', '_Step2'),
+    ('Order Date', '#"Order Date"'),
+    ('2nd', '#"2nd"'),
+    ('each', '#"each"'),
+    ('let', '#"let"'),
+    ('a "b"', '#"a ""b"""'),
+])
+def test_names_are_quoted_when_not_plain_identifiers(name, expected):
+    assert emit(Binding(name, Identifier(name), final=True), 0) == f"{expected} = {expected}"
+
+
+def test_record_field_names_are_quoted():
+    record = RecordType([('Order Date', Verbatim('type date')), ('Key', Verbatim('Int64.Type'))])
+    assert emit(Binding('T', record, final=True), 0) == 'T = type [#"Order Date" = type date, Key = Int64.Type]'
+
+
+def test_inline_items_stay_on_one_line_at_any_depth():
+    call = Call('Table.SelectColumns', [Identifier('Sales'), text_list(['A', 'B'])])
+    assert emit(Binding('S', call), 3) == '            S = Table.SelectColumns(Sales, {"A", "B"}),'
+
+
+def test_broken_items_indent_one_level_below_the_enclosing_line():
+    call = Call('Table.Join', [
+        Identifier('Sales'),
+        text_list(['Key']),
+        Call('Table.Buffer', [Identifier('Customers')]),
+        ListExpr([Text('CKey')], broken=True),
+    ], broken=True)
+    assert emit(Binding('J', call), 2) == (
+        '        J = Table.Join(\n'
+        '            Sales,\n'
+        '            {"Key"},\n'
+        '            Table.Buffer(Customers),\n'
+        '            {\n'
+        '                "CKey"\n'
+        '            }\n'
+        '        ),'
+    )
+
+
+def test_empty_broken_items_stay_inline():
+    assert emit(Binding('E', ListExpr([], broken=True), final=True), 2) == '        E = {}'
+
+
+def test_each_and_record_values():
+    step = Call('Table.AddColumn', [Identifier('T'), Text('Flag'), Each(Record([('x', Verbatim('[A] > 1'))]))])
+    assert emit(Binding('F', step, final=True), 1) == '    F = Table.AddColumn(T, "Flag", each [x = [A] > 1])'
+
+
+def test_final_binding_has_no_trailing_comma():
+    steps = [Binding('A', Identifier('Sales')), Binding('B', Identifier('A'), final=True)]
+    assert emit(steps) == '    A = Sales,\n    B = A'
+
+
+def test_statements_are_indented_to_depth():
+    steps = [Comment('Sources'), Shared('Out', Identifier('Steps')), Binding('My Step', Identifier('X'))]
+    assert emit(steps, 1) == '    // Sources\n    shared Out = Steps;\n    #"My Step" = X,'
+
+
+def test_plain_string_handler_output_is_wrapped_in_raw():
+    statements = as_statements('A = Sales,\n\nB = A,')
+    assert len(statements) == 1 and isinstance(statements[0], Raw)
+    # Every non-empty line is indented to the enclosing depth; blank lines stay blank
+    assert emit('A = Sales,\n\nB = A,', 2) == '        A = Sales,\n\n        B = A,'
+
+
+def test_mixed_handler_output_keeps_order():
+    statements = as_statements([Binding('A', Identifier('Sales')), 'B = A,'])
+    assert [type(s) for s in statements] == [Binding, Raw]
+    assert as_statements(None) == []
+    assert emit([Binding('A', Identifier('Sales')), 'B = A,']) == '    A = Sales,\n    B = A,'
@@ -0,0 +1,29 @@
+import re
+
+import pytest
+
+from converter import TFLToMConverter
+from synthetic_flow import write_flow
+
+_NAME = r'(#"(?:[^"]|"")*"|[A-Za-z_][\w.]*)'
+_BINDING_RE = re.compile(rf'^    {_NAME} = ', re.MULTILINE)
+_FIELD_RE = re.compile(rf'^        {_NAME} = {_NAME},?$', re.MULTILINE)
+
+
+def _record(script: str, name: str) -> str:
+    start = script.index(f'    {name} = [\n')
+    return script[start:script.index('\n    ]', start)]
+
+
+@pytest.mark.parametrize('output_queries, pushdown', [(False, False), (True, False), (True, True)])
+def test_result_records_only_reference_bound_steps(tmp_path, output_queries, pushdown):
+    path = str(tmp_path / 'synthetic.json')
+    write_flow(path, 300)
+    converter = TFLToMConverter(path)
+    converter.enable_output_queries(output_queries)
+    converter.enable_pushdown(pushdown)
+    script = converter.convert()
+    bound = set(_BINDING_RE.findall(script))
+    fields = _FIELD_RE.findall(_record(script, 'Outputs' if output_queries else 'CombinedTables'))
+    assert fields
+    assert [value for _, value in fields if value not in bound] == []
@@ -0,0 +1,49 @@
+import pytest
+from conftest import source_node, step_node
+
+from cache import MemoryCache
+from converter import TFLToMConverter
+from handler_registry import REGISTRY
+from m_ast import Binding, Call, Identifier, text_list
+
+DROP = '.acme.Drop'
+
+
+def handle_drop(node, upstream_tables, upstream_schemas):
+    """Plugin handler for a node type the core model has no attributes for."""
+    return Binding(node.name, Call('Table.RemoveColumns', [Identifier(upstream_tables[0]),
+                                                           text_list(node.extra['columns'])]))
+
+
+@pytest.fixture
+def drop_plugin():
+    # Entry point discovery registers plugins the same way: a lazily imported module:function target
+    REGISTRY.register_lazy(DROP, f"{__name__}:handle_drop")
+    yield
+    REGISTRY._handlers.pop(DROP, None)
+    REGISTRY._lazy.pop(DROP, None)
+
+
+def test_plugin_reads_custom_property(flow_file, drop_plugin):
+    path = flow_file([
+        source_node('s', 'Sales', ['Key', 'A', 'B'], next_nodes=['d']),
+        step_node('d', DROP, 'DropA', columns=['A'], settings={'strict': True}),
+    ])
+    converter = TFLToMConverter(path)
+    node = converter.graph.node('d')
+    assert node.extra['columns'] == ('A',)
+    assert node.extra['settings']['strict'] is True
+    script = converter.convert()
+    assert 'DropA = Table.RemoveColumns(Sales, {"A"}),' in script
+
+
+def test_cached_fragment_follows_custom_property(flow_file, drop_plugin):
+    cache = MemoryCache()
+    for column in ('A', 'B'):
+        path = flow_file([
+            source_node('s', 'Sales', ['Key', 'A', 'B'], next_nodes=['d']),
+            step_node('d', DROP, 'DropA', columns=[column]),
+        ])
+        converter = TFLToMConverter(path)
+        converter.set_cache(cache)
+        assert f'DropA = Table.RemoveColumns(Sales, {{"{column}"}}),' in converter.convert()
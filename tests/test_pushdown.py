@@ -0,0 +1,30 @@
+from conftest import source_node, step_node
+
+from converter import TFLToMConverter
+
+
+def _flow(flow_file):
+    return flow_file([
+        source_node('s', 'Sales', ['Key', 'A', 'B'], next_nodes=['f']),
+        step_node('f', '.v1.Filter', 'Big', next_nodes=['o'], filterExpression='[A] > 1'),
+        step_node('o', '.v1.WriteToHyper', 'Out'),
+    ])
+
+
+def _convert(path, pushdown, output_queries):
+    converter = TFLToMConverter(path)
+    converter.enable_pushdown(pushdown)
+    converter.enable_output_queries(output_queries)
+    return converter.convert()
+
+
+def test_pushdown_leaves_exposed_steps_alone(flow_file):
+    path = _flow(flow_file)
+    assert _convert(path, True, False) == _convert(path, False, False)
+
+
+def test_pushdown_folds_filter_into_source_for_output_queries(flow_file):
+    script = _convert(_flow(flow_file), True, True)
+    assert 'Big = Table.SelectRows(' not in script
+    assert '// Big: filter pushed down to Sales' in script
+    assert 'Out = Sales' in script
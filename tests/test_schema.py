@@ -0,0 +1,94 @@
+import pytest
+
+from flow_model import Aggregation, Node
+from schema import UNKNOWN, Schema, infer_expression_type, output_schema
+
+TYPES = Schema({'I': 'Int64.Type', 'N': 'type number', 'T': 'type text', 'D': 'type date',
+                'DT': 'type datetime', 'B': 'type logical'})
+
+
+@pytest.mark.parametrize('expr, expected', [
+    # Fields and literals
+    ('[I]', 'Int64.Type'),
+    ('[T]', 'type text'),
+    ('[Missing]', 'type any'),
+    ('1', 'Int64.Type'),
+    ('1.5', 'type number'),
+    ('"x"', 'type text'),
+    ('#2024-01-01#', 'type date'),
+    ('#2024-01-01 10:00#', 'type datetime'),
+    ('TRUE', 'type logical'),
+    ('NULL', 'type any'),
+    # Arithmetic
+    ('[I] + 1', 'Int64.Type'),
+    ('[I] * [I]', 'Int64.Type'),
+    ('[I] / 2', 'type number'),
+    ('[I] + [N]', 'type number'),
+    ('([I] + 1)', 'Int64.Type'),
+    ('[T] + "x"', 'type text'),
+    ('[D] + 1', 'type date'),
+    ('[DT] - 1', 'type datetime'),
+    ('[D] * 2', 'type any'),
+    # Comparisons and logic
+    ('[I] > 1', 'type logical'),
+    ('[T] = "a" OR [B]', 'type logical'),
+    ('NOT [B]', 'type logical'),
+    # Functions with a fixed result type, and those returning an argument's type
+    ('UPPER([T])', 'type text'),
+    ('LEN([T])', 'Int64.Type'),
+    ('SQRT([I])', 'type number'),
+    ('CONTAINS([T], "a")', 'type logical'),
+    ('DATETRUNC("month", [D])', 'type date'),
+    ('NOW()', 'type datetime'),
+    ('ABS([N])', 'type number'),
+    ('IFNULL([I], 0)', 'Int64.Type'),
+    ('IIF([B], [T], "x")', 'type text'),
+    ('FOO([I])', 'type any'),
+    # Conditionals take the type of their first branch
+    ('IF [B] THEN [T] ELSE "z" END', 'type text'),
+    ('IF [B] THEN IF [B] THEN 1 END ELSE 2.5 END', 'Int64.Type'),
+    ('CASE [I] WHEN 1 THEN 2.5 END', 'type number'),
+    # Untokenizable input is not an error here; translation reports it
+    ('[I] % 2', 'type any'),
+])
+def test_infer_expression_type(expr, expected):
+    assert infer_expression_type(expr, TYPES) == expected
+
+
+def test_add_column_appends_inferred_type():
+    node = Node('a', '.v1.AddColumn', column_name='Ratio', expression='[I] / [N]')
+    schema = output_schema(node, [Schema({'I': 'Int64.Type', 'N': 'type number'})])
+    assert schema.columns == {'I': 'Int64.Type', 'N': 'type number', 'Ratio': 'type number'}
+
+
+@pytest.mark.parametrize('aggregation, column, expected', [
+    ('Sum', 'I', 'Int64.Type'),
+    ('Sum', 'T', 'type number'),
+    ('Min', 'T', 'type text'),
+    ('Count', 'T', 'Int64.Type'),
+    ('CountD', 'N', 'Int64.Type'),
+    ('Avg', 'I', 'type number'),
+])
+def test_aggregate_result_types(aggregation, column, expected):
+    node = Node('g', '.v1.Aggregate', group_by=('[T]',),
+                aggregations=(Aggregation(f"[{column}]", aggregation, 'Out'),))
+    assert output_schema(node, [TYPES]).columns == {'T': 'type text', 'Out': expected}
+
+
+def test_union_widens_conflicting_types_and_join_keeps_first_side():
+    left = Schema({'K': 'Int64.Type', 'V': 'type text'}, rows=10)
+    right = Schema({'K': 'type number', 'W': 'type date'}, rows=5)
+    union = output_schema(Node('u', '.v1.Union'), [left, right])
+    assert union.columns == {'K': 'type any', 'V': 'type text', 'W': 'type date'}
+    assert union.rows == 15
+    join = output_schema(Node('j', '.v1.SimpleJoin'), [left, right])
+    assert join.columns == {'K': 'Int64.Type', 'V': 'type text', 'W': 'type date'}
+    assert join.rows is None
+
+
+def test_pivot_columns_is_unknown_and_unpivot_is_typed():
+    assert output_schema(Node('p', '.v1.Pivot', pivot_column='[Q]', value_column='[V]'), [TYPES]) is UNKNOWN
+    unpivot = Node('p', '.v1.Pivot', pivot_type='rows', pivot_column='[Q]', value_column='[V]',
+                   value_columns=('[I]', '[N]'))
+    schema = output_schema(unpivot, [Schema({'K': 'type text', 'I': 'Int64.Type', 'N': 'Int64.Type'})])
+    assert schema.columns == {'K': 'type text', 'Q': 'type text', 'V': 'Int64.Type'}
@@ -0,0 +1,64 @@
+import pytest
+from conftest import source_node, step_node
+
+from converter import TFLToMConverter
+from flow_model import Aggregation, Node
+from m_ast import emit
+from node_handlers import handle_aggregate, join_algorithm
+from schema import SMALL_TABLE_ROWS, Schema
+
+SMALL = SMALL_TABLE_ROWS
+LARGE = SMALL_TABLE_ROWS + 1
+
+
+def _table(rows=None, sorted_by=()):
+    return Schema({'K': 'Int64.Type', 'J': 'Int64.Type'}, rows=rows, sorted_by=sorted_by)
+
+
+@pytest.mark.parametrize('left, right, expected', [
+    # No statistics: Power Query chooses
+    (_table(), _table(), None),
+    (_table(LARGE), _table(LARGE), None),
+    # Both sides sorted on their keys merge, whatever their size
+    (_table(LARGE, ('K',)), _table(LARGE, ('K', 'J')), 'SortMerge'),
+    (_table(LARGE, ('J', 'K')), _table(LARGE, ('K',)), None),
+    (_table(SMALL, ('K',)), _table(None), 'LeftHash'),
+    # Otherwise hash the side known to fit SMALL_TABLE_ROWS, the smaller one when both do
+    (_table(LARGE), _table(SMALL), 'RightHash'),
+    (_table(None), _table(SMALL), 'RightHash'),
+    (_table(SMALL), _table(LARGE), 'LeftHash'),
+    (_table(10), _table(10), 'RightHash'),
+    (_table(10), _table(20), 'LeftHash'),
+    (_table(20), _table(10), 'RightHash'),
+])
+def test_join_algorithm_thresholds(left, right, expected):
+    assert join_algorithm(left, right, ['K'], ['K']) == expected
+
+
+@pytest.mark.parametrize('sorted_by, local', [
+    ((), False),
+    (('T',), True),
+    (('T', 'I'), True),
+    (('I', 'T'), False),
+])
+def test_group_kind_local_only_when_sorted_on_the_keys(sorted_by, local):
+    node = Node('g', '.v1.Aggregate', 'G', group_by=('[T]',), aggregations=(Aggregation('[I]', 'Sum', 'Total'),))
+    schema = Schema({'T': 'type text', 'I': 'Int64.Type'}, sorted_by=sorted_by)
+    assert ('GroupKind.Local' in emit(handle_aggregate(node, ['Sales'], [schema]))) == local
+
+
+@pytest.mark.parametrize('rows, readers, buffered', [
+    (SMALL, 2, True),
+    (LARGE, 2, False),
+    (None, 2, False),
+    (SMALL, 1, False),
+])
+def test_small_source_read_twice_is_buffered(flow_file, rows, readers, buffered):
+    filters = ['f', 'g'][:readers]
+    converter = TFLToMConverter(flow_file([
+        source_node('s', 'Sales', ['Key', 'A'], next_nodes=filters),
+        *(step_node(nid, '.v1.Filter', f"Big {nid}", filterExpression='[A] > 1') for nid in filters),
+    ]))
+    if rows is not None:
+        converter.set_statistics({'Sales': {'rows': rows, 'sorted_by': []}})
+    assert ('Sales = Table.Buffer(PrepareTable(' in converter.convert()) == buffered
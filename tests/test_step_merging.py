@@ -0,0 +1,118 @@
+import pytest
+from conftest import source_node, step_node
+
+from converter import TFLToMConverter
+from handler_registry import REGISTRY
+from m_ast import Binding, Call, Identifier, text_list
+
+DROP = '.acme.Drop'
+
+
+def handle_drop(node, upstream_tables, upstream_schemas):
+    return Binding(node.name, Call('Table.RemoveColumns', [Identifier(upstream_tables[0]),
+                                                           text_list(node.extra['columns'])]))
+
+
+@pytest.fixture
+def drop_plugin():
+    yield lambda handler: REGISTRY.register(DROP, handler)
+    REGISTRY._handlers.pop(DROP, None)
+
+
+def _two_drops(flow_file, first, second):
+    return TFLToMConverter(flow_file([
+        source_node('s', 'Sales', ['Key', 'A', 'B'], next_nodes=['a', 'b']),
+        step_node('a', DROP, 'DropA', columns=first),
+        step_node('b', DROP, 'DropB', columns=second),
+    ])).convert()
+
+
+def _two_filters(flow_file):
+    return TFLToMConverter(flow_file([
+        source_node('s', 'Sales', ['Key', 'A'], next_nodes=['f1', 'f2']),
+        step_node('f1', '.v1.Filter', 'F1', filterExpression='[A] > 1'),
+        step_node('f2', '.v1.Filter', 'F2', filterExpression='[A]>1'),
+    ]))
+
+
+def test_identical_filters_share_a_binding(flow_file):
+    script = _two_filters(flow_file).convert()
+    assert '// F2: same as F1' in script
+    # The merged step is still listed under its own name
+    assert '        F1 = F1,\n        F2 = F1\n' in script
+
+
+def test_step_merging_can_be_turned_off(flow_file):
+    converter = _two_filters(flow_file)
+    converter.enable_step_merging(False)
+    script = converter.convert()
+    assert 'same as' not in script
+    assert 'F2 = Table.SelectRows(' in script
+    assert '        F2 = F2\n' in script
+
+
+def test_pure_plugin_steps_differing_in_custom_properties_are_kept(flow_file, drop_plugin):
+    def pure_drop(node, upstream_tables, upstream_schemas):
+        return handle_drop(node, upstream_tables, upstream_schemas)
+    pure_drop.pure = True
+    drop_plugin(pure_drop)
+    script = _two_drops(flow_file, ['A'], ['B'])
+    assert 'DropB = Table.RemoveColumns(Sales, {"B"}),' in script
+    assert 'same as' not in script
+    assert 'same as DropA' in _two_drops(flow_file, ['A'], ['A'])
+
+
+def test_plugin_steps_are_not_merged_unless_pure(flow_file, drop_plugin):
+    drop_plugin(handle_drop)
+    script = _two_drops(flow_file, ['A'], ['A'])
+    assert 'DropB = Table.RemoveColumns(Sales, {"A"}),' in script
+    assert 'same as' not in script
+
+
+def _two_sources(flow_file, merge_steps):
+    converter = TFLToMConverter(flow_file([source_node('a', 'A', ['Key']), source_node('b', 'B', ['Key'])]))
+    for node_id in ('a', 'b'):
+        # Both sources read the same sheet
+        converter.flow.nodes[node_id].relation_table = '[Sales$]'
+    converter.enable_step_merging(merge_steps)
+    return converter.convert()
+
+
+def test_identical_sources_share_a_load(flow_file):
+    assert '// B: same as A' in _two_sources(flow_file, True)
+
+
+def test_identical_sources_stay_separate_without_merging(flow_file):
+    script = _two_sources(flow_file, False)
+    assert 'same as' not in script
+    assert script.count('GetSheet(Workbook_Test, "Sales", "Sheet")') == 2
+
+
+def _container(nid, name, prefix, factor=2):
+    first, second = f"{prefix}1", f"{prefix}2"
+    sub_nodes = [
+        step_node(first, '.v1.AddColumn', f"{name} X", next_nodes=[second], columnName='X', expression='[A] * 2'),
+        step_node(second, '.v1.AddColumn', f"{name} Y", columnName='Y', expression=f'[X] * {factor}'),
+    ]
+    return step_node(nid, '.v1.Container', name, loomContainer={
+        'initialNodes': [first], 'nodes': {n['id']: n for n in sub_nodes}},
+        namespacesToInput={'Default': {'nodeId': first, 'namespace': 'Default'}},
+        namespacesToOutput={'Default': {'nodeId': second, 'namespace': 'Default'}})
+
+
+def test_containers_with_different_sub_node_ids_share_a_binding(flow_file):
+    script = TFLToMConverter(flow_file([
+        source_node('s', 'Sales', ['Key', 'A'], next_nodes=['c1', 'c2']),
+        _container('c1', 'Clean', 'p'),
+        _container('c2', 'Tidy', 'q'),
+    ])).convert()
+    assert '// Tidy: same as Clean' in script
+
+
+def test_containers_computing_different_columns_are_kept(flow_file):
+    script = TFLToMConverter(flow_file([
+        source_node('s', 'Sales', ['Key', 'A'], next_nodes=['c1', 'c2']),
+        _container('c1', 'Clean', 'p'),
+        _container('c2', 'Tidy', 'q', factor=3),
+    ])).convert()
+    assert 'same as' not in script
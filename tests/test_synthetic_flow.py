@@ -0,0 +1,10 @@
+import pytest
+
+from flow_model import parse_flow
+from synthetic_flow import generate_flow
+from validation import check_flow
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_generated_flows_are_valid(seed):
+    assert check_flow(parse_flow(generate_flow(300, seed))) == []
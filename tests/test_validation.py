@@ -0,0 +1,88 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from conftest import source_node, step_node
+
+from validation import check_files
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUT = step_node('o', '.v1.WriteToHyper', 'Out')
+
+
+def _filter(nid, name, next_nodes=('o',), expression='[A] > 1'):
+    return step_node(nid, '.v1.Filter', name, next_nodes, filterExpression=expression)
+
+
+def _union(nid, name, next_nodes):
+    return step_node(nid, '.v1.Union', name, next_nodes)
+
+
+# One minimal flow per diagnostic code: (code, node the diagnostic names, message fragment, nodes)
+FLOWS = [
+    ('dangling-edge', 's', 'nextNodeId nowhere',
+     [source_node('s', 'Sales', ['A'], ['f', 'nowhere']), _filter('f', 'Big'), OUT]),
+    ('unsupported-node', 'm', 'No handler for node type .v1.Mystery',
+     [source_node('s', 'Sales', ['A'], ['m']), step_node('m', '.v1.Mystery', 'Odd', ['o']), OUT]),
+    ('input-arity', 'j', 'needs exactly 2 input(s), got 1',
+     [source_node('s', 'Sales', ['A'], ['j']), OUT,
+      step_node('j', '.v1.SimpleJoin', 'J', ['o'], conditions=[{'leftExpression': '[A]', 'rightExpression': '[A]'}])]),
+    ('missing-property', 'f', 'Filter has no filterExpression',
+     [source_node('s', 'Sales', ['A'], ['f']), step_node('f', '.v1.Filter', 'Big', ['o']), OUT]),
+    ('invalid-expression', 'f', "Unexpected character '%'",
+     [source_node('s', 'Sales', ['A'], ['f']), _filter('f', 'Big', expression='[A] % 2 = 0'), OUT]),
+    ('duplicate-name', 'g', 'Steps share the M name Big_Rows: Big Rows (f), Big-Rows (g)',
+     [source_node('s', 'Sales', ['A'], ['f']), _filter('f', 'Big Rows', ['g']), _filter('g', 'Big-Rows'), OUT]),
+    ('reserved-name', 'f', 'M name GetSheet is already used',
+     [source_node('s', 'Sales', ['A'], ['f']), _filter('f', 'GetSheet'), OUT]),
+    ('cycle', 'u', 'Circular dependency between nodes: U (u), V (v)',
+     [source_node('s', 'Sales', ['A'], ['u', 'v']), _union('u', 'U', ['v', 'o']), _union('v', 'V', ['u']), OUT]),
+]
+
+
+def _check(paths):
+    out = io.StringIO()
+    totals = check_files(paths, out, jobs=1)
+    return [json.loads(line) for line in out.getvalue().splitlines()], totals
+
+
+@pytest.mark.parametrize('code, node_id, message, nodes', FLOWS, ids=[f[0] for f in FLOWS])
+def test_each_code_has_a_minimal_flow(flow_file, code, node_id, message, nodes):
+    path = flow_file(nodes)
+    lines, totals = _check([path])
+    assert [line['code'] for line in lines] == [code]
+    line = lines[0]
+    assert line['file'] == path
+    assert line['severity'] == 'error'
+    assert line['node_id'] == node_id
+    assert message in line['message']
+    assert set(line) == {'file', 'severity', 'code', 'message', 'node_id', 'node_name'}
+    assert (totals['errors'], totals['warnings'], totals['failed_flows']) == (1, 0, 1)
+
+
+def test_clean_flow_reports_nothing(flow_file):
+    lines, totals = _check([flow_file([source_node('s', 'Sales', ['A'], ['f']), _filter('f', 'Big'), OUT])])
+    assert lines == []
+    assert totals['errors'] == totals['warnings'] == 0
+
+
+def _run_check(*paths):
+    return subprocess.run([sys.executable, os.path.join(REPO, 'MScriptGenerator.py'), '--check', *paths],
+                          cwd=REPO, capture_output=True, text=True)
+
+
+def test_check_exits_1_only_when_there_are_errors(flow_file):
+    clean = flow_file([source_node('s', 'Sales', ['A'], ['f']), _filter('f', 'Big'), OUT], name='clean.json')
+    result = _run_check(clean)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == ''
+
+    _, _, _, nodes = FLOWS[0]
+    broken = flow_file(nodes, name='broken.json')
+    result = _run_check(clean, broken)
+    assert result.returncode == 1
+    assert [json.loads(line)['code'] for line in result.stdout.splitlines()] == ['dangling-edge']
+    assert '1 errors' in result.stderr
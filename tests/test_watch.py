@@ -0,0 +1,19 @@
+import io
+
+from conftest import source_node
+
+from watch import single_job, watch
+
+
+def _watch(path, output, **options):
+    log = io.StringIO()
+    watch(single_job(path, output), interval=0, log=log, max_polls=1, **options)
+    return log.getvalue()
+
+
+def test_no_cache_converts_without_reusing_fragments(tmp_path, flow_file):
+    path = flow_file([source_node('s', 'Sales', ['Key'])])
+    output = str(tmp_path / 'out.pq')
+    assert '(no cache,' in _watch(path, output, use_cache=False)
+    assert 'Sales = PrepareTable(' in open(output, encoding='utf-8').read()
+    assert '(0 steps regenerated, 0 reused,' in _watch(path, output)
@@ -0,0 +1,221 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Mapping, Optional, TextIO
+
+from flow_graph import FlowGraph, container_steps
+from flow_model import CONTAINER, SOURCE_TYPES, SUPER_JOIN, WRITE_TO_HYPER, Flow, Node, parse_flow
+from handler_registry import REGISTRY
+from helpers import sanitize_name, translate_expression
+from parse_tfl import load_flow
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Inputs each built-in step type takes: (minimum, maximum or None for no limit)
+INPUT_ARITY = {
+    '.v1.SimpleJoin': (2, 2),
+    SUPER_JOIN: (2, 2),
+    '.v1.Union': (2, None),
+    '.v1.AddColumn': (1, 1),
+    '.v1.Filter': (1, 1),
+    '.v1.Aggregate': (1, 1),
+    '.v1.Pivot': (1, 1),
+    CONTAINER: (1, 1),
+    WRITE_TO_HYPER: (1, 1),
+}
+
+# Bindings the generated script defines itself; a step with one of these names would clash
+RESERVED_NAMES = ('GetSheet', 'PrepareTable', 'CombinedTables', 'SelectedSheetName', 'SelectedSheets',
+                  'GetSelectedTable', 'Steps', 'Outputs', 'RangeStart', 'RangeEnd')
+
+
+@dataclass(slots=True)
+class Diagnostic:
+    """One problem found in a flow; code is a stable identifier such as 'dangling-edge'."""
+    severity: str
+    code: str
+    message: str
+    node_id: Optional[str] = None
+    node_name: Optional[str] = None
+
+
+class _Checker:
+    """Single pass over every node (container sub-nodes included), indexed by a FlowGraph."""
+
+    def __init__(self, flow: Flow):
+        self.flow = flow
+        self.graph = FlowGraph(flow.nodes)
+        self.diagnostics: List[Diagnostic] = []
+        # Sanitized binding name -> node IDs that would be emitted under it
+        self.names: Dict[str, List[str]] = {}
+
+    def report(self, severity: str, code: str, message: str, node: Optional[Node] = None):
+        self.diagnostics.append(Diagnostic(severity, code, message, node.id if node else None,
+                                           node.name if node else None))
+
+    def run(self) -> List[Diagnostic]:
+        for nid in self.flow.initial_nodes:
+            if nid not in self.flow.nodes:
+                self.report(ERROR, 'missing-node', f"Initial node {nid} is not defined in the flow")
+        self._check_level(self.flow.nodes, None)
+        self._check_names()
+        self._check_cycles()
+        return self.diagnostics
+
+    def _check_level(self, nodes: Mapping[str, Node], container: Optional[Node]):
+        for nid, node in nodes.items():
+            for edge in node.next_nodes:
+                if edge.node_id not in nodes and edge.node_id not in self.flow.nodes:
+                    self.report(ERROR, 'dangling-edge', f"nextNodeId {edge.node_id} does not match any node", node)
+            if node.node_type != WRITE_TO_HYPER:
+                if not node.name:
+                    self.report(WARNING, 'missing-name', "Step has no name", node)
+                self.names.setdefault(sanitize_name(node.name or f"Transform_{nid}"), []).append(nid)
+            if node.node_type in SOURCE_TYPES:
+                if node.connection_id is not None and node.connection_id not in self.flow.connections:
+                    self.report(WARNING, 'missing-connection',
+                                f"Connection {node.connection_id} is not defined; the main workbook is assumed", node)
+                continue
+            if node.node_type != WRITE_TO_HYPER and node.node_type not in REGISTRY:
+                self.report(ERROR, 'unsupported-node', f"No handler for node type {node.node_type}", node)
+                continue
+            self._check_inputs(nid, node, nodes, container)
+            self._check_properties(node)
+            if node.node_type == CONTAINER:
+                self._check_container(node)
+
+    def _check_inputs(self, nid: str, node: Node, nodes: Mapping[str, Node], container: Optional[Node]):
+        arity = INPUT_ARITY.get(node.node_type)
+        if arity is None:
+            return
+        inputs = [dep for dep in self.graph.predecessors.get(nid, []) if dep in nodes]
+        if container is not None and not inputs:
+            # Entry steps of a container read the container's input
+            inputs = [container.id]
+        low, high = arity
+        if len(inputs) < low or (high is not None and len(inputs) > high):
+            expected = f"exactly {low}" if low == high else f"at least {low}"
+            self.report(ERROR, 'input-arity', f"{node.node_type} needs {expected} input(s), got {len(inputs)}", node)
+
+    def _check_properties(self, node: Node):
+        node_type = node.node_type
+        if node_type == SUPER_JOIN:
+            if node.action is None:
+                self.report(ERROR, 'missing-property', "SuperJoin has no actionNode", node)
+            elif not node.action.conditions:
+                self.report(ERROR, 'missing-property', "Join has no conditions", node)
+        elif node_type == '.v1.SimpleJoin':
+            if not node.conditions:
+                self.report(ERROR, 'missing-property', "Join has no conditions", node)
+        elif node_type == '.v1.AddColumn':
+            if node.column_name is None or node.expression is None:
+                self.report(ERROR, 'missing-property', "AddColumn needs columnName and expression", node)
+            else:
+                self._check_expression(node.expression, node)
+        elif node_type == '.v1.Filter':
+            if not node.filter_expression:
+                self.report(ERROR, 'missing-property', "Filter has no filterExpression", node)
+            else:
+                self._check_expression(node.filter_expression, node)
+        elif node_type == '.v1.Aggregate':
+            if not node.group_by and not node.aggregations:
+                self.report(ERROR, 'missing-property', "Aggregate needs groupByFields or aggregations", node)
+        elif node_type == '.v1.Pivot':
+            if not node.pivot_column or not node.value_column:
+                self.report(ERROR, 'missing-property', "Pivot needs pivotColumn and valueColumn", node)
+            elif node.pivot_type != 'columns' and not node.value_columns:
+                self.report(WARNING, 'missing-property', "Unpivot has no valueColumns", node)
+
+    def _check_expression(self, expr: str, node: Node):
+        # Translation is memoized and is the step that rejects unsupported functions
+        try:
+            translate_expression(expr)
+        except ValueError as e:
+            self.report(ERROR, 'invalid-expression', str(e), node)
+
+    def _check_container(self, node: Node):
+        sub_nodes = node.sub_nodes
+        for label, port in (('namespacesToInput', node.input_node), ('namespacesToOutput', node.output_node)):
+            if port is not None and port not in sub_nodes:
+                self.report(ERROR, 'missing-node', f"Container {label} names unknown sub-node {port}", node)
+        for nid in node.initial_nodes:
+            if nid not in sub_nodes:
+                self.report(WARNING, 'missing-node', f"Container initial node {nid} is not one of its sub-nodes", node)
+        if sub_nodes:
+            _, _, blocked, _ = container_steps(node)
+            if blocked:
+                names = ', '.join(sub_nodes[nid].name or nid for nid in blocked)
+                self.report(ERROR, 'cycle', f"Circular dependency inside container: {names}", node)
+        self._check_level(sub_nodes, node)
+
+    def _check_names(self):
+        for name, node_ids in self.names.items():
+            if len(node_ids) > 1:
+                labels = ', '.join(f"{self.graph.node(nid).name} ({nid})" for nid in node_ids)
+                self.report(ERROR, 'duplicate-name', f"Steps share the M name {name}: {labels}",
+                            self.graph.node(node_ids[-1]))
+            if name in RESERVED_NAMES:
+                for nid in node_ids:
+                    self.report(ERROR, 'reserved-name', f"M name {name} is already used by the generated script",
+                                self.graph.node(nid))
+
+    def _check_cycles(self):
+        nodes = self.flow.nodes
+        pending = [nid for nid, node in nodes.items() if node.node_type not in SOURCE_TYPES + (WRITE_TO_HYPER,)]
+        _, blocked = self.graph.schedule(pending)
+        for members, _ in self.graph.find_cycles(blocked):
+            labels = ', '.join(f"{nodes[m].name or 'Unnamed'} ({m})" for m in members)
+            self.report(ERROR, 'cycle', f"Circular dependency between nodes: {labels}", nodes[members[0]])
+
+
+def check_flow(flow: Flow) -> List[Diagnostic]:
+    """Structural problems in a parsed flow, found without generating any M.
+
+    Covers dangling nextNodeIds, unsupported node types, input counts (join
+    arity), missing or untranslatable expressions, cycles and steps whose
+    sanitized names collide.
+    """
+    return _Checker(flow).run()
+
+
+def check_file(path: str) -> List[Diagnostic]:
+    """check_flow for a .tfl/.json file; an unreadable file is reported as one 'invalid-flow' error."""
+    try:
+        flow = parse_flow(load_flow(path))
+    except Exception as e:
+        return [Diagnostic(ERROR, 'invalid-flow', f"{type(e).__name__}: {str(e)}")]
+    return check_flow(flow)
+
+
+def _check_task(path: str) -> List[dict]:
+    """Process-pool worker: diagnostics for one file as plain dicts."""
+    return [dict(file=path, **asdict(d)) for d in check_file(path)]
+
+
+def check_files(inputs: List[str], out: TextIO, jobs: Optional[int] = None) -> dict:
+    """Check every input, writing one JSON object per diagnostic to out; returns totals."""
+    started = time.perf_counter()
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(inputs) <= 1:
+        results = map(_check_task, inputs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(_check_task, inputs, chunksize=max(1, len(inputs) // (jobs * 4)))
+    totals = {'flows': len(inputs), 'errors': 0, 'warnings': 0, 'failed_flows': 0}
+    try:
+        for diagnostics in results:
+            errors = sum(1 for d in diagnostics if d['severity'] == ERROR)
+            totals['errors'] += errors
+            totals['warnings'] += len(diagnostics) - errors
+            totals['failed_flows'] += errors > 0
+            for d in diagnostics:
+                out.write(json.dumps(d) + '\n')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    totals['seconds'] = round(time.perf_counter() - started, 4)
+    return totals
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+from batch import ConversionOptions, collect_inputs, convert_file, plan_outputs
+from cache import ConversionCache, MemoryCache
+
+POLL_INTERVAL_SECONDS = 1.0
+
+Signature = Optional[Tuple[int, int]]
+
+
+def _signature(path: str) -> Signature:
+    """Modification time and size of path, or None if it cannot be read right now."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def single_job(input_path: str, output_path: str) -> Callable[[], Dict[str, str]]:
+    return lambda: {input_path: output_path}
+
+
+def batch_jobs(patterns: List[str], output_dir: str) -> Callable[[], Dict[str, str]]:
+    """Re-expand the patterns on every poll so new flows are picked up."""
+    def jobs() -> Dict[str, str]:
+        return plan_outputs(collect_inputs(patterns, exclude=(output_dir,)), output_dir)
+    return jobs
+
+
+def watch(jobs: Callable[[], Dict[str, str]], options: Optional[ConversionOptions] = None,
+          cache_dir: Optional[str] = None, use_cache: bool = True, interval: float = POLL_INTERVAL_SECONDS,
+          log: TextIO = sys.stderr, max_polls: Optional[int] = None):
+    """Poll the input flows and reconvert each one after it changes, until interrupted.
+
+    One cache is kept for the whole session (on disk when cache_dir is set,
+    in memory otherwise), so a save that touches a few steps only regenerates
+    those steps and the ones downstream of them; with use_cache=False every
+    change is converted from scratch. A change is converted once the file has
+    stayed the same for one poll, so half-written saves are skipped.
+    """
+    options = options or ConversionOptions()
+    cache = None
+    if use_cache:
+        cache = ConversionCache(cache_dir) if cache_dir else MemoryCache()
+    converted: Dict[str, Signature] = {}
+    pending: Dict[str, Signature] = {}
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        polls += 1
+        for input_path, output_path in jobs().items():
+            signature = _signature(input_path)
+            if signature is None or signature == converted.get(input_path):
+                pending.pop(input_path, None)
+                continue
+            if pending.get(input_path) != signature:
+                # First sighting of this version, or still being written: wait for it to settle
+                pending[input_path] = signature
+                if input_path in converted:
+                    continue
+            pending.pop(input_path, None)
+            converted[input_path] = signature
+            _convert(input_path, output_path, options, cache, log)
+        if max_polls is None or polls < max_polls:
+            time.sleep(interval)
+
+
+def _convert(input_path: str, output_path: str, options: ConversionOptions, cache: Optional[ConversionCache],
+             log: TextIO):
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    started = time.perf_counter()
+    stamp = time.strftime('%H:%M:%S')
+    try:
+        convert_file(input_path, output_path, options, cache=cache)
+    except Exception as e:
+        print(f"[{stamp}] Error converting {input_path}: {str(e)}", file=log)
+        return
+    if cache is None:
+        detail = "no cache"
+    else:
+        reused, missed = cache.hits - hits, cache.misses - misses
+        # The first miss is the whole-flow lookup; the rest are steps generated afresh
+        detail = f"{missed - 1} steps regenerated, {reused} reused" if missed else "flow unchanged"
+    print(f"[{stamp}] {input_path} -> {output_path} ({detail}, {time.perf_counter() - started:.2f}s)",
+          file=log, flush=True)